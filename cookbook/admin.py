@@ -1,8 +1,36 @@
 from django.contrib import admin
-from .models import Recipe, Ingredient, Rating
+from .models import Recipe, RecipeIngredient, Ingredient, Rating
 
 # Register your models here.
 
-admin.site.register(Recipe)
+
+class RecipeIngredientInline(admin.TabularInline):
+    model = RecipeIngredient
+    fields = ["ingredient"]
+    extra = 1
+
+
+class RecipeAdmin(admin.ModelAdmin):
+    inlines = [RecipeIngredientInline]
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not RecipeIngredient:
+            return super().save_formset(request, form, formset, change)
+
+        # Through the m2m manager rather than the link rows, so that the m2m
+        # signals keep the counts and the similarity index current. Not
+        # committed, the formset only records its changes for the admin log.
+        formset.save(commit=False)
+        form.instance.ingredients.set(
+            [
+                link_form.cleaned_data["ingredient"]
+                for link_form in formset.forms
+                if link_form.cleaned_data.get("ingredient")
+                and not link_form.cleaned_data.get("DELETE")
+            ]
+        )
+
+
+admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient)
 admin.site.register(Rating)
@@ -0,0 +1,103 @@
+"""
+JWT authentication serving users from a small in-process cache.
+
+simplejwt's ``JWTAuthentication`` loads the user row on every request. The
+views need a real ``User`` (recipes and ratings reference it), so the token
+claims alone won't do; instead users are kept for ``TTL`` seconds in a bounded
+LRU cache. Saving or deleting a user drops its entry (see cookbook/signals.py),
+which covers deactivation; bulk updates and other processes' writes are only
+picked up once the entry expires.
+
+Async views authenticate with ``aauthenticate``, which reads the cache on the
+event loop and only hands a worker thread the lookup of uncached users.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    def __init__(self, ttl=60, max_size=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if self.clock() >= expires_at:
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+        # Requests get their own copy, free to change it.
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (self.clock() + self.ttl, copy.copy(user))
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+_config = getattr(settings, "JWT_USER_CACHE", {})
+user_cache = UserCache(
+    ttl=_config.get("TTL", 60), max_size=_config.get("MAX_SIZE", 10000)
+)
+
+
+def invalidate_user(user):
+    user_cache.invalidate(getattr(user, api_settings.USER_ID_FIELD))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` looking users up in ``user_cache`` first.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(user_id) if user_id is not None else None
+        if user is None:
+            # Raises for unknown and inactive users, which are never cached.
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        Async ``authenticate``, raising the same errors.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(user_id) if user_id is not None else None
+        if user is None:
+            user = await sync_to_async(self.get_user)(validated_token)
+        return user, validated_token
@@ -0,0 +1,181 @@
+"""
+Ingredient autocomplete from an in-process prefix index.
+
+Every ingredient name is indexed at the start of each of its words, case and
+accents folded, in one sorted list: the ingredients whose name or one of its
+words starts with a prefix are a contiguous range of it, found by bisection.
+So "pep" finds "black pepper". Matches are ranked by popularity, the number of
+recipes using the ingredient, and the results of each prefix are memoized
+until the index changes.
+
+The index is built on the first query and rebuilt on the first query after
+``MAX_AGE`` seconds. Ingredients saved or deleted in this process are applied
+once their transaction commits; recipe counts change through bulk updates,
+so popularity, like other processes' writes, is picked up by the rebuilds.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from heapq import nsmallest
+
+from django.conf import settings
+from django.db import transaction
+
+from cookbook.models import Ingredient
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Prefixes whose results are memoized, beyond which the memo starts over.
+MAX_MEMOIZED = 10000
+
+
+def fold(text):
+    """
+    Lowercase ``text`` and strip its accents.
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _word_starts(name):
+    folded = fold(name)
+    return {folded[match.start() :] for match in WORD_RE.finditer(folded)}
+
+
+class PrefixIndex:
+    """
+    Sorted index of ingredient names by word start. Not thread-safe.
+    """
+
+    def __init__(self, ingredients=()):
+        ingredients = list(ingredients)
+        # Ingredient ids by name suffix, sorted by suffix.
+        entries = sorted(
+            (key, ingredient_id)
+            for ingredient_id, name, _ in ingredients
+            for key in _word_starts(name)
+        )
+        self.keys = [key for key, _ in entries]
+        self.ids = [ingredient_id for _, ingredient_id in entries]
+        self.ingredients = {
+            ingredient_id: (name, popularity)
+            for ingredient_id, name, popularity in ingredients
+        }
+        self.results = {}
+
+    def __len__(self):
+        return len(self.ingredients)
+
+    def add(self, ingredient_id, name, popularity):
+        self.remove(ingredient_id)
+        for key in _word_starts(name):
+            position = bisect_left(self.keys, key)
+            self.keys.insert(position, key)
+            self.ids.insert(position, ingredient_id)
+        self.ingredients[ingredient_id] = (name, popularity)
+        self.results.clear()
+
+    def remove(self, ingredient_id):
+        if ingredient_id not in self.ingredients:
+            return
+        name, _ = self.ingredients.pop(ingredient_id)
+        for key in _word_starts(name):
+            position = bisect_left(self.keys, key)
+            while self.ids[position] != ingredient_id:
+                position += 1
+            del self.keys[position]
+            del self.ids[position]
+        self.results.clear()
+
+    def search(self, prefix, limit=10):
+        """
+        Return up to ``limit`` (id, name) pairs of ingredients matching
+        ``prefix``, most popular first.
+        """
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        memo_key = (prefix, limit)
+        results = self.results.get(memo_key)
+        if results is not None:
+            return results
+
+        start = bisect_left(self.keys, prefix)
+        # Every key starting with the prefix sorts before its successor.
+        end = bisect_left(self.keys, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+        matches = set(self.ids[start:end])
+        ranked = nsmallest(
+            limit,
+            matches,
+            key=lambda ingredient_id: (
+                -self.ingredients[ingredient_id][1],
+                self.ingredients[ingredient_id][0],
+                ingredient_id,
+            ),
+        )
+        results = [
+            (ingredient_id, self.ingredients[ingredient_id][0])
+            for ingredient_id in ranked
+        ]
+
+        if len(self.results) >= MAX_MEMOIZED:
+            self.results.clear()
+        self.results[memo_key] = results
+        return results
+
+
+class IngredientAutocomplete:
+    """
+    The ``PrefixIndex`` of all ingredients, rebuilt lazily.
+    """
+
+    def __init__(self, max_age=300, clock=time.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self._index = None
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def search(self, prefix, limit=10):
+        with self._lock:
+            if self._index is None or self.clock() - self._built_at >= self.max_age:
+                self._index = PrefixIndex(
+                    Ingredient.objects.values_list("id", "name", "recipe_count")
+                )
+                self._built_at = self.clock()
+            return self._index.search(prefix, limit)
+
+    def ingredient_saved(self, ingredient):
+        transaction.on_commit(
+            lambda: self._apply(
+                "add", ingredient.pk, ingredient.name, ingredient.recipe_count
+            )
+        )
+
+    def add_many(self, ingredients):
+        """
+        Index (id, name, popularity) triples, for bulk creations, which send no
+        post_save. Callers run it once the rows are committed.
+        """
+        for ingredient in ingredients:
+            self._apply("add", *ingredient)
+
+    def ingredient_deleted(self, ingredient_id):
+        transaction.on_commit(lambda: self._apply("remove", ingredient_id))
+
+    def _apply(self, method, *args):
+        with self._lock:
+            # An index yet to be built will read the change from the database.
+            if self._index is not None:
+                getattr(self._index, method)(*args)
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+
+
+_config = getattr(settings, "INGREDIENT_AUTOCOMPLETE", {})
+ingredient_index = IngredientAutocomplete(max_age=_config.get("MAX_AGE", 300))
@@ -0,0 +1,22 @@
+"""
+SQLite backend with a ``transaction_mode`` option, like the one Django 5.1 adds.
+
+Transactions start with ``BEGIN``, which takes the write lock at the first write.
+A transaction that read before writing then fails at once with "database is
+locked" if another one holds the lock or committed in between; the busy timeout
+doesn't apply. ``"transaction_mode": "IMMEDIATE"`` takes the lock up front, so
+concurrent write transactions queue for it instead.
+"""
+
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("transaction_mode", None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode")
+        self.cursor().execute(f"BEGIN {mode}" if mode else "BEGIN")
@@ -0,0 +1,719 @@
+"""
+In-process load benchmarks of every API route.
+
+Requests go through the full Django stack with the test client, against the
+configured database, so the numbers include middleware, authentication,
+serialization and every query. Each scenario reports latency percentiles,
+throughput and queries per request; ``compare`` lines a run up against a
+baseline run to spot regressions.
+
+``ConcurrencyBenchmark`` compares the list views served under WSGI with their
+async versions served under ASGI, as the number of concurrent clients grows.
+``ReadWriteBenchmark`` mixes list requests with concurrent rating writes.
+
+Seed a dataset first (``manage.py seed_cookbook``), then ``manage.py
+benchmark_api``, ``benchmark_concurrency`` or ``benchmark_database``.
+Registration runs against the local email verifier stub.
+"""
+
+import asyncio
+import io
+import itertools
+import json
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from cookbook import urls
+from cookbook.metrics import get_config
+from cookbook.models import Change, Ingredient, Rating, Recipe
+
+PASSWORD = "bench-password-321"
+
+
+class Scenario:
+    """
+    Requests to one route: ``build(fixture, n)`` returns the n-th request as
+    (method, path, client kwargs). ``max_requests`` caps expensive routes.
+    """
+
+    def __init__(self, name, url_name, build, user="reader", max_requests=None):
+        self.name = name
+        self.url_name = url_name
+        self.build = build
+        self.user = user
+        self.max_requests = max_requests
+
+
+class Fixture:
+    """
+    The users and rows the scenarios work with, created once per run.
+    """
+
+    def __init__(self):
+        self.run_id = uuid.uuid4().hex[:8]
+
+        # A fresh writer, so its ratings never collide with existing ones.
+        self.writer = User.objects.create_user(
+            f"bench_{self.run_id}", f"bench_{self.run_id}@example.com", PASSWORD
+        )
+        # The most prolific author, so /my_recipes/ lists something.
+        author = (
+            Recipe.objects.values("author")
+            .annotate(recipes=Count("id"))
+            .order_by("-recipes")
+            .first()
+        )
+        self.reader = User.objects.get(pk=author["author"]) if author else self.writer
+        self.tokens = {
+            "reader": str(RefreshToken.for_user(self.reader).access_token),
+            "writer": str(RefreshToken.for_user(self.writer).access_token),
+        }
+
+        top_ingredients = list(
+            Ingredient.objects.top_ingredients(20).values_list("id", "name")
+        )
+        self.ingredient_ids = [pk for pk, _ in top_ingredients]
+        self.ingredient_names = [name for _, name in top_ingredients]
+        self.recipe_ids = list(
+            Recipe.objects.exclude(author=self.writer)
+            .order_by("-id")
+            .values_list("id", flat=True)[:1000]
+        )
+        # A client that last synced 1000 changes to recipes and ingredients ago.
+        cursors = (
+            Change.objects.filter(owner_id__isnull=True)
+            .order_by("-seq")
+            .values_list("seq", flat=True)
+        )
+        self.change_cursor = next(iter(cursors[1000:1001]), 0)
+
+    def cleanup(self):
+        # Drops the writer's recipes and ratings too, keeping the dataset stable.
+        Rating.objects.filter(user=self.writer).delete()
+        Recipe.objects.filter(author=self.writer).delete()
+        Ingredient.objects.filter(name__startswith=f"bench {self.run_id}").delete()
+        User.objects.filter(username__startswith=f"bench_{self.run_id}").delete()
+
+
+def _get(url_name, params=None):
+    return lambda fixture, n: ("get", reverse(url_name), {"data": params})
+
+
+def _metrics(fixture, n):
+    # /metrics only answers the configured token.
+    token = get_config().get("TOKEN", "")
+    return "get", reverse("metrics"), {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+
+def _register(fixture, n):
+    username = f"bench_{fixture.run_id}_{n}"
+    data = {
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": PASSWORD,
+        "password2": PASSWORD,
+        "first_name": "Bench",
+        "last_name": "Mark",
+    }
+    return "post", reverse("register"), {"data": data}
+
+
+def _login(fixture, n):
+    data = {"username": fixture.writer.username, "password": PASSWORD}
+    return "post", reverse("login"), {"data": data}
+
+
+def _add_ingredient(fixture, n):
+    data = {"name": f"bench {fixture.run_id} {n}"}
+    return "post", reverse("add-ingredient"), {"data": data}
+
+
+def _add_recipe(fixture, n):
+    data = {
+        "name": f"bench {fixture.run_id} recipe {n}",
+        "description": f"bench {fixture.run_id} description {n}",
+        "author": fixture.writer.pk,
+        "ingredients": fixture.ingredient_ids[: 3 + n % 5],
+    }
+    return (
+        "post",
+        reverse("add-recipe"),
+        {"data": data, "content_type": "application/json"},
+    )
+
+
+def _add_recipe_by_names(fixture, n):
+    # Mostly known ingredients, and a new one created with the recipe.
+    data = {
+        "name": f"bench {fixture.run_id} named recipe {n}",
+        "description": f"bench {fixture.run_id} named description {n}",
+        "author": fixture.writer.pk,
+        "ingredients": fixture.ingredient_names[: 3 + n % 5]
+        + [f"bench {fixture.run_id} {n}"],
+    }
+    return (
+        "post",
+        reverse("add-recipe"),
+        {"data": data, "content_type": "application/json"},
+    )
+
+
+def _add_rating(fixture, n):
+    # Every request rates another recipe, a second rate would be refused.
+    recipe_id = fixture.recipe_ids[n % len(fixture.recipe_ids)]
+    data = {"recipe": recipe_id, "rate": 1 + n % 5}
+    return "post", reverse("add-rating"), {"data": data}
+
+
+def _add_ratings(fixture, n):
+    recipe_ids = fixture.recipe_ids[-20:]
+    data = [{"recipe": pk, "rate": 1 + (n + i) % 5} for i, pk in enumerate(recipe_ids)]
+    return (
+        "post",
+        reverse("add-ratings"),
+        {"data": data, "content_type": "application/json"},
+    )
+
+
+def _import_recipes(fixture, n):
+    body = "\n".join(
+        json.dumps(
+            {
+                "name": f"bench {fixture.run_id} import {n}-{i}",
+                "description": f"bench {fixture.run_id} imported {n}-{i}",
+                "ingredients": ["salt", "olive oil", "garlic"],
+            }
+        )
+        for i in range(10)
+    )
+    return (
+        "post",
+        reverse("import-recipes"),
+        {"data": body, "content_type": "application/x-ndjson"},
+    )
+
+
+def _pantry(fixture, n):
+    ids = ",".join(map(str, fixture.ingredient_ids))
+    return "get", reverse("recipes-list"), {"data": {"ingredients": ids, "missing": 2}}
+
+
+def _combined_filters(fixture, n):
+    params = {
+        "author": fixture.reader.pk,
+        "ingredients": fixture.ingredient_ids[n % len(fixture.ingredient_ids)],
+        "order": ["newest", "fewest_ingredients", "best_rated"][n % 3],
+    }
+    return "get", reverse("recipes-list"), {"data": params}
+
+
+def _autocomplete(fixture, n):
+    prefix = ["s", "sa", "pe", "fresh", "ch", "smoked sa"][n % 6]
+    return "get", reverse("ingredient-autocomplete"), {"data": {"prefix": prefix}}
+
+
+def _top_recipes(fixture, n):
+    params = [
+        {},
+        {"page_size": 10},
+        {"ingredient": fixture.ingredient_ids[n % len(fixture.ingredient_ids)]},
+        {"author": fixture.reader.pk},
+    ][n % 4]
+    return "get", reverse("top-recipes"), {"data": params}
+
+
+def _similar_recipes(fixture, n):
+    recipe_id = fixture.recipe_ids[n % len(fixture.recipe_ids)]
+    return "get", reverse("similar-recipes", args=[recipe_id]), {}
+
+
+def _changes(fixture, n):
+    params = {"since": fixture.change_cursor, "limit": [100, 1000][n % 2]}
+    return "get", reverse("changes"), {"data": params}
+
+
+def default_scenarios():
+    return [
+        Scenario("login", "login", _login, user=None, max_requests=20),
+        Scenario("register", "register", _register, user=None, max_requests=20),
+        Scenario("recipes_list", "recipes-list", _get("recipes-list")),
+        Scenario(
+            "recipes_list_max_ingredients",
+            "recipes-list",
+            _get("recipes-list", {"max_ingredients": 1}),
+        ),
+        Scenario(
+            "recipes_list_search", "recipes-list", _get("recipes-list", {"q": "soup"})
+        ),
+        Scenario("recipes_list_pantry", "recipes-list", _pantry),
+        Scenario("recipes_list_combined", "recipes-list", _combined_filters),
+        Scenario("my_recipes", "my-recipes", _get("my-recipes")),
+        Scenario("top_ingredients", "top-ingredients", _get("top-ingredients")),
+        Scenario("top_recipes", "top-recipes", _top_recipes),
+        Scenario("ingredient_autocomplete", "ingredient-autocomplete", _autocomplete),
+        Scenario("similar_recipes", "similar-recipes", _similar_recipes),
+        Scenario("changes", "changes", _changes),
+        Scenario(
+            "recipes_list_async", "recipes-list-async", _get("recipes-list-async")
+        ),
+        Scenario("my_recipes_async", "my-recipes-async", _get("my-recipes-async")),
+        Scenario(
+            "top_ingredients_async",
+            "top-ingredients-async",
+            _get("top-ingredients-async"),
+        ),
+        Scenario(
+            "recipes_export", "recipes-export", _get("recipes-export"), max_requests=3
+        ),
+        Scenario("add_ingredient", "add-ingredient", _add_ingredient, user="writer"),
+        Scenario("add_recipe", "add-recipe", _add_recipe, user="writer"),
+        Scenario(
+            "add_recipe_by_names", "add-recipe", _add_recipe_by_names, user="writer"
+        ),
+        Scenario("add_rating", "add-rating", _add_rating, user="writer"),
+        Scenario("add_ratings", "add-ratings", _add_ratings, user="writer"),
+        Scenario("import_recipes", "import-recipes", _import_recipes, user="writer"),
+        Scenario("metrics", "metrics", _metrics, user=None),
+    ]
+
+
+def uncovered_routes(scenarios):
+    covered = {scenario.url_name for scenario in scenarios}
+    return sorted(
+        pattern.name for pattern in urls.urlpatterns if pattern.name not in covered
+    )
+
+
+def summarize(latencies, queries, statuses, elapsed):
+    """
+    Return the statistics of one scenario, latencies being in seconds. Query
+    counts are left out when ``queries`` is None.
+    """
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    if len(latencies_ms) > 1:
+        percentiles = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+        p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+    else:
+        p50 = p95 = p99 = latencies_ms[0]
+    codes = {}
+    for status in statuses:
+        codes[str(status)] = codes.get(str(status), 0) + 1
+
+    summary = {
+        "requests": len(latencies_ms),
+        "errors": sum(1 for status in statuses if status >= 400),
+        "status_codes": codes,
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "mean_ms": round(statistics.fmean(latencies_ms), 2),
+        "max_ms": round(latencies_ms[-1], 2),
+        "throughput_rps": round(len(latencies_ms) / elapsed, 1),
+    }
+    if queries is not None:
+        summary["queries_mean"] = round(statistics.fmean(queries), 1)
+        summary["queries_max"] = max(queries)
+    return summary
+
+
+class BenchmarkRunner:
+    def __init__(self, requests=50, warmup=5, concurrency=1, host="testserver"):
+        self.requests = requests
+        self.warmup = warmup
+        self.concurrency = concurrency
+        self.host = host
+        self._local = threading.local()
+
+    def client(self, fixture, user):
+        clients = self._local.__dict__.setdefault("clients", {})
+        if user not in clients:
+            client = Client(raise_request_exception=False, HTTP_HOST=self.host)
+            if user is not None:
+                client.defaults["HTTP_AUTHORIZATION"] = "Bearer " + fixture.tokens[user]
+            clients[user] = client
+        return clients[user]
+
+    def request(self, scenario, fixture, n):
+        """
+        Send the n-th request of a scenario, returning (seconds, queries, status).
+        """
+        method, path, kwargs = scenario.build(fixture, n)
+        client = self.client(fixture, scenario.user)
+        # The log is bounded: once full, CaptureQueriesContext counts nothing.
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(path, **kwargs)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - start
+        response.close()
+        return elapsed, len(queries), response.status_code
+
+    def run_scenario(self, scenario, fixture):
+        count = self.requests
+        if scenario.max_requests is not None:
+            count = min(count, scenario.max_requests)
+        for n in range(min(self.warmup, count)):
+            self.request(scenario, fixture, count + n)
+
+        def request(n):
+            try:
+                return self.request(scenario, fixture, n)
+            finally:
+                if self.concurrency > 1:
+                    connection.close()
+
+        start = time.perf_counter()
+        if self.concurrency > 1:
+            with ThreadPoolExecutor(self.concurrency) as executor:
+                samples = list(executor.map(request, range(count)))
+        else:
+            samples = [request(n) for n in range(count)]
+        elapsed = time.perf_counter() - start
+
+        latencies, queries, statuses = zip(*samples)
+        return summarize(latencies, queries, statuses, elapsed)
+
+    def run(self, scenarios, log=None):
+        fixture = Fixture()
+        results = {}
+        try:
+            for scenario in scenarios:
+                results[scenario.name] = {
+                    "route": scenario.url_name,
+                    **self.run_scenario(scenario, fixture),
+                }
+                if log is not None:
+                    log(scenario.name, results[scenario.name])
+        finally:
+            fixture.cleanup()
+        return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Yield (scenario, baseline p95, p95, ratio, regressed) for the shared scenarios.
+    """
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p95_ms"], result["p95_ms"]
+        ratio = after / before if before else float("inf")
+        yield name, before, after, ratio, ratio > 1 + threshold
+
+
+#################################################
+# ASGI against WSGI
+#################################################
+
+# The list routes with an async version: (name, sync route, async route).
+ASYNC_ROUTES = [
+    ("recipes_list", "recipes-list", "recipes-list-async"),
+    ("my_recipes", "my-recipes", "my-recipes-async"),
+    ("top_ingredients", "top-ingredients", "top-ingredients-async"),
+]
+
+
+def wsgi_environ(
+    method,
+    path,
+    query_string="",
+    body=b"",
+    content_type=None,
+    token=None,
+    host="testserver",
+):
+    environ = {
+        "REQUEST_METHOD": method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": query_string,
+        "SERVER_NAME": host,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "HTTP_HOST": host,
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if content_type is not None:
+        environ["CONTENT_TYPE"] = content_type
+    if token is not None:
+        environ["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    return environ
+
+
+def wsgi_request(handler, environ, client_delay=0):
+    """
+    Serve ``environ`` like a WSGI server and return the status code. The client
+    takes ``client_delay`` seconds to receive the response.
+    """
+    status = []
+    response = handler(
+        environ, lambda line, headers, exc_info=None: status.append(line)
+    )
+    try:
+        for _ in response:
+            pass
+        if client_delay:
+            time.sleep(client_delay)
+    finally:
+        response.close()
+    return int(status[0].split()[0])
+
+
+class ThreadCounter:
+    """
+    Track the peak number of live threads while in the ``with`` block.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self.peak = threading.active_count()
+        self._thread = threading.Thread(target=self.sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        # The sampling thread doesn't count.
+        self.peak -= 1
+
+
+class ConcurrencyBenchmark:
+    """
+    Serve the sync list views under WSGI and their async versions under ASGI
+    to a growing number of concurrent clients.
+
+    Every client sends ``requests`` requests in a row and takes ``client_delay``
+    seconds to receive each response, like a client on a slow network. The WSGI
+    side is a pool of ``workers`` threads, like a threaded WSGI server, where a
+    slow client keeps its worker busy; the ASGI side is Django's ASGI handler
+    on one event loop. Both are driven in process, without sockets.
+    """
+
+    def __init__(
+        self,
+        clients=(1, 8, 32, 128),
+        requests=10,
+        workers=8,
+        client_delay=0.05,
+        host="testserver",
+    ):
+        self.clients = clients
+        self.requests = requests
+        self.workers = workers
+        self.client_delay = client_delay
+        self.host = host
+
+    def serve_wsgi(self, handler, path, query_string, token):
+        environ = wsgi_environ("GET", path, query_string, token=token, host=self.host)
+        return wsgi_request(handler, environ, self.client_delay)
+
+    async def serve_asgi(self, handler, path, query_string, token):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query_string.encode(),
+            "root_path": "",
+            "headers": [
+                (b"host", self.host.encode()),
+                (b"authorization", f"Bearer {token}".encode()),
+            ],
+            "server": (self.host, 80),
+            "client": ("127.0.0.1", 0),
+        }
+        status = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+            elif not message.get("more_body", False):
+                await asyncio.sleep(self.client_delay)
+
+        await handler(scope, receive, send)
+        return status[0]
+
+    async def drive(self, serve, clients):
+        samples = []
+
+        async def client():
+            for _ in range(self.requests):
+                start = time.perf_counter()
+                status = await serve()
+                samples.append((time.perf_counter() - start, status))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        latencies, statuses = zip(*samples)
+        return summarize(latencies, None, statuses, elapsed)
+
+    def run_wsgi(self, path, query_string, token, clients):
+        handler = WSGIHandler()
+        with ThreadPoolExecutor(self.workers) as executor:
+
+            async def serve():
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    executor, self.serve_wsgi, handler, path, query_string, token
+                )
+
+            with ThreadCounter() as threads:
+                result = asyncio.run(self.drive(serve, clients))
+        return {**result, "peak_threads": threads.peak}
+
+    def run_asgi(self, path, query_string, token, clients):
+        handler = ASGIHandler()
+
+        async def serve():
+            return await self.serve_asgi(handler, path, query_string, token)
+
+        with ThreadCounter() as threads:
+            result = asyncio.run(self.drive(serve, clients))
+        return {**result, "peak_threads": threads.peak}
+
+    def run(self, routes=ASYNC_ROUTES, params=None, log=None):
+        fixture = Fixture()
+        token = fixture.tokens["reader"]
+        query_string = urlencode(params or {})
+        results = {}
+        try:
+            for name, sync_route, async_route in routes:
+                results[name] = {"wsgi": {}, "asgi": {}}
+                for clients in self.clients:
+                    for server, route, run in [
+                        ("wsgi", sync_route, self.run_wsgi),
+                        ("asgi", async_route, self.run_asgi),
+                    ]:
+                        result = run(reverse(route), query_string, token, clients)
+                        results[name][server][str(clients)] = result
+                        if log is not None:
+                            log(name, server, clients, result)
+        finally:
+            fixture.cleanup()
+        return results
+
+
+#################################################
+# Concurrent reads and writes
+#################################################
+
+
+class ReadWriteBenchmark:
+    """
+    List recipes from ``readers`` threads while ``writers`` threads rate recipes,
+    for ``duration`` seconds. Requests go through Django's WSGI handler, which
+    opens and closes database connections as in production.
+
+    Run it under each database profile (``DATABASE_PROFILE``) to compare them.
+    """
+
+    def __init__(
+        self, readers=8, writers=2, duration=10.0, batch_size=10, host="testserver"
+    ):
+        self.readers = readers
+        self.writers = writers
+        self.duration = duration
+        self.batch_size = batch_size
+        self.host = host
+
+    def read(self, fixture, n):
+        return "GET", reverse("recipes-list"), "", b"", None
+
+    def write(self, fixture, n):
+        # A batch is an upsert, so the same recipes can be rated again and again.
+        recipe_ids = fixture.recipe_ids
+        start = n * self.batch_size % max(len(recipe_ids) - self.batch_size, 1)
+        batch = [
+            {"recipe": recipe_id, "rate": 1 + (n + i) % 5}
+            for i, recipe_id in enumerate(recipe_ids[start : start + self.batch_size])
+        ]
+        body = json.dumps(batch).encode()
+        return "POST", reverse("add-ratings"), "", body, "application/json"
+
+    def run(self):
+        fixture = Fixture()
+        handler = WSGIHandler()
+        samples = {"reads": [], "writes": []}
+        counter = itertools.count()
+        deadline = time.perf_counter() + self.duration
+
+        def work(kind, build, token):
+            try:
+                while time.perf_counter() < deadline:
+                    environ = wsgi_environ(
+                        *build(fixture, next(counter)), token=token, host=self.host
+                    )
+                    start = time.perf_counter()
+                    status = wsgi_request(handler, environ)
+                    samples[kind].append((time.perf_counter() - start, status))
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(
+                target=work, args=("reads", self.read, fixture.tokens["reader"])
+            )
+            for _ in range(self.readers)
+        ] + [
+            threading.Thread(
+                target=work, args=("writes", self.write, fixture.tokens["writer"])
+            )
+            for _ in range(self.writers)
+        ]
+        try:
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            fixture.cleanup()
+
+        results = {}
+        for kind, kind_samples in samples.items():
+            if kind_samples:
+                latencies, statuses = zip(*kind_samples)
+                results[kind] = summarize(latencies, None, statuses, elapsed)
+        return results
@@ -0,0 +1,191 @@
+"""
+Change feed of recipes, ingredients and ratings, for incremental client sync.
+
+Every tracked row has one ``Change`` row, replaced whenever the row is inserted,
+updated or deleted, so the table holds the latest change of each row, deletions
+included as tombstones. Each replacement gets a new ``seq`` from an AUTOINCREMENT
+key, never reused. SQLite has a single writer and a transaction holds the write
+lock until it commits, so sequence numbers become visible in increasing order:
+a client which has read every change up to ``seq`` never misses a later one.
+That is the cursor of the feed. Timestamps can't serve as one, since a
+transaction may commit after another one which started later.
+
+On SQLite the changes are recorded by triggers, so bulk writes and cascades are
+tracked too. Ingredients only change with their name, as their recipe count is
+not part of their synced representation. Ratings are private to their user.
+
+A feed page is a range of the ``Change`` primary key, then one query per model
+for the rows changed, so its cost follows the churn rather than the catalog.
+
+SQLite drops a table's triggers when Django rebuilds the table during a
+migration, so migrations altering a tracked model must run ``install_triggers``
+again.
+"""
+
+from collections import defaultdict
+
+from django.db.models import Q
+from rest_framework import serializers
+
+from cookbook.models import Change, Ingredient, Rating, Recipe
+from cookbook.serializers import (
+    IngredientListValuesSerializer,
+    RatingValuesSerializer,
+    RecipeListValuesSerializer,
+)
+
+CHANGE_TABLE = Change._meta.db_table
+
+# Tracked tables by model name: the updated columns which count as a change
+# (None for any), the owner column and the serializer of their rows.
+TRACKED = {
+    "ingredient": (Ingredient, ["name"], None, IngredientListValuesSerializer),
+    "recipe": (Recipe, None, None, RecipeListValuesSerializer),
+    "rating": (Rating, None, "user_id", RatingValuesSerializer),
+}
+
+# A delete and an insert rather than INSERT OR REPLACE: the conflict clause of the
+# statement firing the trigger, like bulk_create's OR IGNORE, would override the
+# trigger's.
+TRIGGER_TEMPLATE = """
+CREATE TRIGGER IF NOT EXISTS {change_table}_{name}_{trigger} AFTER {event} ON {table}
+BEGIN
+    DELETE FROM {change_table} WHERE model = '{name}' AND object_id = {row}.id;
+    INSERT INTO {change_table}(model, object_id, owner_id, deleted)
+    VALUES ('{name}', {row}.id, {owner_id}, {deleted});
+END
+"""
+
+BACKFILL_TEMPLATE = """
+INSERT INTO {change_table}(model, object_id, owner_id, deleted)
+SELECT '{name}', id, {owner_id}, 0 FROM {table} ORDER BY id
+"""
+
+
+def _trigger_sql(name, model, columns, owner):
+    update = "UPDATE" if columns is None else f"UPDATE OF {', '.join(columns)}"
+    return [
+        TRIGGER_TEMPLATE.format(
+            change_table=CHANGE_TABLE,
+            name=name,
+            trigger=trigger,
+            event=event,
+            table=model._meta.db_table,
+            row=row,
+            owner_id=f"{row}.{owner}" if owner else "NULL",
+            deleted=deleted,
+        )
+        for trigger, event, row, deleted in [
+            ("insert", "INSERT", "new", 0),
+            ("update", update, "new", 0),
+            ("delete", "DELETE", "old", 1),
+        ]
+    ]
+
+
+TRIGGERS_SQL = [
+    statement
+    for name, (model, columns, owner, _) in TRACKED.items()
+    for statement in _trigger_sql(name, model, columns, owner)
+]
+
+# Ingredients first, so that a full sync lists them before the recipes using them.
+BACKFILL_SQL = [
+    BACKFILL_TEMPLATE.format(
+        change_table=CHANGE_TABLE,
+        name=name,
+        owner_id=owner or "NULL",
+        table=model._meta.db_table,
+    )
+    for name, (model, _, owner, _) in TRACKED.items()
+]
+
+DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {CHANGE_TABLE}_{name}_{event}"
+    for name in TRACKED
+    for event in ("insert", "update", "delete")
+]
+
+
+def _execute(schema_editor, statements):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def install(apps, schema_editor):
+    """
+    Create the triggers, then record every existing row as changed.
+    """
+    _execute(schema_editor, TRIGGERS_SQL + BACKFILL_SQL)
+
+
+def install_triggers(apps, schema_editor):
+    """
+    Recreate the triggers after a migration has rebuilt a tracked table.
+    """
+    _execute(schema_editor, TRIGGERS_SQL)
+
+
+def uninstall(apps, schema_editor):
+    _execute(schema_editor, DROP_SQL)
+
+
+def changes_since(since, limit, user_id, include_deleted=True):
+    """
+    Return up to ``limit`` changes visible to the user after the ``since``
+    cursor, oldest first, the cursor of the last one and whether more follow.
+
+    Without ``include_deleted``, as for a first sync, tombstones are skipped.
+    """
+    changes = Change.objects.filter(seq__gt=since).filter(
+        Q(owner_id__isnull=True) | Q(owner_id=user_id)
+    )
+    if not include_deleted:
+        changes = changes.filter(deleted=False)
+    changes = list(
+        changes.order_by("seq").values_list("seq", "model", "object_id", "deleted")[
+            : limit + 1
+        ]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    changed_ids = defaultdict(list)
+    for _, name, object_id, deleted in changes:
+        if not deleted:
+            changed_ids[name].append(object_id)
+    rows = {name: _load(name, ids) for name, ids in changed_ids.items()}
+
+    updated_at_field = serializers.DateTimeField()
+    entries = []
+    for _, name, object_id, deleted in changes:
+        entry = {"type": name, "id": object_id, "deleted": True}
+        # A row missing here was deleted since, and its tombstone follows.
+        row = None if deleted else rows[name].get(object_id)
+        if row is None:
+            entry.update(updated_at=None, data=None)
+        else:
+            updated_at, data = row
+            entry.update(
+                deleted=False,
+                updated_at=updated_at_field.to_representation(updated_at),
+                data=data,
+            )
+        entries.append(entry)
+    return entries, changes[-1][0] if changes else since, has_more
+
+
+def _load(name, ids):
+    """
+    Return the (updated_at, representation) pairs of a model's rows by id.
+    """
+    model, _, _, serializer_class = TRACKED[name]
+    values = list(
+        model.objects.filter(pk__in=ids)
+        .order_by()
+        .values(*dict.fromkeys(["id", "updated_at", *serializer_class.fields]))
+    )
+    data = serializer_class(values).data
+    return {row["id"]: (row["updated_at"], item) for row, item in zip(values, data)}
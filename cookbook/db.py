@@ -0,0 +1,115 @@
+"""
+SQLite tuning: connection pragmas, a read-only connection for the list views and
+retries of writes that find the database locked.
+
+With ``DATABASE_PROFILE=production`` (see settings.py) the database runs in WAL
+mode, where readers and the writer don't block each other, and connections are
+kept open across requests. SQLite still has a single writer: a write waits for
+the lock up to the connection's busy timeout, and a transaction that read before
+writing fails at once if another one committed in between. ``retry_on_busy``
+runs such transactions again.
+
+List views read inside ``read_database()``, which ``ReadRouter`` sends to the
+``READ_DATABASE`` alias: a second connection to the same file, made read-only
+with the ``query_only`` pragma.
+"""
+
+import contextvars
+import functools
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+_read_database = contextvars.ContextVar("read_database", default=None)
+
+# The largest integer SQLite stores, beyond which parameters fail to bind.
+MAX_INTEGER = 2**63 - 1
+
+
+def get_config():
+    return getattr(settings, "SQLITE", {})
+
+
+def configure_connection(connection):
+    """
+    Apply the configured pragmas to a new SQLite connection.
+    """
+    if connection.vendor != "sqlite":
+        return
+    config = get_config()
+    pragmas = dict(config.get("PRAGMAS", {}))
+    if connection.alias == config.get("READ_DATABASE"):
+        pragmas["query_only"] = "on"
+    # On the raw connection, so that the pragmas don't count as request queries.
+    for name, value in pragmas.items():
+        connection.connection.execute(f"PRAGMA {name} = {value}")
+
+
+#################################################
+# Retries
+#################################################
+
+
+def is_busy(error):
+    message = str(error).lower()
+    return "database is locked" in message or "database table is locked" in message
+
+
+def retry_on_busy(func, using=DEFAULT_DB_ALIAS):
+    """
+    Wrap ``func`` to run in a transaction, run again while the database is
+    locked, up to ``BUSY_RETRIES`` times after a growing, jittered pause.
+
+    In an outer transaction ``func`` runs once: a failed statement dooms it.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        config = get_config()
+        retries = (
+            0 if connections[using].in_atomic_block else config.get("BUSY_RETRIES", 0)
+        )
+        attempt = 0
+        while True:
+            try:
+                with transaction.atomic(using=using):
+                    return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt >= retries or not is_busy(e):
+                    raise
+            pause = config.get("BUSY_BACKOFF", 0.05) * 2**attempt
+            time.sleep(pause * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    return wrapper
+
+
+#################################################
+# Read connection
+#################################################
+
+
+@contextmanager
+def read_database():
+    """
+    Send the reads in the block to ``READ_DATABASE``, if one is configured.
+    """
+    token = _read_database.set(get_config().get("READ_DATABASE"))
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+class ReadRouter:
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The read connection opens the database migrated through the default one.
+        if db == get_config().get("READ_DATABASE"):
+            return False
+        return None
@@ -0,0 +1,229 @@
+"""
+Email verification used by the registration endpoint.
+
+Every check goes through ``get_verifier()``, which combines a pluggable backend
+(the Hunter API by default), a TTL cache keyed by email and by domain, and a
+circuit breaker. When the backend fails or the breaker is open, the configured
+policy decides whether the address is accepted (fail open) or rejected (fail closed).
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+VALID = "valid"
+INVALID = "invalid"
+UNVERIFIED = "unverified"
+
+VerificationResult = namedtuple("VerificationResult", ["status", "domain_valid"])
+
+
+class VerificationError(Exception):
+    """The backend could not produce a verdict for an email."""
+
+
+#################################################
+# Backends
+#################################################
+
+
+class HunterBackend:
+    """
+    Hunter email-verifier client using a pooled session with strict timeouts.
+    """
+
+    def __init__(
+        self,
+        api_key="",
+        base_url="https://api.hunter.io/v2",
+        connect_timeout=1.0,
+        read_timeout=3.0,
+        pool_size=10,
+    ):
+        self.api_key = api_key
+        self.url = base_url.rstrip("/") + "/email-verifier"
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def verify(self, email):
+        try:
+            response = self.session.get(
+                self.url,
+                params={"email": email, "api_key": self.api_key},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            data = response.json()["data"]
+            status = data["status"]
+        except requests.HTTPError as e:
+            # The request URL carries the API key, so keep it out of the message.
+            raise VerificationError(
+                f"Hunter responded with HTTP {e.response.status_code}"
+            ) from e
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            raise VerificationError(f"Hunter request failed: {type(e).__name__}") from e
+
+        return VerificationResult(
+            status=status, domain_valid=data.get("mx_records") is not False
+        )
+
+
+#################################################
+# Circuit breaker
+#################################################
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing backend until ``recovery_timeout`` seconds have passed.
+
+    After ``failure_threshold`` consecutive failures the breaker opens. Once the
+    timeout expires a single trial call is let through: success closes the
+    breaker, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (
+                self.state == self.OPEN
+                and self.clock() - self.opened_at >= self.recovery_timeout
+            ):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+#################################################
+# Verifier
+#################################################
+
+
+class EmailVerifier:
+    def __init__(self, backend, cache, cache_ttl, breaker, fail_open=True):
+        self.backend = backend
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.breaker = breaker
+        self.fail_open = fail_open
+
+    @staticmethod
+    def cache_key(kind, value):
+        digest = hashlib.sha1(value.lower().encode("utf-8")).hexdigest()
+        return f"email-verification:{kind}:{digest}"
+
+    def verify(self, email):
+        """
+        Return VALID, INVALID or, when failing closed, UNVERIFIED.
+        """
+        domain = email.rpartition("@")[2]
+        domain_key = self.cache_key("domain", domain)
+        email_key = self.cache_key("email", email)
+
+        cached = self.cache.get_many([domain_key, email_key])
+        if cached.get(domain_key) == INVALID:
+            return INVALID
+        if email_key in cached:
+            return INVALID if cached[email_key] == INVALID else VALID
+
+        if not self.breaker.allow():
+            return self.unverified(domain, "circuit breaker is open")
+
+        try:
+            result = self.backend.verify(email)
+        except VerificationError as e:
+            self.breaker.record_failure()
+            return self.unverified(domain, e)
+        except Exception:
+            # Unexpected errors still count, or a trial call would leave the
+            # breaker half-open for good.
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+
+        self.cache.set(email_key, result.status, self.cache_ttl)
+        if not result.domain_valid:
+            self.cache.set(domain_key, INVALID, self.cache_ttl)
+
+        return INVALID if result.status == INVALID else VALID
+
+    def unverified(self, domain, reason):
+        # The domain only, addresses are personal data.
+        logger.warning("Could not verify an address at %s: %s", domain, reason)
+        return VALID if self.fail_open else UNVERIFIED
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_verifier():
+    """
+    Return the process-wide verifier built from ``settings.EMAIL_VERIFICATION``.
+    """
+    global _verifier
+
+    if _verifier is None:
+        with _verifier_lock:
+            if _verifier is None:
+                config = settings.EMAIL_VERIFICATION
+                backend_class = import_string(config["BACKEND"])
+                _verifier = EmailVerifier(
+                    backend=backend_class(**config.get("OPTIONS", {})),
+                    cache=caches[config.get("CACHE", "default")],
+                    cache_ttl=config.get("CACHE_TTL", 24 * 60 * 60),
+                    breaker=CircuitBreaker(
+                        failure_threshold=config.get("FAILURE_THRESHOLD", 5),
+                        recovery_timeout=config.get("RECOVERY_TIMEOUT", 30),
+                    ),
+                    fail_open=config.get("FAIL_OPEN", True),
+                )
+    return _verifier
+
+
+@receiver(setting_changed)
+def reset_verifier(setting, **kwargs):
+    global _verifier
+
+    if setting == "EMAIL_VERIFICATION":
+        _verifier = None
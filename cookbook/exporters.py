@@ -0,0 +1,83 @@
+"""
+Streaming recipe export as NDJSON or a JSON array.
+
+Recipes are read in chunks of ``chunk_size`` rows, each one a short query
+seeking past the last id of the previous chunk, and each chunk's ingredients
+come from one extra query, so memory stays flat and the first chunk is sent
+right away however large the catalog is. No cursor stays open between chunks:
+on SQLite its read lock would block every writer for as long as a slow client
+takes to download the export. Rating
+figures are the recipe's stored aggregates and need no lookup.
+
+Every record carries the ``name``, ``description`` and ``ingredients`` (names)
+the importer reads, so an NDJSON export can be imported again as is.
+"""
+
+import json
+from cookbook.models import Recipe
+
+NDJSON = "ndjson"
+JSON = "json"
+FORMATS = (NDJSON, JSON)
+
+CONTENT_TYPES = {NDJSON: "application/x-ndjson", JSON: "application/json"}
+
+RecipeIngredient = Recipe.ingredients.through
+
+RECIPE_FIELDS = ("id", "name", "description", "author", "rating_count", "avg_rating")
+
+
+def export_chunks(queryset=None, chunk_size=1000):
+    """
+    Yield lists of at most ``chunk_size`` recipe records, ordered by id.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    rows = queryset.order_by("id").values_list(
+        "id", "name", "description", "author_id", "rating_count", "avg_rating"
+    )
+
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+
+        ingredients = {recipe_id: [] for recipe_id, *_ in chunk}
+        for recipe_id, name in (
+            RecipeIngredient.objects.filter(recipe_id__in=ingredients)
+            .order_by("id")
+            .values_list("recipe_id", "ingredient__name")
+        ):
+            ingredients[recipe_id].append(name)
+
+        yield [
+            dict(zip(RECIPE_FIELDS, row), ingredients=ingredients[row[0]])
+            for row in chunk
+        ]
+        if len(chunk) < chunk_size:
+            return
+
+
+def render_ndjson(chunks):
+    for chunk in chunks:
+        yield "".join(json.dumps(record) + "\n" for record in chunk)
+
+
+def render_json(chunks):
+    separator = "[\n"
+    for chunk in chunks:
+        yield separator + ",\n".join(json.dumps(record) for record in chunk)
+        separator = ",\n"
+    yield "[]\n" if separator == "[\n" else "\n]\n"
+
+
+RENDERERS = {NDJSON: render_ndjson, JSON: render_json}
+
+
+def export(export_format, queryset=None, chunk_size=1000):
+    """
+    Yield the export of ``queryset`` as text, one piece per chunk of recipes.
+    """
+    return RENDERERS[export_format](export_chunks(queryset, chunk_size))
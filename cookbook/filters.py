@@ -0,0 +1,155 @@
+"""
+Declarative filtering and ordering of the recipe list.
+
+``RecipeListParams`` validates and normalizes the query parameters of
+/recipes_list/, and ``filter_recipes`` combines every given one into a single
+query: the recipes of an author matching some ingredients, fewest ingredients
+first, say. Unknown parameters, the pagination's among them, are ignored.
+
+Each given parameter adds its step, from the most selective, the unique name
+and description, to the ranking ones; plain filters come before the ingredient
+match, whose aggregates would turn later filters into HAVING clauses.
+
+Without an ``order``, ingredient matches come best first, then search results
+by relevance, then recipes newest first. The composite indexes serving the
+orderings, alone or with ``author``, are declared on ``Recipe``.
+"""
+
+from rest_framework import serializers
+
+from cookbook import db
+from cookbook.models import RecipeQuerySet, content_hash
+
+ORDERINGS = {
+    "newest": ("-id",),
+    "oldest": ("id",),
+    "most_ingredients": ("-ingredient_count", "-id"),
+    "fewest_ingredients": ("ingredient_count", "id"),
+    "best_rated": ("-avg_rating", "-id"),
+}
+
+# Former ordering flags, valued or not: ?max_ingredients is ?order=most_ingredients.
+ORDERING_FLAGS = {
+    "max_ingredients": "most_ingredients",
+    "min_ingredients": "fewest_ingredients",
+}
+
+MAX_INGREDIENT_IDS = 200
+
+
+class IngredientIdsField(serializers.Field):
+    """
+    Ingredient ids, comma-separated, in one or several parameters.
+    """
+
+    default_error_messages = {
+        "invalid": "Expected at most {max_ids} comma-separated ingredient ids."
+    }
+
+    def get_value(self, dictionary):
+        if self.field_name not in dictionary:
+            return serializers.empty
+        if hasattr(dictionary, "getlist"):
+            return dictionary.getlist(self.field_name)
+        return [dictionary[self.field_name]]
+
+    def to_internal_value(self, data):
+        try:
+            ingredient_ids = {
+                int(value)
+                for param in data
+                for value in str(param).split(",")
+                if value.strip()
+            }
+        except ValueError:
+            ingredient_ids = set()
+
+        if not 0 < len(ingredient_ids) <= MAX_INGREDIENT_IDS or not all(
+            0 < ingredient_id <= db.MAX_INTEGER for ingredient_id in ingredient_ids
+        ):
+            self.fail("invalid", max_ids=MAX_INGREDIENT_IDS)
+        return frozenset(ingredient_ids)
+
+
+class RecipeListParams(serializers.Serializer):
+    # Full-text search on name and description.
+    q = serializers.CharField(required=False, allow_blank=True)
+    # Exact name and description.
+    name = serializers.CharField(
+        required=False, allow_blank=True, trim_whitespace=False
+    )
+    description = serializers.CharField(
+        required=False, allow_blank=True, trim_whitespace=False
+    )
+    author = serializers.IntegerField(
+        required=False, min_value=1, max_value=db.MAX_INTEGER
+    )
+    # Match against a set of ingredients, see RecipeQuerySet.match_ingredients.
+    ingredients = IngredientIdsField(required=False)
+    match = serializers.ChoiceField(choices=RecipeQuerySet.MATCH_MODES, required=False)
+    missing = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        max_value=db.MAX_INTEGER,
+        error_messages={
+            "invalid": "Expected a non-negative integer.",
+            "min_value": "Expected a non-negative integer.",
+            "max_value": "Expected a non-negative integer.",
+        },
+    )
+    order = serializers.ChoiceField(choices=list(ORDERINGS), required=False)
+
+    def to_internal_value(self, data):
+        params = super().to_internal_value(data)
+        if "order" not in params:
+            for flag, order in ORDERING_FLAGS.items():
+                if flag in data:
+                    params["order"] = order
+                    break
+        if "match" not in params:
+            params["match"] = (
+                RecipeQuerySet.MATCH_PANTRY
+                if "missing" in params
+                else RecipeQuerySet.MATCH_ANY
+            )
+        return params
+
+
+def _match_ingredients(queryset, params):
+    return queryset.match_ingredients(
+        params["ingredients"], params["match"], params.get("missing", 0)
+    )
+
+
+# Steps by parameter, in the order they run.
+STEPS = [
+    ("name", lambda queryset, params: queryset.filter(name=params["name"])),
+    (
+        "description",
+        lambda queryset, params: queryset.filter(
+            description_hash=content_hash(params["description"])
+        ),
+    ),
+    ("author", lambda queryset, params: queryset.filter(author_id=params["author"])),
+    ("q", lambda queryset, params: queryset.search(params["q"])),
+    ("ingredients", _match_ingredients),
+]
+
+
+def filter_recipes(queryset, query_params):
+    """
+    Apply the validated ``query_params`` of a recipe list to ``queryset``.
+    """
+    serializer = RecipeListParams(data=query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+
+    for name, step in STEPS:
+        if name in params:
+            queryset = step(queryset, params)
+    if "order" in params:
+        queryset = queryset.order_by(*ORDERINGS[params["order"]])
+    elif not params.keys() & {"q", "ingredients"}:
+        queryset = queryset.order_by(*ORDERINGS["newest"])
+    # Otherwise ranked by the search or the ingredient match.
+    return queryset
@@ -0,0 +1,278 @@
+"""
+Bulk recipe import from NDJSON or CSV streams.
+
+Rows are read lazily and written in chunks, one transaction per chunk, with
+``bulk_create`` for recipes, missing ingredients and recipe-ingredient links, so
+memory stays flat however large the input is. Chunks finding the database
+locked are written again. Invalid rows, lines which aren't UTF-8 among them, are
+reported with their line number and skipped without aborting the rest of the
+import.
+
+NDJSON rows look like ``{"name": ..., "description": ..., "ingredients": [...]}``.
+CSV files need a header with ``name``, ``description`` and ``ingredients``
+columns, the ingredient names separated by ``;``.
+"""
+
+import csv
+import json
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+
+from cookbook import response_cache, similarity
+from cookbook.db import retry_on_busy
+from cookbook.ingredients import resolve_names
+from cookbook.models import Ingredient, Recipe, content_hash
+from cookbook.signals import ingredients_changed
+
+NDJSON = "ndjson"
+CSV = "csv"
+FORMATS = (NDJSON, CSV)
+
+CSV_INGREDIENTS_SEPARATOR = ";"
+
+INVALID_ENCODING = "Invalid UTF-8."
+
+RecipeIngredient = Recipe.ingredients.through
+
+
+def _text_lines(stream, invalid_lines):
+    """
+    Yield the lines of ``stream`` as text. Lines which aren't valid UTF-8 are
+    decoded with replacement characters and their numbers added to
+    ``invalid_lines``.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode("utf-8")
+            except UnicodeDecodeError:
+                line = line.decode("utf-8", errors="replace")
+                invalid_lines.add(line_number)
+        yield line
+
+
+def read_ndjson(stream):
+    """
+    Yield (line number, row) pairs, the row being an error message when unparsable.
+    """
+    invalid_lines = set()
+    for line_number, line in enumerate(_text_lines(stream, invalid_lines), start=1):
+        if line_number in invalid_lines:
+            yield line_number, INVALID_ENCODING
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, "Invalid JSON."
+
+
+def read_csv(stream):
+    """
+    Yield (line number, row) pairs from a CSV stream with a header line.
+    """
+    invalid_lines = set()
+    reader = csv.DictReader(_text_lines(stream, invalid_lines))
+    if reader.fieldnames is not None and invalid_lines:
+        # No row can be read without the columns.
+        yield reader.line_num, INVALID_ENCODING
+        return
+    for row in reader:
+        # The reader only reads the lines of the row it returns.
+        if invalid_lines:
+            invalid_lines.clear()
+            yield reader.line_num, INVALID_ENCODING
+            continue
+        ingredients = row.get("ingredients") or ""
+        row["ingredients"] = [
+            name.strip()
+            for name in ingredients.split(CSV_INGREDIENTS_SEPARATOR)
+            if name.strip()
+        ]
+        yield reader.line_num, row
+
+
+READERS = {NDJSON: read_ndjson, CSV: read_csv}
+
+
+def _validate_text(row, field, max_length, errors):
+    value = row.get(field)
+    if not isinstance(value, str) or not value.strip():
+        errors[field] = "This field is required."
+    elif len(value) > max_length:
+        errors[field] = f"Ensure this field has no more than {max_length} characters."
+    return value
+
+
+def validate_row(row):
+    """
+    Return the cleaned (name, description, ingredient names) of a row, or its errors.
+    """
+    if not isinstance(row, dict):
+        return None, {
+            "non_field_errors": row if isinstance(row, str) else "Invalid row."
+        }
+
+    errors = {}
+    name = _validate_text(
+        row, "name", Recipe._meta.get_field("name").max_length, errors
+    )
+    description = _validate_text(
+        row, "description", Recipe._meta.get_field("description").max_length, errors
+    )
+
+    ingredients = row.get("ingredients", [])
+    max_length = Ingredient._meta.get_field("name").max_length
+    if not isinstance(ingredients, list) or not all(
+        isinstance(ingredient, str) and 0 < len(ingredient.strip()) <= max_length
+        for ingredient in ingredients
+    ):
+        errors["ingredients"] = (
+            f"Expected a list of ingredient names of at most {max_length} characters."
+        )
+
+    if errors:
+        return None, errors
+
+    ingredients = list(dict.fromkeys(ingredient.strip() for ingredient in ingredients))
+    return (name, description, ingredients), None
+
+
+class ImportReport:
+    def __init__(self, max_errors):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line_number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line_number, "errors": errors})
+
+    def as_dict(self):
+        return {"created": self.created, "failed": self.failed, "errors": self.errors}
+
+
+class RecipeImporter:
+    """
+    Create recipes authored by ``author`` from (line number, row) pairs.
+
+    Only the first ``max_errors`` errors are kept in the report, the rest are counted.
+    """
+
+    def __init__(self, author, batch_size=1000, max_errors=100):
+        self.author = author
+        self.batch_size = batch_size
+        self.report = ImportReport(max_errors)
+
+    def run(self, rows):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                return self.report
+            self.import_chunk(chunk)
+
+    def import_chunk(self, chunk):
+        valid = []
+        for line_number, row in chunk:
+            cleaned, errors = validate_row(row)
+            if errors:
+                self.report.add_error(line_number, errors)
+            else:
+                valid.append((line_number, cleaned))
+
+        rows = self.unique_rows(valid)
+        try:
+            retry_on_busy(self.create)(rows)
+        except IntegrityError:
+            # Lost a race with a concurrent writer: retry row by row to isolate it.
+            for line_number, cleaned in rows:
+                try:
+                    with transaction.atomic():
+                        self.create([(line_number, cleaned)])
+                except IntegrityError as e:
+                    self.report.add_error(line_number, {"non_field_errors": str(e)})
+
+    def unique_rows(self, rows):
+        """
+        Drop the rows whose name or description is taken, in the table or the chunk.
+        """
+        names = {cleaned[0] for _, cleaned in rows}
+        hashes = {content_hash(cleaned[1]) for _, cleaned in rows}
+        taken_names = set(
+            Recipe.objects.filter(name__in=names).values_list("name", flat=True)
+        )
+        taken_hashes = set(
+            bytes(description_hash)
+            for description_hash in Recipe.objects.filter(
+                description_hash__in=hashes
+            ).values_list("description_hash", flat=True)
+        )
+
+        unique = []
+        for line_number, (name, description, ingredients) in rows:
+            errors = {}
+            if name in taken_names:
+                errors["name"] = "recipe with this name already exists."
+            description_hash = content_hash(description)
+            if description_hash in taken_hashes:
+                errors["description"] = "recipe with this description already exists."
+            if errors:
+                self.report.add_error(line_number, errors)
+                continue
+
+            taken_names.add(name)
+            taken_hashes.add(description_hash)
+            unique.append((line_number, (name, description, ingredients)))
+        return unique
+
+    def resolve_ingredients(self, names):
+        """
+        Return a name to id mapping, creating the ingredients that don't exist yet.
+        """
+        return resolve_names(names)
+
+    def create(self, rows):
+        rows = [cleaned for _, cleaned in rows]
+        if not rows:
+            return
+
+        ingredient_ids = self.resolve_ingredients(
+            {name for _, _, ingredients in rows for name in ingredients}
+        )
+
+        recipes = Recipe.objects.bulk_create(
+            [
+                Recipe(name=name, description=description, author=self.author)
+                for name, description, _ in rows
+            ]
+        )
+        if any(recipe.pk is None for recipe in recipes):
+            recipe_ids = dict(
+                Recipe.objects.filter(
+                    name__in=[recipe.name for recipe in recipes]
+                ).values_list("name", "id")
+            )
+            for recipe in recipes:
+                recipe.pk = recipe_ids[recipe.name]
+
+        pairs = [
+            (recipe.pk, ingredient_ids[name])
+            for recipe, (_, _, ingredients) in zip(recipes, rows)
+            for name in ingredients
+        ]
+        RecipeIngredient.objects.bulk_create(
+            [
+                RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id)
+                for recipe_id, ingredient_id in pairs
+            ]
+        )
+        ingredients_changed(pairs, 1)
+        similarity.index_links(pairs)
+        response_cache.invalidate()
+
+        self.report.created += len(recipes)
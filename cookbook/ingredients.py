@@ -0,0 +1,145 @@
+"""
+Ingredient references by id or by name, resolved in bulk.
+
+Recipes refer to their ingredients by id or by name. ``lookup`` finds the
+existing ingredients of a batch of references with a single ``IN`` query, and
+``create_names`` creates the missing names with a single ``bulk_create``, so a
+recipe costs the same few queries however many ingredients it has.
+
+The ingredients found are kept in ``ingredient_cache``, a bounded LRU cache
+keyed by both id and name, so hot ingredients cost no query at all. Entries are
+only added once their transaction commits; updating or deleting an ingredient
+drops them (see cookbook/signals.py), and other processes' changes are picked
+up once they expire.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from cookbook import autocomplete
+from cookbook.models import Ingredient
+
+
+class IngredientCache:
+    def __init__(self, ttl=300, max_size=20000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ref):
+        with self._lock:
+            entry = self._ids.get(ref)
+            if entry is None:
+                return None
+            expires_at, ingredient_id = entry
+            if self.clock() >= expires_at:
+                del self._ids[ref]
+                return None
+            self._ids.move_to_end(ref)
+            return ingredient_id
+
+    def set_many(self, ingredients):
+        """
+        Cache (id, name) pairs under both their id and their name.
+        """
+        with self._lock:
+            expires_at = self.clock() + self.ttl
+            for ingredient_id, name in ingredients:
+                for ref in (ingredient_id, name):
+                    self._ids[ref] = (expires_at, ingredient_id)
+                    self._ids.move_to_end(ref)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def invalidate(self, ingredient_id):
+        with self._lock:
+            # A renamed ingredient is still cached under its former name.
+            for ref in [
+                ref
+                for ref, (_, cached_id) in self._ids.items()
+                if cached_id == ingredient_id
+            ]:
+                del self._ids[ref]
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+_config = getattr(settings, "INGREDIENT_CACHE", {})
+ingredient_cache = IngredientCache(
+    ttl=_config.get("TTL", 300), max_size=_config.get("MAX_SIZE", 20000)
+)
+
+
+def _cache_on_commit(ingredients):
+    # Rows read or created in a transaction rolled back later must not be cached.
+    transaction.on_commit(lambda: ingredient_cache.set_many(ingredients))
+
+
+def lookup(refs):
+    """
+    Return a reference to id mapping of the existing ingredients among ``refs``,
+    ids (int) and names (str).
+    """
+    ids = {}
+    missing = []
+    for ref in dict.fromkeys(refs):
+        ingredient_id = ingredient_cache.get(ref)
+        if ingredient_id is None:
+            missing.append(ref)
+        else:
+            ids[ref] = ingredient_id
+
+    if missing:
+        found = list(
+            Ingredient.objects.filter(
+                Q(id__in=[ref for ref in missing if isinstance(ref, int)])
+                | Q(name__in=[ref for ref in missing if isinstance(ref, str)])
+            ).values_list("id", "name")
+        )
+        for ingredient_id, name in found:
+            ids[ingredient_id] = ingredient_id
+            ids[name] = ingredient_id
+        _cache_on_commit(found)
+    return {ref: ids[ref] for ref in refs if ref in ids}
+
+
+def create_names(names):
+    """
+    Create the ingredients named ``names`` that don't exist yet and return a name
+    to id mapping of all of them. Those which existed are indexed again, with
+    their current popularity.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    Ingredient.objects.bulk_create(
+        [Ingredient(name=name) for name in names], ignore_conflicts=True
+    )
+    created = list(
+        Ingredient.objects.filter(name__in=names).values_list(
+            "id", "name", "recipe_count"
+        )
+    )
+    _cache_on_commit([(ingredient_id, name) for ingredient_id, name, _ in created])
+    # bulk_create sends no post_save for the autocomplete index to follow, and
+    # names created in a transaction rolled back later must not be indexed.
+    transaction.on_commit(lambda: autocomplete.ingredient_index.add_many(created))
+    return {name: ingredient_id for ingredient_id, name, _ in created}
+
+
+def resolve_names(names):
+    """
+    Return a name to id mapping, creating the ingredients that don't exist yet.
+    """
+    ids = lookup(names)
+    ids.update(create_names([name for name in names if name not in ids]))
+    return ids
@@ -0,0 +1,133 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from cookbook.benchmarks import (
+    BenchmarkRunner,
+    compare,
+    default_scenarios,
+    uncovered_routes,
+)
+from cookbook.management.commands.email_verifier_stub import StubHunterServer
+from cookbook.models import Ingredient, Rating, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every API route in process and write latency percentiles, "
+        "throughput and query counts to a JSON file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--concurrency", type=int, default=1)
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            dest="scenarios",
+            help="Only run this scenario (repeatable).",
+        )
+        parser.add_argument(
+            "--response-cache",
+            action="store_true",
+            help="Keep the response cache on; it is off to measure the views.",
+        )
+        parser.add_argument("--output", help="Result file, timestamped by default.")
+        parser.add_argument("--baseline", help="Earlier result file to compare with.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="p95 slowdown over the baseline reported as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        scenarios = default_scenarios()
+        if options["scenarios"]:
+            unknown = set(options["scenarios"]) - {s.name for s in scenarios}
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}.")
+            scenarios = [s for s in scenarios if s.name in options["scenarios"]]
+        else:
+            for name in uncovered_routes(scenarios):
+                self.stderr.write(f"No scenario covers the {name!r} route.")
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)["results"]
+
+        verifier = StubHunterServer()
+        verifier.start()
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                EMAIL_VERIFICATION={
+                    **settings.EMAIL_VERIFICATION,
+                    "OPTIONS": {"base_url": verifier.base_url},
+                },
+                RESPONSE_CACHE={
+                    **settings.RESPONSE_CACHE,
+                    "ENABLED": options["response_cache"],
+                },
+            ):
+                runner = BenchmarkRunner(
+                    requests=options["requests"],
+                    warmup=options["warmup"],
+                    concurrency=options["concurrency"],
+                )
+                results = runner.run(scenarios, log=self.log)
+        finally:
+            verifier.stop()
+
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "options": {
+                name: options[name]
+                for name in ("requests", "warmup", "concurrency", "response_cache")
+            },
+            "dataset": {
+                "users": User.objects.count(),
+                "ingredients": Ingredient.objects.count(),
+                "recipes": Recipe.objects.count(),
+                "ratings": Rating.objects.count(),
+            },
+            "results": results,
+        }
+        output = options["output"] or (f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output}."))
+
+        if baseline is not None:
+            self.compare(results, baseline, options["threshold"])
+
+    def log(self, name, result):
+        self.stdout.write(
+            f"{name:<30} p50 {result['p50_ms']:>8.1f} ms  "
+            f"p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+            f"{result['throughput_rps']:>7.1f} req/s  "
+            f"{result['queries_mean']:>5.1f} queries  {result['errors']} errors"
+        )
+
+    def compare(self, results, baseline, threshold):
+        regressions = []
+        for name, before, after, ratio, regressed in compare(
+            results, baseline, threshold
+        ):
+            line = f"{name:<30} p95 {before:>8.1f} -> {after:>8.1f} ms ({ratio:.2f}x)"
+            if regressed:
+                regressions.append(name)
+                line = self.style.ERROR(line + "  REGRESSION")
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(f"{len(regressions)} scenarios regressed.")
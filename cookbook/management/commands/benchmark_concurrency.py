@@ -0,0 +1,108 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from cookbook.benchmarks import ASYNC_ROUTES, ConcurrencyBenchmark
+from cookbook.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the list views to a growing number of concurrent slow clients, "
+        "under WSGI and, through their async versions, under ASGI, and write "
+        "the results to a JSON file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clients",
+            type=int,
+            nargs="+",
+            default=[1, 8, 32, 128],
+            help="Numbers of concurrent clients to try.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=10, help="Requests sent by each client."
+        )
+        parser.add_argument(
+            "--workers", type=int, default=8, help="Threads of the WSGI server."
+        )
+        parser.add_argument(
+            "--client-delay",
+            type=float,
+            default=0.05,
+            help="Seconds each client takes to receive a response.",
+        )
+        parser.add_argument(
+            "--route",
+            action="append",
+            dest="routes",
+            help="Only run this route (repeatable).",
+        )
+        parser.add_argument(
+            "--no-response-cache",
+            action="store_true",
+            help="Turn the response cache off, so that every request is served "
+            "by the sync view.",
+        )
+        parser.add_argument("--output", help="Result file, timestamped by default.")
+
+    def handle(self, *args, **options):
+        routes = ASYNC_ROUTES
+        if options["routes"]:
+            unknown = set(options["routes"]) - {name for name, *_ in routes}
+            if unknown:
+                raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}.")
+            routes = [route for route in routes if route[0] in options["routes"]]
+
+        benchmark = ConcurrencyBenchmark(
+            clients=options["clients"],
+            requests=options["requests"],
+            workers=options["workers"],
+            client_delay=options["client_delay"],
+        )
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, benchmark.host],
+            RESPONSE_CACHE={
+                **settings.RESPONSE_CACHE,
+                "ENABLED": not options["no_response_cache"],
+            },
+        ):
+            results = benchmark.run(routes, log=self.log)
+
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "options": {
+                name: options[name]
+                for name in (
+                    "clients",
+                    "requests",
+                    "workers",
+                    "client_delay",
+                    "no_response_cache",
+                )
+            },
+            "dataset": {"recipes": Recipe.objects.count()},
+            "results": results,
+        }
+        output = options["output"] or (
+            f"concurrency-{datetime.now():%Y%m%d-%H%M%S}.json"
+        )
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output}."))
+
+    def log(self, name, server, clients, result):
+        self.stdout.write(
+            f"{name:<16} {server} {clients:>4} clients  "
+            f"p50 {result['p50_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+            f"{result['throughput_rps']:>7.1f} req/s  "
+            f"{result['peak_threads']:>4} threads  {result['errors']} errors"
+        )
@@ -0,0 +1,97 @@
+import json
+import logging
+import platform
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from cookbook.benchmarks import ReadWriteBenchmark
+from cookbook.models import Rating, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "List recipes and rate recipes concurrently for a while and write "
+        "throughput, latency and errors of both to a JSON file. Run it under "
+        "each DATABASE_PROFILE and compare with --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Seconds to run for."
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=10, help="Ratings per write."
+        )
+        parser.add_argument("--output", help="Result file, timestamped by default.")
+        parser.add_argument("--baseline", help="Earlier result file to compare with.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        benchmark = ReadWriteBenchmark(
+            readers=options["readers"],
+            writers=options["writers"],
+            duration=options["duration"],
+            batch_size=options["batch_size"],
+        )
+        # Failed requests are counted in the results rather than logged.
+        request_logger = logging.getLogger("django.request")
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, benchmark.host],
+                # Reads have to reach the database.
+                RESPONSE_CACHE={**settings.RESPONSE_CACHE, "ENABLED": False},
+            ):
+                results = benchmark.run()
+        finally:
+            request_logger.setLevel(level)
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "profile": settings.DATABASE_PROFILE,
+            "journal_mode": journal_mode,
+            "options": {
+                name: options[name]
+                for name in ("readers", "writers", "duration", "batch_size")
+            },
+            "dataset": {
+                "recipes": Recipe.objects.count(),
+                "ratings": Rating.objects.count(),
+            },
+            "results": results,
+        }
+        output = options["output"] or (
+            f"database-{settings.DATABASE_PROFILE}-{datetime.now():%Y%m%d-%H%M%S}.json"
+        )
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        for kind, result in results.items():
+            self.log(f"{report['profile']} {kind}", result)
+        if baseline is not None:
+            for kind, result in baseline["results"].items():
+                self.log(f"{baseline['profile']} {kind} (baseline)", result)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output}."))
+
+    def log(self, name, result):
+        self.stdout.write(
+            f"{name:<32} {result['throughput_rps']:>7.1f} req/s  "
+            f"p50 {result['p50_ms']:>8.1f} ms  p95 {result['p95_ms']:>8.1f} ms  "
+            f"p99 {result['p99_ms']:>8.1f} ms  {result['errors']} errors"
+        )
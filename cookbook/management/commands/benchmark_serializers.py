@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from cookbook.models import Ingredient, Recipe
+from cookbook.serializers import (
+    IngredientListSerializer,
+    IngredientListValuesSerializer,
+    RecipeListSerializer,
+    RecipeListValuesSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the rows per second of the list serializers and their values() "
+        "equivalents, queries and JSON rendering included."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        recipes = Recipe.objects.order_by("-id")[:rows]
+        ingredients = Ingredient.objects.order_by("id")[:rows]
+
+        for label, model_path, values_path in [
+            (
+                "recipes",
+                lambda: RecipeListSerializer(
+                    recipes.prefetch_related("ingredients"), many=True
+                ).data,
+                lambda: RecipeListValuesSerializer(
+                    list(RecipeListValuesSerializer.values(recipes))
+                ).data,
+            ),
+            (
+                "ingredients",
+                lambda: IngredientListSerializer(ingredients, many=True).data,
+                lambda: IngredientListValuesSerializer(
+                    IngredientListValuesSerializer.values(ingredients)
+                ).data,
+            ),
+        ]:
+            count = len(values_path())
+            if not count:
+                raise CommandError(f"No {label} to serialize, seed the database first.")
+
+            model_rate, model_json = self.measure(model_path, count, repeat)
+            values_rate, values_json = self.measure(values_path, count, repeat)
+            if model_json != values_json:
+                raise CommandError(f"The {label} serializers disagree.")
+
+            self.stdout.write(
+                f"{label} ({count} rows): ModelSerializer {model_rate:,.0f} rows/s, "
+                f"ValuesSerializer {values_rate:,.0f} rows/s "
+                f"({values_rate / model_rate:.1f}x)"
+            )
+
+    def measure(self, serialize, count, repeat):
+        """
+        Return the best rows per second over ``repeat`` runs, and the JSON.
+        """
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            content = JSONRenderer().render(serialize())
+            best = min(best, time.perf_counter() - start)
+        return count / best, content
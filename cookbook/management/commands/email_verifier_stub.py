@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+
+from cookbook.email_verification import INVALID, VALID
+
+
+class StubHunterHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        email = parse_qs(url.query).get("email", [""])[0]
+        domain = email.rpartition("@")[2].lower()
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        if not url.path.endswith("/email-verifier") or self.server.failing:
+            status_code, body = 503, {"errors": [{"details": "Unavailable"}]}
+        else:
+            invalid = domain in self.server.invalid_domains
+            status_code = 200
+            body = {
+                "data": {
+                    "email": email,
+                    "status": INVALID if invalid else VALID,
+                    "mx_records": not invalid,
+                }
+            }
+
+        self.server.requests_count += 1
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        try:
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, as it should when ``delay`` is too long.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubHunterServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Hunter email-verifier API, for tests and load runs.
+
+    Addresses at ``invalid_domains`` are reported invalid, everything else valid.
+    ``delay`` slows every response down and ``failing`` makes it answer 503.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), invalid_domains=(), delay=0):
+        super().__init__(address, StubHunterHandler)
+        self.invalid_domains = {domain.lower() for domain in invalid_domains}
+        self.delay = delay
+        self.failing = False
+        self.requests_count = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v2"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local stand-in for the Hunter email-verifier API. "
+        "Point HUNTER_API_URL at the printed URL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8025)
+        parser.add_argument(
+            "--invalid-domain",
+            action="append",
+            default=[],
+            dest="invalid_domains",
+            help="Report addresses at this domain as invalid (repeatable).",
+        )
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=0,
+            help="Seconds to wait before every response.",
+        )
+
+    def handle(self, *args, **options):
+        server = StubHunterServer(
+            (options["host"], options["port"]),
+            invalid_domains=options["invalid_domains"],
+            delay=options["delay"],
+        )
+        self.stdout.write(f"Stub email verifier listening on {server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
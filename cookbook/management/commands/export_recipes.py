@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from cookbook.exporters import FORMATS, JSON, NDJSON, export
+
+
+class Command(BaseCommand):
+    help = "Export every recipe as NDJSON or a JSON array ('-' writes standard output)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            dest="export_format",
+            help="Output format, guessed from the file extension by default.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        export_format = options["export_format"] or (
+            JSON if path.lower().endswith(".json") else NDJSON
+        )
+
+        pieces = export(export_format, chunk_size=options["chunk_size"])
+        if path == "-":
+            for piece in pieces:
+                self.stdout.write(piece, ending="")
+        else:
+            with open(path, "w", encoding="utf-8") as stream:
+                stream.writelines(pieces)
+            self.stdout.write(self.style.SUCCESS(f"Exported recipes to {path}."))
@@ -0,0 +1,51 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from cookbook.importers import CSV, FORMATS, NDJSON, READERS, RecipeImporter
+
+
+class Command(BaseCommand):
+    help = "Import recipes from an NDJSON or CSV file ('-' reads standard input)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--author", required=True, help="Username of the author.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            dest="import_format",
+            help="Input format, guessed from the file extension by default.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options["author"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['author']!r} does not exist.")
+
+        path = options["path"]
+        import_format = options["import_format"] or (
+            CSV if path.lower().endswith(".csv") else NDJSON
+        )
+
+        importer = RecipeImporter(author, batch_size=options["batch_size"])
+        # Read as bytes, for the readers to report undecodable lines as errors.
+        if path == "-":
+            report = importer.run(READERS[import_format](sys.stdin.buffer))
+        else:
+            with open(path, "rb") as stream:
+                report = importer.run(READERS[import_format](stream))
+
+        for error in report.errors:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        if report.failed > len(report.errors):
+            self.stderr.write(f"... {report.failed - len(report.errors)} more errors.")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report.created} recipes, {report.failed} rows failed."
+            )
+        )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from cookbook import response_cache
+from cookbook.models import Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored recipe count of every ingredient and ingredient "
+        "count of every recipe."
+    )
+
+    def handle(self, *args, **options):
+        ingredients = Ingredient.objects.all().refresh_recipe_counts()
+        recipes = Recipe.objects.all().refresh_ingredient_counts()
+        response_cache.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt recipe counts for {ingredients} ingredients and "
+                f"ingredient counts for {recipes} recipes."
+            )
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from cookbook import response_cache
+from cookbook.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored rating aggregates and ranking scores of every recipe."
+
+    def handle(self, *args, **options):
+        updated = Recipe.objects.all().refresh_rating_aggregates()
+        response_cache.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} recipes.")
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from cookbook import response_cache, search
+
+
+class Command(BaseCommand):
+    help = "Reindex every recipe in the full-text search index."
+
+    def handle(self, *args, **options):
+        search.rebuild(connection)
+        response_cache.invalidate()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the recipe search index."))
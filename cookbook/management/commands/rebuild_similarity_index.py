@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from cookbook import response_cache, similarity
+
+
+class Command(BaseCommand):
+    help = "Reindex every recipe in the similar recipes index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        indexed = similarity.rebuild(options["batch_size"])
+        response_cache.invalidate()
+        engine = "NumPy" if similarity.np is not None else "pure Python"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt the similarity index of {indexed} recipes ({engine})."
+            )
+        )
@@ -0,0 +1,342 @@
+"""
+Per-request timing and SQL instrumentation.
+
+``MetricsMiddleware`` times every request and, through a database execute
+wrapper installed on every connection, counts its queries and their time. Code
+can time more sections with ``timed(name)``; the list views and the JSON
+renderer report a ``serialize`` section this way. Each request gets a
+``Server-Timing`` header, and per-view aggregates are exposed in the Prometheus
+text format at ``/metrics``, to the bearer of ``settings.METRICS["TOKEN"]``
+only: without a token the endpoint is closed.
+
+Requests slower than ``settings.METRICS["SLOW_REQUEST_THRESHOLD"]`` seconds are
+logged to ``cookbook.metrics`` together with their SQL.
+
+The middleware is async-capable, so async views stay async under ASGI.
+
+Aggregates live in process memory: with several worker processes, each one
+exposes its own and the scraper has to reach every worker.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# Statements kept per request for the slow request log.
+MAX_LOGGED_QUERIES = 50
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+def get_config():
+    return getattr(settings, "METRICS", {})
+
+
+#################################################
+# Aggregates
+#################################################
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+    """
+    Per-view request aggregates, updated once per request.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)
+            self.durations = defaultdict(lambda: Histogram(self.buckets))
+            self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+            self.query_time = defaultdict(float)
+            self.sections = defaultdict(float)
+
+    def record(self, view, method, status, metrics):
+        with self._lock:
+            self.requests[view, method, str(status)] += 1
+            self.durations[view, method].observe(metrics.duration)
+            self.queries[view, method].observe(metrics.query_count)
+            self.query_time[view, method] += metrics.query_time
+            for section, seconds in metrics.sections.items():
+                self.sections[view, method, section] += seconds
+
+    def render(self):
+        """
+        Return the aggregates in the Prometheus text exposition format.
+        """
+        with self._lock:
+            lines = [
+                "# HELP cookbook_http_requests_total Requests by view, method and status.",
+                "# TYPE cookbook_http_requests_total counter",
+            ]
+            for (view, method, status), count in sorted(self.requests.items()):
+                labels = _labels(view=view, method=method, status=status)
+                lines.append(f"cookbook_http_requests_total{{{labels}}} {count}")
+
+            lines += _histogram(
+                "cookbook_http_request_duration_seconds",
+                "Request latency in seconds.",
+                self.durations,
+            )
+            lines += _histogram(
+                "cookbook_db_queries_per_request",
+                "Database queries per request.",
+                self.queries,
+            )
+
+            lines += [
+                "# HELP cookbook_db_query_seconds_total Time spent in database queries.",
+                "# TYPE cookbook_db_query_seconds_total counter",
+            ]
+            for (view, method), seconds in sorted(self.query_time.items()):
+                labels = _labels(view=view, method=method)
+                lines.append(f"cookbook_db_query_seconds_total{{{labels}}} {seconds}")
+
+            lines += [
+                "# HELP cookbook_section_seconds_total Time spent in timed sections.",
+                "# TYPE cookbook_section_seconds_total counter",
+            ]
+            for (view, method, section), seconds in sorted(self.sections.items()):
+                labels = _labels(view=view, method=method, section=section)
+                lines.append(f"cookbook_section_seconds_total{{{labels}}} {seconds}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(**labels):
+    return ",".join(
+        '{}="{}"'.format(
+            name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in labels.items()
+    )
+
+
+def _histogram(name, help_text, histograms):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (view, method), histogram in sorted(histograms.items()):
+        labels = _labels(view=view, method=method)
+        for bound, count in histogram.cumulative_counts():
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+registry = Registry()
+
+
+#################################################
+# Request instrumentation
+#################################################
+
+
+class RequestMetrics:
+    def __init__(self, capture_sql=False):
+        self.started = time.perf_counter()
+        self.duration = 0
+        self.query_count = 0
+        self.query_time = 0
+        self.sections = defaultdict(float)
+        self.statements = [] if capture_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        # See execute_wrapper and Django's "Database instrumentation".
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.query_time += elapsed
+            if (
+                self.statements is not None
+                and len(self.statements) < MAX_LOGGED_QUERIES
+            ):
+                self.statements.append((elapsed, sql))
+
+    def server_timing(self):
+        entries = [
+            f"app;dur={self.duration * 1000:.1f}",
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.query_count} queries"',
+        ]
+        entries += [
+            f"{section};dur={seconds * 1000:.1f}"
+            for section, seconds in self.sections.items()
+        ]
+        return ", ".join(entries)
+
+
+@contextmanager
+def timed(section):
+    """
+    Add the time spent in the block to ``section`` of the current request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.sections[section] += time.perf_counter() - start
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """
+    Database execute wrapper reporting to the current request, if any.
+
+    It is installed once on every connection, see ``instrument_connection``:
+    connections belong to threads, and under ASGI a request's queries run in
+    worker threads. The request's metrics follow it there in a context variable.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def instrument_connection(connection):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSON renderer reporting its time in the ``serialize`` section.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("serialize"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as async, like Django's MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        config = get_config()
+        if not config.get("ENABLED", True):
+            return self.get_response(request)
+
+        metrics = self.start(config)
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, config)
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config.get("ENABLED", True):
+            return await self.get_response(request)
+
+        metrics = self.start(config)
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, config)
+
+    def start(self, config):
+        threshold = config.get("SLOW_REQUEST_THRESHOLD")
+        return RequestMetrics(capture_sql=threshold is not None)
+
+    def finish(self, request, response, metrics, config):
+        metrics.duration = time.perf_counter() - metrics.started
+
+        match = getattr(request, "resolver_match", None)
+        # Unresolved paths share one label so that 404s can't flood the registry.
+        view = match.view_name if match else "unresolved"
+        registry.record(view, request.method, response.status_code, metrics)
+
+        if config.get("SERVER_TIMING", True):
+            response["Server-Timing"] = metrics.server_timing()
+        threshold = config.get("SLOW_REQUEST_THRESHOLD")
+        if threshold is not None and metrics.duration >= threshold:
+            self.log_slow_request(request, response, metrics)
+        return response
+
+    def log_slow_request(self, request, response, metrics):
+        statements = "\n".join(
+            f"  {elapsed * 1000:.1f} ms  {sql}" for elapsed, sql in metrics.statements
+        )
+        logger.warning(
+            "Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms\n%s",
+            request.method,
+            request.path,
+            response.status_code,
+            metrics.duration * 1000,
+            metrics.query_count,
+            metrics.query_time * 1000,
+            statements,
+        )
+
+
+def metrics_view(request):
+    """
+    Expose the aggregates to the bearer of ``METRICS["TOKEN"]``, to no one
+    while it is unset.
+    """
+    token = get_config().get("TOKEN")
+    if not token or not constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,45 @@
+# Generated by Django 4.0.4 on 2026-10-18 15:19
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Rating = apps.get_model('cookbook', 'Rating')
+    Recipe = apps.get_model('cookbook', 'Recipe')
+
+    ratings = Rating.objects.filter(recipe=OuterRef('pk')).values('recipe')
+    rating_count = Coalesce(Subquery(ratings.annotate(count=Count('id')).values('count')), 0)
+    rating_sum = Coalesce(Subquery(ratings.annotate(total=Sum('rate')).values('total')), 0)
+    Recipe.objects.update(
+        rating_count=rating_count,
+        rating_sum=rating_sum,
+        avg_rating=Coalesce(Cast(rating_sum, FloatField()) / NullIf(rating_count, 0), 0.0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0003_alter_rating_recipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='avg_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.0.4 on 2026-10-18 15:22
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_recipe_counts(apps, schema_editor):
+    Ingredient = apps.get_model('cookbook', 'Ingredient')
+    Recipe = apps.get_model('cookbook', 'Recipe')
+
+    recipes = Recipe.ingredients.through.objects.filter(ingredient=OuterRef('pk')).values('ingredient')
+    Ingredient.objects.update(
+        recipe_count=Coalesce(Subquery(recipes.annotate(count=Count('id')).values('count')), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0004_recipe_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='ingredient',
+            options={'ordering': ['id']},
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['-recipe_count', 'id'], name='ingredient_popularity_idx'),
+        ),
+        migrations.RunPython(backfill_recipe_counts, migrations.RunPython.noop),
+    ]
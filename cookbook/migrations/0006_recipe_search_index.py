@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-18 15:30
+
+import cookbook.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0005_ingredient_recipe_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchDocument',
+            fields=[
+                ('recipe', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='cookbook.recipe')),
+                ('document', cookbook.search.SearchDocumentField(db_column='cookbook_recipe_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'cookbook_recipe_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(cookbook.search.install, cookbook.search.uninstall),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.0.4 on 2026-10-18 16:22
+
+import cookbook.search
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_ingredient_counts(apps, schema_editor):
+    Recipe = apps.get_model('cookbook', 'Recipe')
+
+    links = Recipe.ingredients.through.objects.filter(recipe=OuterRef('pk')).values('recipe')
+    Recipe.objects.update(
+        ingredient_count=Coalesce(Subquery(links.annotate(count=Count('id')).values('count')), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0006_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['ingredient_count', 'id'], name='recipe_size_idx'),
+        ),
+        migrations.RunPython(backfill_ingredient_counts, migrations.RunPython.noop),
+        # Adding a column rebuilds the recipe table, which drops its triggers.
+        migrations.RunPython(cookbook.search.install_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-18 16:26
+
+import cookbook.similarity
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0007_recipe_ingredient_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_buckets', to='cookbook.recipe')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipebucket',
+            index=models.Index(fields=['key', 'recipe'], name='recipe_bucket_key_idx'),
+        ),
+        migrations.RunPython(cookbook.similarity.install, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.0.4 on 2026-10-18 16:40
+
+import cookbook.search
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast
+import django.db.models.deletion
+
+
+def backfill_bayesian_ratings(apps, schema_editor):
+    Recipe = apps.get_model('cookbook', 'Recipe')
+    RecipeIngredient = apps.get_model('cookbook', 'RecipeIngredient')
+    db_alias = schema_editor.connection.alias
+
+    # The formula of cookbook.models.bayesian_rating() as of this migration.
+    config = getattr(settings, 'TOP_RECIPES', {})
+    min_ratings = config.get('MIN_RATINGS', 5)
+    prior = min_ratings * config.get('PRIOR_MEAN', 3.0)
+    Recipe.objects.using(db_alias).filter(rating_count__gte=min_ratings).update(
+        bayesian_rating=(Cast(F('rating_sum'), FloatField()) + prior) / Cast(F('rating_count') + min_ratings, FloatField())
+    )
+    RecipeIngredient.objects.using(db_alias).update(
+        bayesian_rating=Subquery(Recipe.objects.using(db_alias).filter(pk=OuterRef('recipe')).values('bayesian_rating'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0008_recipebucket'),
+    ]
+
+    operations = [
+        # The implicit many-to-many table becomes the explicit RecipeIngredient.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='RecipeIngredient',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cookbook.ingredient')),
+                        ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cookbook.recipe')),
+                    ],
+                    options={
+                        'db_table': 'cookbook_recipe_ingredients',
+                        'unique_together': {('recipe', 'ingredient')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='recipe',
+                    name='ingredients',
+                    field=models.ManyToManyField(through='cookbook.RecipeIngredient', to='cookbook.ingredient'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='bayesian_rating',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipeingredient',
+            name='bayesian_rating',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['bayesian_rating', 'id'], name='recipe_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'bayesian_rating', 'id'], name='recipe_author_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(fields=['ingredient', 'bayesian_rating', 'recipe'], name='ingredient_top_recipes_idx'),
+        ),
+        migrations.RunPython(backfill_bayesian_ratings, migrations.RunPython.noop),
+        migrations.RunPython(cookbook.search.install_triggers, migrations.RunPython.noop),
+    ]
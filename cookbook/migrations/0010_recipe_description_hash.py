@@ -0,0 +1,43 @@
+# Generated by Django 4.0.4 on 2026-10-18 17:05
+
+import cookbook.models
+import cookbook.search
+from django.db import migrations, models
+
+
+def backfill_description_hashes(apps, schema_editor):
+    Recipe = apps.get_model('cookbook', 'Recipe')
+
+    connection = schema_editor.connection
+    update = 'UPDATE {} SET description_hash = %s WHERE id = %s'.format(Recipe._meta.db_table)
+    rows = Recipe.objects.values_list('description', 'id').iterator(chunk_size=5000)
+    with connection.cursor() as cursor:
+        cursor.executemany(update, [(cookbook.models.content_hash(description), pk) for description, pk in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0009_recipe_bayesian_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='description_hash',
+            field=cookbook.models.ContentHashField(null=True, source='description'),
+        ),
+        migrations.RunPython(backfill_description_hashes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recipe',
+            name='description_hash',
+            field=cookbook.models.ContentHashField(source='description', unique=True),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='description',
+            field=models.TextField(max_length=300),
+        ),
+        # Altering columns rebuilds the recipe table, which drops its triggers.
+        migrations.RunPython(cookbook.search.install_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0010_recipe_description_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['avg_rating', 'id'], name='recipe_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'ingredient_count', 'id'], name='recipe_author_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'avg_rating', 'id'], name='recipe_author_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.0.4 on 2026-10-18 19:12
+
+import cookbook.changes
+import cookbook.search
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cookbook', '0011_recipe_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='rating',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('owner_id', models.IntegerField(null=True)),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+            options={
+                'unique_together': {('model', 'object_id')},
+            },
+        ),
+        # Adding the columns rebuilds the recipe table, which drops its triggers.
+        migrations.RunPython(cookbook.search.install_triggers, migrations.RunPython.noop),
+        migrations.RunPython(cookbook.changes.install, cookbook.changes.uninstall),
+    ]
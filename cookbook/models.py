@@ -1,46 +1,525 @@
-from django.db import models
+import hashlib
+
+from django.conf import settings
+from django.db import connections, models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.core.exceptions import ValidationError
-from django.db.models import Count
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from cookbook import response_cache
+from cookbook.search import FTS_TABLE, SearchDocumentField, match_expression, tokenize
+
+
+def get_ranking_config():
+    return getattr(settings, "TOP_RECIPES", {})
+
+
+def bayesian_rating(rating_count, rating_sum):
+    """
+    Return the Bayesian average of a recipe's rates, as if ``MIN_RATINGS`` more
+    ratings of ``PRIOR_MEAN`` had been given, or None below ``MIN_RATINGS``.
+    """
+    config = get_ranking_config()
+    min_ratings = config.get("MIN_RATINGS", 5)
+    if rating_count < min_ratings:
+        return None
+    prior = min_ratings * config.get("PRIOR_MEAN", 3.0)
+    return (rating_sum + prior) / (rating_count + min_ratings)
+
+
+def rating_aggregates(rating_count, rating_sum):
+    """
+    Return the stored rating columns for the given count and sum expressions.
+    """
+    config = get_ranking_config()
+    min_ratings = config.get("MIN_RATINGS", 5)
+    prior = min_ratings * config.get("PRIOR_MEAN", 3.0)
+    return {
+        "rating_count": rating_count,
+        "rating_sum": rating_sum,
+        "avg_rating": Coalesce(
+            Cast(rating_sum, FloatField()) / NullIf(rating_count, 0), 0.0
+        ),
+        "bayesian_rating": Case(
+            When(
+                GreaterThanOrEqual(rating_count, Value(min_ratings)),
+                then=(Cast(rating_sum, FloatField()) + prior)
+                / Cast(rating_count + min_ratings, FloatField()),
+            ),
+            default=None,
+            output_field=FloatField(),
+        ),
+    }
+
+
+def content_hash(text):
+    """
+    Return the SHA-256 digest of ``text``, the key of its uniqueness index.
+    """
+    return hashlib.sha256(text.encode()).digest()
+
+
+class ContentHashField(models.BinaryField):
+    """
+    The ``content_hash`` of the ``source`` field, set whenever the row is saved.
+
+    Also set by ``bulk_create``, but not by ``update()`` or ``bulk_update()``.
+    """
+
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        kwargs["max_length"] = hashlib.sha256().digest_size
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["source"] = self.source
+        del kwargs["max_length"]
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = content_hash(getattr(model_instance, self.source))
+        setattr(model_instance, self.attname, value)
+        return value
 
 
 class IngredientQuerySet(models.QuerySet):
-    def top_ingredients(self):
-        return self.annotate(recipe_count=Count("recipe")).order_by("-recipe_count")[:5]
+    def top_ingredients(self, limit=5):
+        return self.order_by("-recipe_count", "id")[:limit]
+
+    def refresh_recipe_counts(self):
+        """
+        Recompute the stored recipe counts from the recipe-ingredient table.
+        """
+        recipes = Recipe.ingredients.through.objects.filter(
+            ingredient=OuterRef("pk")
+        ).values("ingredient")
+        return self.update(
+            recipe_count=Coalesce(
+                Subquery(recipes.annotate(count=Count("id")).values("count")), 0
+            )
+        )
 
 
 class Ingredient(models.Model):
     name = models.CharField(max_length=50, unique=True)
 
+    # Number of recipes using the ingredient, kept current by the m2m signals.
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Last change of the name. The recipe count is not part of the synced
+    # representation, so updates of it leave this alone (see cookbook/changes.py).
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
     objects = IngredientQuerySet.as_manager()
 
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["-recipe_count", "id"], name="ingredient_popularity_idx"
+            )
+        ]
+
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    MATCH_ALL = "all"
+    MATCH_ANY = "any"
+    MATCH_PANTRY = "pantry"
+    MATCH_MODES = (MATCH_ALL, MATCH_ANY, MATCH_PANTRY)
+
+    def match_ingredients(self, ingredient_ids, mode=MATCH_ANY, max_missing=0):
+        """
+        Match recipes against a set of ingredients, best matches first.
+
+        ``all`` keeps the recipes containing every ingredient, ``any`` those
+        containing at least one and ``pantry`` those needing at most ``max_missing``
+        ingredients outside the set. Recipes are annotated with their ``matched``
+        and ``missing`` ingredient counts.
+
+        Only the recipe-ingredient rows of the given ingredients are scanned, through
+        the ingredient index of the link table, so the cost follows the size of
+        their posting lists rather than the size of the catalog. The recipes' own
+        sizes come from their stored ``ingredient_count``, whose index also finds
+        the recipes small enough to be ``pantry`` matches with none of the
+        ingredients.
+        """
+        ingredient_ids = set(ingredient_ids)
+        if not ingredient_ids:
+            return self.none()
+
+        if mode == self.MATCH_PANTRY and max_missing > 0:
+            # Recipes of at most max_missing ingredients match whatever they
+            # contain, so they are read through the size index too.
+            matched = Count("ingredients", filter=Q(ingredients__in=ingredient_ids))
+            candidates = (
+                RecipeIngredient.objects.filter(ingredient_id__in=ingredient_ids)
+                .values("recipe_id")
+                .union(
+                    Recipe.objects.filter(ingredient_count__lte=max_missing).values(
+                        "id"
+                    )
+                )
+            )
+            queryset = self.filter(pk__in=candidates)
+        else:
+            matched = Count("ingredients")
+            queryset = self.filter(ingredients__in=ingredient_ids)
+        queryset = queryset.annotate(
+            matched=matched, missing=F("ingredient_count") - matched
+        )
+
+        if mode == self.MATCH_ALL:
+            return queryset.filter(matched=len(ingredient_ids)).order_by(
+                "missing", "id"
+            )
+        if mode == self.MATCH_PANTRY:
+            return queryset.filter(missing__lte=max_missing).order_by(
+                "missing", "-matched", "id"
+            )
+        return queryset.order_by("-matched", "missing", "id")
+
+    def apply_rating_delta(self, count_delta, sum_delta):
+        """
+        Shift the stored rating aggregates in a single UPDATE statement.
+        """
+        updated = self.update(
+            **rating_aggregates(
+                F("rating_count") + count_delta, F("rating_sum") + sum_delta
+            ),
+            updated_at=timezone.now(),
+        )
+        self.copy_ratings_to_links()
+        return updated
+
+    def copy_ratings_to_links(self):
+        """
+        Copy the recipes' Bayesian ratings onto their ingredient links, which the
+        per-ingredient rankings read.
+        """
+        return RecipeIngredient.objects.filter(recipe__in=self.values("pk")).update(
+            bayesian_rating=Subquery(
+                Recipe.objects.filter(pk=OuterRef("recipe")).values("bayesian_rating")
+            )
+        )
+
+    def search(self, query):
+        """
+        Return the recipes matching every term of ``query``, best matches first.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return self.none()
+
+        if connections[self.db].vendor != "sqlite":
+            # No FTS5 index outside SQLite: fall back to unranked substring matching.
+            queryset = self
+            for token in tokens:
+                queryset = queryset.filter(
+                    Q(name__icontains=token) | Q(description__icontains=token)
+                )
+            return queryset
+
+        return (
+            self.filter(search_document__document__match=match_expression(query))
+            .annotate(search_rank=F("search_document__rank"))
+            .order_by("search_rank", "id")
+        )
+
+    def refresh_ingredient_counts(self):
+        """
+        Recompute the stored ingredient counts from the recipe-ingredient table.
+        """
+        links = Recipe.ingredients.through.objects.filter(recipe=OuterRef("pk")).values(
+            "recipe"
+        )
+        return self.update(
+            ingredient_count=Coalesce(
+                Subquery(links.annotate(count=Count("id")).values("count")), 0
+            ),
+            updated_at=timezone.now(),
+        )
+
+    def refresh_rating_aggregates(self):
+        """
+        Recompute the stored rating aggregates from the ratings table.
+        """
+        ratings = Rating.objects.filter(recipe=OuterRef("pk")).values("recipe")
+        rating_count = Coalesce(
+            Subquery(ratings.annotate(count=Count("id")).values("count")), 0
+        )
+        rating_sum = Coalesce(
+            Subquery(ratings.annotate(total=Sum("rate")).values("total")), 0
+        )
+        updated = self.update(
+            **rating_aggregates(rating_count, rating_sum), updated_at=timezone.now()
+        )
+        self.copy_ratings_to_links()
+        return updated
+
+    def top_rated(self):
+        """
+        Return the recipes having a Bayesian rating, the best rated first.
+        """
+        return self.filter(bayesian_rating__isnull=False).order_by(
+            "-bayesian_rating", "-id"
+        )
+
+
 class Recipe(models.Model):
     name = models.CharField(max_length=100, unique=True)
-    description = models.TextField(max_length=300, unique=True)
-    ingredients = models.ManyToManyField(Ingredient)
+    description = models.TextField(max_length=300)
+    # Enforces the uniqueness of descriptions with a fixed-width index.
+    description_hash = ContentHashField(source="description", unique=True)
+    ingredients = models.ManyToManyField(Ingredient, through="RecipeIngredient")
     author = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    # Denormalized rating aggregates, kept current by the Rating signals.
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    avg_rating = models.FloatField(default=0, editable=False)
+    # Ranking score, see bayesian_rating().
+    bayesian_rating = models.FloatField(null=True, editable=False)
+
+    # Number of ingredients of the recipe, kept current by the m2m signals.
+    ingredient_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Last change of the recipe or of its stored aggregates, which bulk updates
+    # set explicitly: auto_now only applies to save().
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = RecipeQuerySet.as_manager()
+
+    # Written by the signals with F() expressions, never by saving an instance,
+    # which may have been loaded before the last change.
+    denormalized_fields = (
+        "rating_count",
+        "rating_sum",
+        "avg_rating",
+        "bayesian_rating",
+        "ingredient_count",
+    )
+
+    class Meta:
+        indexes = [
+            # Scanned in either direction for the ingredient count orderings.
+            models.Index(fields=["ingredient_count", "id"], name="recipe_size_idx"),
+            models.Index(fields=["bayesian_rating", "id"], name="recipe_top_idx"),
+            models.Index(
+                fields=["author", "bayesian_rating", "id"],
+                name="recipe_author_top_idx",
+            ),
+            # The orderings of the recipe list, alone and by author (see
+            # cookbook/filters.py). The author index serves the default order.
+            models.Index(fields=["avg_rating", "id"], name="recipe_rating_idx"),
+            models.Index(
+                fields=["author", "ingredient_count", "id"],
+                name="recipe_author_size_idx",
+            ),
+            models.Index(
+                fields=["author", "avg_rating", "id"],
+                name="recipe_author_rating_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
-    @property
-    def avg_rating(self):
-        ratings_list = list(self.ratings.values_list("rate", flat=True))
-        if len(ratings_list) > 0:
-            return sum(ratings_list) / len(ratings_list)
-        else:
-            return 0
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.denormalized_fields
+            ]
+        super().save(*args, **kwargs)
+
+    def validate_unique(self, exclude=None):
+        """
+        Also check the uniqueness of the description through its hash, which is
+        only set on save and which forms exclude as a non-editable field.
+        """
+        exclude = set(exclude or ())
+        errors = {}
+        try:
+            super().validate_unique(exclude=exclude | {"description_hash"})
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+
+        if "description" not in exclude and "description" not in errors:
+            duplicates = Recipe._default_manager.filter(
+                description_hash=content_hash(self.description)
+            )
+            if self.pk is not None:
+                duplicates = duplicates.exclude(pk=self.pk)
+            if duplicates.exists():
+                errors["description"] = [
+                    self.unique_error_message(Recipe, ["description"])
+                ]
+
+        if errors:
+            raise ValidationError(errors)
+
+    def apply_rating_delta(self, count_delta, sum_delta):
+        """
+        Mirror a stored aggregate change on this in-memory instance.
+        """
+        self.rating_count += count_delta
+        self.rating_sum += sum_delta
+        self.avg_rating = (
+            self.rating_sum / self.rating_count if self.rating_count > 0 else 0
+        )
+        self.bayesian_rating = bayesian_rating(self.rating_count, self.rating_sum)
+
+
+class RecipeIngredient(models.Model):
+    """
+    Link of a recipe to an ingredient, with a copy of the recipe's Bayesian
+    rating so that the best recipes of an ingredient are an index range.
+    """
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    bayesian_rating = models.FloatField(null=True, editable=False)
+
+    class Meta:
+        # The table of the former implicit many-to-many model.
+        db_table = "cookbook_recipe_ingredients"
+        unique_together = [["recipe", "ingredient"]]
+        indexes = [
+            models.Index(
+                fields=["ingredient", "bayesian_rating", "recipe"],
+                name="ingredient_top_recipes_idx",
+            )
+        ]
+
+
+class RecipeSearchDocument(models.Model):
+    """
+    Row of the full-text index over recipes, see cookbook/search.py.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name="search_document",
+    )
+    document = SearchDocumentField(db_column=FTS_TABLE)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
+
+class RecipeBucket(models.Model):
+    """
+    Row of the similarity index over recipe ingredients, see cookbook/similarity.py.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="similarity_buckets"
+    )
+    key = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            # Covers the posting list scans of the queries.
+            models.Index(fields=["key", "recipe"], name="recipe_bucket_key_idx")
+        ]
+
+
+class Change(models.Model):
+    """
+    Latest change of a synced row, or its tombstone, see cookbook/changes.py.
+    """
+
+    # Increases with every change, in commit order: the sync cursor.
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    # The user the row is private to, if any.
+    owner_id = models.IntegerField(null=True)
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = [["model", "object_id"]]
+
+
+class RatingQuerySet(models.QuerySet):
+    def upsert(self, ratings):
+        """
+        Insert the ratings, overwriting the rate of existing (user, recipe) pairs.
+
+        Bulk writes skip the Rating signals, so the recipe aggregates are refreshed
+        here for every recipe the ratings touch, and cached responses dropped.
+        """
+        with transaction.atomic(using=self.db):
+            features = connections[self.db].features
+            if getattr(features, "supports_update_conflicts_with_target", False):
+                self.bulk_create(
+                    ratings,
+                    update_conflicts=True,
+                    unique_fields=["user", "recipe"],
+                    update_fields=["rate", "updated_at"],
+                )
+            else:
+                # Django < 4.1 has no upsert: one lookup, one insert and one update.
+                existing = {
+                    (rating.user_id, rating.recipe_id): rating
+                    for rating in self.filter(
+                        user_id__in={rating.user_id for rating in ratings},
+                        recipe_id__in={rating.recipe_id for rating in ratings},
+                    )
+                }
+                updated = []
+                now = timezone.now()
+                for rating in ratings:
+                    current = existing.get((rating.user_id, rating.recipe_id))
+                    if current is not None:
+                        rating.pk = current.pk
+                        if current.rate != rating.rate:
+                            rating.updated_at = now
+                            updated.append(rating)
+
+                self.bulk_create([rating for rating in ratings if rating.pk is None])
+                self.bulk_update(updated, ["rate", "updated_at"])
+
+            Recipe.objects.filter(
+                pk__in={rating.recipe_id for rating in ratings}
+            ).refresh_rating_aggregates()
+            response_cache.invalidate()
+        return ratings
 
 
 class Rating(models.Model):
     rate = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="ratings")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = RatingQuerySet.as_manager()
 
     class Meta:
         unique_together = ["user", "recipe"]
@@ -51,8 +530,10 @@ class Rating(models.Model):
         super().clean(*args, **kwargs)
 
     def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
+        # Keep the insert and the recipe aggregate update in one transaction.
+        with transaction.atomic():
+            self.full_clean()
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Rating of {self.recipe} by {self.user}"
@@ -0,0 +1,180 @@
+import binascii
+import json
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from cookbook import db
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the queryset ordering instead of using OFFSET,
+    so every page costs the same as the first one.
+
+    The ordering is read from the queryset and always ends with the primary key,
+    which makes it total and the cursor position unambiguous.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    default_ordering = ("-id",)
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.reverse, position = self.decode_cursor(request)
+        self.position = position
+        if position is not None:
+            position = self.to_python(queryset, position)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [(field, not descending) for field, descending in ordering]
+        queryset = queryset.order_by(
+            *[("-" if descending else "") + field for field, descending in ordering]
+        )
+        if position is not None:
+            queryset = queryset.filter(self.seek(ordering, position))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, queryset):
+        """
+        Return the queryset ordering as (field, descending) pairs ending with "id".
+        """
+        ordering = []
+        for field in queryset.query.order_by or self.default_ordering:
+            descending = field.startswith("-")
+            field = field.lstrip("-")
+            ordering.append(("id" if field == "pk" else field, descending))
+
+        if "id" not in [field for field, _ in ordering]:
+            ordering.append(("id", ordering[-1][1] if ordering else True))
+        return ordering
+
+    def to_python(self, queryset, position):
+        """
+        Convert a decoded position to the types of its ordering fields, as a
+        forged cursor must not reach the query.
+        """
+        values = []
+        for (field, _), value in zip(self.ordering, position):
+            if field in queryset.query.annotations:
+                model_field = queryset.query.annotations[field].output_field
+            else:
+                try:
+                    model_field = queryset.model._meta.get_field(field)
+                except FieldDoesNotExist:
+                    raise NotFound(self.invalid_cursor_message)
+            try:
+                value = model_field.to_python(value)
+            except (ValidationError, TypeError, ValueError, OverflowError):
+                raise NotFound(self.invalid_cursor_message)
+            # The ordered columns are never null in the paginated lists, and
+            # SQLite can't compare them with values beyond its number types.
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            if isinstance(value, float) and not math.isfinite(value):
+                raise NotFound(self.invalid_cursor_message)
+            if isinstance(value, int) and abs(value) > db.MAX_INTEGER:
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def seek(self, ordering, position):
+        """
+        Build the filter selecting the rows strictly after ``position``.
+        """
+        condition = Q()
+        equal = Q()
+        for (field, descending), value in zip(ordering, position):
+            lookup = "lt" if descending else "gt"
+            condition |= equal & Q(**{f"{field}__{lookup}": value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return [item[field] for field, _ in self.ordering]
+        return [getattr(item, field) for field, _ in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        # An empty page, its rows deleted since the cursor was handed out,
+        # continues from the cursor position.
+        if not self.page:
+            return self.encode_cursor(False, self.position)
+        return self.encode_cursor(False, self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return self.encode_cursor(True, self.position)
+        return self.encode_cursor(True, self.get_position(self.page[0]))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return False, None
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            reverse, position = bool(cursor["r"]), list(cursor["p"])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    def encode_cursor(self, reverse, position):
+        cursor = json.dumps({"r": int(reverse), "p": position}, separators=(",", ":"))
+        encoded = urlsafe_b64encode(cursor.encode("ascii")).decode("ascii")
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
@@ -0,0 +1,173 @@
+"""
+Response cache for the read-heavy list endpoints.
+
+Rendered JSON responses are stored in ``settings.RESPONSE_CACHE["CACHE"]``, keyed
+by scheme, host, path, query string, negotiated media type and, for per-user
+views, the user. The scheme and host are part of the key as the pagination
+links are absolute URLs. The browsable API pages, which show the user whatever
+the view, are never cached.
+Every key also embeds a data version: the time of the last write to recipes,
+ingredients or ratings. Writes replace the version (see ``invalidate``), which
+orphans every entry at once; orphans simply expire.
+
+The version doubles as ``Last-Modified`` and a hash of the content is the
+``ETag``, so unchanged lists are answered with a 304 without touching the
+database. Concurrent misses on one key are single-flighted with a lock entry
+in the cache: one request renders, the others wait for its result.
+
+The local-memory backend only sees the writes of its own process; with several
+worker processes, point the cache at the file backend (or any shared backend).
+"""
+
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+VERSION_KEY = "responses:version"
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE.get("CACHE", "default")]
+
+
+def _bump_version():
+    get_cache().set(VERSION_KEY, time.time(), None)
+
+
+def invalidate():
+    """
+    Drop every cached response, now and again once the transaction commits.
+
+    The second bump discards responses rendered from the pre-commit data by
+    requests that raced with the write.
+    """
+    _bump_version()
+    transaction.on_commit(_bump_version)
+
+
+def get_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def cache_key(version, request, vary_on_user=False):
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    )
+    parts = [
+        request.scheme,
+        request.get_host(),
+        request.path,
+        urlencode(params),
+        request.accepted_media_type or "",
+        str(request.user.pk) if vary_on_user else "",
+    ]
+    digest = hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+    return f"responses:{version!r}:{digest}"
+
+
+def get_or_render(key, render):
+    """
+    Return the entry cached under ``key``, rendering it in at most one request.
+
+    Requests missing the entry while another one renders it poll the cache
+    until ``LOCK_TIMEOUT`` expires, then render it themselves.
+    """
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    config = settings.RESPONSE_CACHE
+    lock_key = f"{key}:lock"
+    lock_timeout = config.get("LOCK_TIMEOUT", 5)
+    deadline = time.monotonic() + lock_timeout
+
+    locked = cache.add(lock_key, 1, lock_timeout)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(config.get("POLL_INTERVAL", 0.01))
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        locked = cache.add(lock_key, 1, lock_timeout)
+
+    try:
+        entry = cache.get(key)
+        if entry is None:
+            entry = render()
+            cache.set(key, entry, config.get("TIMEOUT", 300))
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return entry
+
+
+def entry_response(request, entry):
+    """
+    Return the response serving ``entry``, or a 304 if the client has it.
+    """
+    response = HttpResponse(entry["content"], content_type=entry["content_type"])
+    response["ETag"] = entry["etag"]
+    response["Last-Modified"] = http_date(entry["last_modified"])
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(
+        request,
+        etag=entry["etag"],
+        last_modified=int(entry["last_modified"]),
+        response=response,
+    )
+
+
+class CachedResponseMixin:
+    """
+    Serve ``GET`` on a DRF view from the response cache, with conditional GET.
+
+    Only successful JSON responses are cached, errors are raised as usual. Set
+    ``cache_vary_on_user`` when the response depends on the user.
+    """
+
+    cache_vary_on_user = False
+    cached_formats = ("json",)
+
+    def get(self, request, *args, **kwargs):
+        if (
+            not settings.RESPONSE_CACHE.get("ENABLED", True)
+            or request.accepted_renderer.format not in self.cached_formats
+        ):
+            return super().get(request, *args, **kwargs)
+
+        version = get_version()
+        key = cache_key(version, request, self.cache_vary_on_user)
+        entry = get_or_render(
+            key, lambda: self.render_entry(version, request, *args, **kwargs)
+        )
+
+        return entry_response(request, entry)
+
+    def render_entry(self, version, request, *args, **kwargs):
+        # finalize_response pops the Vary header, which dispatch sets later on.
+        headers = dict(self.headers)
+        response = self.finalize_response(
+            request, super().get(request, *args, **kwargs), *args, **kwargs
+        )
+        self.headers = headers
+        response.render()
+        return {
+            "content": response.content,
+            "content_type": response["Content-Type"],
+            "etag": '"%s"' % hashlib.sha1(response.content).hexdigest(),
+            "last_modified": version,
+        }
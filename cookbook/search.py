@@ -0,0 +1,138 @@
+"""
+Full-text search over recipe names and descriptions.
+
+On SQLite the index is an FTS5 external-content table, ``cookbook_recipe_fts``,
+kept in sync with ``cookbook_recipe`` by triggers, so bulk writes are indexed too.
+Matches are ranked with BM25, weighting the name above the description, and
+every query term is matched as a prefix.
+
+SQLite drops a table's triggers when Django rebuilds the table during a
+migration, so migrations altering ``Recipe`` must run ``install_triggers`` again.
+"""
+import re
+
+from django.db import models
+
+FTS_TABLE = "cookbook_recipe_fts"
+CONTENT_TABLE = "cookbook_recipe"
+
+# BM25 column weights for (name, description).
+RANK_FUNCTION = "bm25(10.0, 1.0)"
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+CREATE_TABLE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name,
+        description,
+        content='{CONTENT_TABLE}',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', '{RANK_FUNCTION}')",
+]
+
+TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {CONTENT_TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {CONTENT_TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, description ON {CONTENT_TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def _execute(schema_editor, statements):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def install(apps, schema_editor):
+    """
+    Create the index and its triggers, then index the existing recipes.
+    """
+    _execute(schema_editor, CREATE_TABLE_SQL + TRIGGERS_SQL + [REBUILD_SQL])
+
+
+def install_triggers(apps, schema_editor):
+    """
+    Recreate the triggers after a migration has rebuilt the recipe table.
+    """
+    _execute(schema_editor, TRIGGERS_SQL)
+
+
+def uninstall(apps, schema_editor):
+    _execute(schema_editor, DROP_SQL)
+
+
+def rebuild(connection):
+    """
+    Reindex every recipe, e.g. after the triggers were missing for a while.
+    """
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(REBUILD_SQL)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query matching every term as a prefix.
+
+    Terms are quoted, so FTS5 operators in the input are matched literally.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class SearchDocumentField(models.TextField):
+    """
+    The hidden FTS5 column named after the table, the left operand of MATCH.
+    """
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
@@ -0,0 +1,270 @@
+"""
+Reproducible synthetic datasets for load tests and benchmarks.
+
+The same seed and sizes always produce the same users, ingredients, recipes and
+ratings. Ingredient popularity and the number of ratings per recipe follow Zipf
+distributions, so a few ingredients appear in most recipes and a few recipes
+collect most ratings, like in a real catalog.
+
+Rows are written with ``bulk_create`` in batches; the denormalized columns are
+then refreshed once for the whole dataset.
+"""
+
+import random
+from bisect import bisect
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from cookbook import response_cache, similarity
+from cookbook.models import Ingredient, Rating, Recipe
+
+SIZES = {
+    "small": {"users": 50, "ingredients": 200, "recipes": 1_000, "ratings": 5_000},
+    "medium": {
+        "users": 500,
+        "ingredients": 1_000,
+        "recipes": 50_000,
+        "ratings": 250_000,
+    },
+    "large": {
+        "users": 5_000,
+        "ingredients": 5_000,
+        "recipes": 1_000_000,
+        "ratings": 5_000_000,
+    },
+}
+
+USERNAME_PREFIX = "seed_user_"
+PASSWORD = "seed-password"
+
+# fmt: off
+BASE_INGREDIENTS = [
+    "salt", "olive oil", "garlic", "onion", "butter", "flour", "sugar", "egg",
+    "black pepper", "milk", "tomato", "lemon", "water", "parsley", "carrot",
+    "potato", "rice", "chicken", "cheese", "cream", "basil", "thyme", "honey",
+    "ginger", "paprika", "cumin", "beef", "pork", "salmon", "shrimp", "spinach",
+    "mushroom", "bell pepper", "zucchini", "eggplant", "chickpeas", "lentils",
+    "beans", "corn", "peas", "yogurt", "vinegar", "soy sauce", "chili", "cinnamon",
+    "vanilla", "chocolate", "almonds", "walnuts", "oats", "apple", "banana",
+    "orange", "lime", "coriander", "mint", "rosemary", "oregano", "bread", "pasta",
+]
+QUALIFIERS = [
+    "fresh", "dried", "smoked", "roasted", "ground", "red", "green", "wild",
+    "organic", "sweet", "spicy", "pickled",
+]
+DISHES = [
+    "soup", "salad", "stew", "curry", "pie", "cake", "bread", "risotto", "tart",
+    "pasta", "casserole", "stir-fry", "omelette", "gratin", "pancakes", "bowl",
+]
+STYLES = [
+    "Rustic", "Quick", "Classic", "Spicy", "Creamy", "Smoky", "Zesty", "Hearty",
+    "Light", "Crispy", "Golden", "Sunday",
+]
+# fmt: on
+
+# Likelihood of each rate, 1 to 5.
+RATE_WEIGHTS = [5, 10, 20, 35, 30]
+
+
+class Zipf:
+    """
+    Sample ranks in ``range(n)``, rank ``k`` with a weight of ``1 / (k + 1) ** s``.
+    """
+
+    def __init__(self, n, s, rng):
+        self.cum_weights = list(accumulate(1 / (k + 1) ** s for k in range(n)))
+        self.rng = rng
+
+    def sample(self):
+        return bisect(self.cum_weights, self.rng.random() * self.cum_weights[-1])
+
+    def sample_distinct(self, k):
+        k = min(k, len(self.cum_weights))
+        ranks = {}
+        while len(ranks) < k:
+            ranks[self.sample()] = None
+        return list(ranks)
+
+    def split(self, total, cap):
+        """
+        Spread ``total`` over the ranks in proportion to their weights, at most
+        ``cap`` each; what the cap cuts off goes to the next ranks.
+        """
+        weights = [
+            high - low for low, high in zip([0, *self.cum_weights], self.cum_weights)
+        ]
+        remaining_weight = self.cum_weights[-1]
+        counts = []
+        for weight in weights:
+            count = min(cap, round(total * weight / remaining_weight))
+            counts.append(count)
+            total -= count
+            remaining_weight -= weight
+        return counts
+
+
+def ingredient_name(i):
+    base = BASE_INGREDIENTS[i % len(BASE_INGREDIENTS)]
+    round_ = i // len(BASE_INGREDIENTS)
+    if round_ == 0:
+        return base
+    qualifier = QUALIFIERS[(round_ - 1) % len(QUALIFIERS)]
+    variant = (round_ - 1) // len(QUALIFIERS)
+    return f"{qualifier} {base}" + (f" {variant + 1}" if variant else "")
+
+
+class DatasetSeeder:
+    """
+    Write a dataset of the given sizes, generated from ``seed``, into an empty
+    catalog. Seed users and ingredients that already exist are reused.
+
+    ``zipf`` is the exponent of both distributions; 0 makes them uniform.
+    """
+
+    def __init__(
+        self,
+        users,
+        ingredients,
+        recipes,
+        ratings,
+        seed=42,
+        zipf=1.1,
+        batch_size=5000,
+        stdout=None,
+    ):
+        self.sizes = {
+            "users": max(users, 2),
+            "ingredients": max(ingredients, 1),
+            "recipes": recipes,
+            "ratings": ratings,
+        }
+        self.rng = random.Random(seed)
+        self.zipf = zipf
+        self.batch_size = batch_size
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def run(self):
+        user_ids = self.create_users()
+        ingredient_ids = self.create_ingredients()
+        recipe_ids = self.create_recipes(user_ids, ingredient_ids)
+        self.create_ratings(user_ids, recipe_ids)
+
+        self.log("Refreshing the denormalized columns...")
+        Ingredient.objects.refresh_recipe_counts()
+        Recipe.objects.refresh_ingredient_counts()
+        Recipe.objects.refresh_rating_aggregates()
+        self.log("Indexing recipe similarity...")
+        similarity.rebuild(self.batch_size)
+        response_cache.invalidate()
+
+    def bulk_create(self, model, objects, **kwargs):
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                return
+            with transaction.atomic():
+                model.objects.bulk_create(batch, **kwargs)
+
+    def create_users(self):
+        password = make_password(PASSWORD)
+        self.bulk_create(
+            User,
+            (
+                User(
+                    username=f"{USERNAME_PREFIX}{i}",
+                    email=f"{USERNAME_PREFIX}{i}@example.com",
+                    password=password,
+                )
+                for i in range(self.sizes["users"])
+            ),
+            ignore_conflicts=True,
+        )
+        self.log(f"Created {self.sizes['users']} users.")
+        return list(
+            User.objects.filter(username__startswith=USERNAME_PREFIX)
+            .order_by("id")
+            .values_list("id", flat=True)[: self.sizes["users"]]
+        )
+
+    def create_ingredients(self):
+        names = [ingredient_name(i) for i in range(self.sizes["ingredients"])]
+        self.bulk_create(
+            Ingredient, (Ingredient(name=name) for name in names), ignore_conflicts=True
+        )
+        self.log(f"Created {len(names)} ingredients.")
+
+        # Ids by popularity rank, "salt" being the most popular ingredient.
+        ids = dict(Ingredient.objects.filter(name__in=names).values_list("name", "id"))
+        return [ids[name] for name in names]
+
+    def create_recipes(self, user_ids, ingredient_ids):
+        popularity = Zipf(len(ingredient_ids), self.zipf, self.rng)
+        names = [ingredient_name(i) for i in range(len(ingredient_ids))]
+        RecipeIngredient = Recipe.ingredients.through
+
+        created = 0
+        while created < self.sizes["recipes"]:
+            count = min(self.batch_size, self.sizes["recipes"] - created)
+            recipes, links = [], []
+            for n in range(created, created + count):
+                ranks = popularity.sample_distinct(self.rng.randint(3, 12))
+                dish = self.rng.choice(DISHES)
+                ingredients = ", ".join(names[rank] for rank in ranks)
+                recipes.append(
+                    Recipe(
+                        name=f"{self.rng.choice(STYLES)} {names[ranks[0]]} {dish} #{n}",
+                        description=f"Recipe #{n}: a {dish} of {ingredients}."[:300],
+                        author_id=self.rng.choice(user_ids),
+                    )
+                )
+                links.append([ingredient_ids[rank] for rank in ranks])
+
+            with transaction.atomic():
+                recipes = Recipe.objects.bulk_create(recipes)
+                if any(recipe.pk is None for recipe in recipes):
+                    ids = dict(
+                        Recipe.objects.filter(
+                            name__in=[recipe.name for recipe in recipes]
+                        ).values_list("name", "id")
+                    )
+                    for recipe in recipes:
+                        recipe.pk = ids[recipe.name]
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(recipe_id=recipe.pk, ingredient_id=ingredient_id)
+                    for recipe, ingredient_ids_ in zip(recipes, links)
+                    for ingredient_id in ingredient_ids_
+                )
+            created += count
+            self.log(f"Created {created} recipes.")
+
+        return list(Recipe.objects.order_by("id").values_list("id", "author_id"))
+
+    def create_ratings(self, user_ids, recipes):
+        if not recipes:
+            return
+
+        # Shuffle so that the most rated recipes are spread over the catalog.
+        recipes = list(recipes)
+        self.rng.shuffle(recipes)
+        counts = Zipf(len(recipes), self.zipf, self.rng).split(
+            self.sizes["ratings"], cap=len(user_ids) - 1
+        )
+
+        def ratings():
+            for (recipe_id, author_id), count in zip(recipes, counts):
+                raters = self.rng.sample(user_ids, min(count + 1, len(user_ids)))
+                raters = [user_id for user_id in raters if user_id != author_id]
+                rates = self.rng.choices(range(1, 6), RATE_WEIGHTS, k=len(raters))
+                for user_id, rate in islice(zip(raters, rates), count):
+                    yield Rating(user_id=user_id, recipe_id=recipe_id, rate=rate)
+
+        self.bulk_create(Rating, ratings())
+        self.log(f"Created {Rating.objects.count()} ratings in total.")
@@ -3,9 +3,9 @@ from django.contrib.auth.models import User
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth.password_validation import validate_password
 
-from cookbook.models import Ingredient, Rating, Recipe
-import requests
-from decouple import config
+from cookbook import db, ingredients
+from cookbook.email_verification import INVALID, UNVERIFIED, get_verifier
+from cookbook.models import Ingredient, Rating, Recipe, content_hash
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -44,13 +44,14 @@ class RegisterSerializer(serializers.ModelSerializer):
             )
 
         # Chech the email's validity.
-        hunter_api_key = config("HUNTER_API_KEY")
-        response = requests.get(
-            f"https://api.hunter.io/v2/email-verifier?email={attrs['email']}&api_key={hunter_api_key }"
-        )
+        status = get_verifier().verify(attrs["email"])
 
-        if response.json()["data"]["status"] == "invalid":
+        if status == INVALID:
             raise serializers.ValidationError({"email": "Provided email is invalid."})
+        if status == UNVERIFIED:
+            raise serializers.ValidationError(
+                {"email": "Email could not be verified, please try again later."}
+            )
 
         return attrs
 
@@ -86,13 +87,45 @@ class UserSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class IngredientRefsField(serializers.ListField):
+    """
+    Ingredients by id or by name, all looked up at once. Strings of ASCII digits
+    are ids, as every value of a form is a string.
+
+    Validates to the ids of the existing ingredients and the names of those to
+    create, which ``RecipeSerializer.create`` creates in bulk.
+    """
+
+    child = serializers.CharField(
+        max_length=Ingredient._meta.get_field("name").max_length
+    )
+
+    def to_internal_value(self, data):
+        refs = [
+            int(ref) if ref.isascii() and ref.isdigit() else ref
+            for ref in super().to_internal_value(data)
+        ]
+        # Ids beyond SQLite's integer range name no ingredient, unqueried.
+        ids = ingredients.lookup(
+            [ref for ref in refs if not isinstance(ref, int) or ref <= db.MAX_INTEGER]
+        )
+        unknown = [ref for ref in refs if isinstance(ref, int) and ref not in ids]
+        if unknown:
+            raise serializers.ValidationError(
+                [f'Invalid pk "{ref}" - object does not exist.' for ref in unknown]
+            )
+        return list(dict.fromkeys(ids.get(ref, ref) for ref in refs))
+
+    def to_representation(self, value):
+        return [ingredient.pk for ingredient in value.all()]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     # ingredients = IngredientSerializer(many=True)
     author = serializers.PrimaryKeyRelatedField(many=False, queryset=User.objects.all())
-    ingredients = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Ingredient.objects.all()
-    )
-    avg_rating = serializers.IntegerField(required=False)
+    ingredients = IngredientRefsField()
+    # Read from the stored column, so listing recipes costs no rating queries.
+    avg_rating = serializers.IntegerField(read_only=True)
     extra_kwargs = {
         "ingredients": {"allow_empty": False},
         "avg_rating": {"allow_empty": True, "required": False},
@@ -103,6 +136,25 @@ class RecipeSerializer(serializers.ModelSerializer):
         # fields = "__all__"
         fields = ["name", "description", "ingredients", "author", "avg_rating"]
 
+    def validate_description(self, value):
+        # Looked up by hash, the index that enforces the uniqueness.
+        recipes = Recipe.objects.filter(description_hash=content_hash(value))
+        if self.instance is not None:
+            recipes = recipes.exclude(pk=self.instance.pk)
+        if recipes.exists():
+            raise serializers.ValidationError(
+                "recipe with this description already exists."
+            )
+        return value
+
+    def create(self, validated_data):
+        refs = validated_data["ingredients"]
+        ids = ingredients.create_names([ref for ref in refs if isinstance(ref, str)])
+        validated_data["ingredients"] = list(
+            dict.fromkeys(ids.get(ref, ref) for ref in refs)
+        )
+        return super().create(validated_data)
+
 
 class RecipeListSerializer(RecipeSerializer):
     ingredients = IngredientListSerializer(many=True, read_only=True)
@@ -117,3 +169,141 @@ class RatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Rating
         fields = ["recipe", "user", "rate"]
+
+
+class RatingBatchListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        ratings = super().to_internal_value(data)
+
+        # Validate the whole batch with one query instead of one per rating.
+        user = self.context["request"].user
+        recipe_ids = {rating["recipe_id"] for rating in ratings}
+        authors = dict(
+            Recipe.objects.filter(pk__in=recipe_ids).values_list("id", "author_id")
+        )
+
+        errors = []
+        seen = set()
+        for rating in ratings:
+            recipe_id = rating["recipe_id"]
+            if recipe_id not in authors:
+                errors.append(
+                    {"recipe": [f'Invalid pk "{recipe_id}" - object does not exist.']}
+                )
+            elif authors[recipe_id] == user.pk:
+                errors.append({"recipe": ["User cannot rate its own recipe!"]})
+            elif recipe_id in seen:
+                errors.append({"recipe": ["Recipe is rated more than once."]})
+            else:
+                errors.append({})
+            seen.add(recipe_id)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return ratings
+
+    def create(self, validated_data):
+        user = self.context["request"].user
+        return Rating.objects.upsert(
+            [Rating(user=user, **rating) for rating in validated_data]
+        )
+
+
+class RatingBatchSerializer(serializers.Serializer):
+    recipe = serializers.IntegerField(
+        source="recipe_id", min_value=1, max_value=db.MAX_INTEGER
+    )
+    rate = serializers.IntegerField(min_value=1, max_value=5)
+
+    class Meta:
+        list_serializer_class = RatingBatchListSerializer
+
+
+#################################################
+# Read-only serializers over values() rows
+#################################################
+
+
+class ValuesSerializer:
+    """
+    Read-only list serializer building its output from ``values()`` rows.
+
+    It skips DRF's per-instance field tree, so its JSON must stay byte-identical
+    to the matching ModelSerializer's; the equivalence tests keep them in sync.
+    """
+
+    fields = ()
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def values(cls, queryset):
+        """
+        Return the queryset's rows with the serialized and the ordering fields.
+        """
+        ordering = [
+            "id" if field == "pk" else field
+            for field in (field.lstrip("-") for field in queryset.query.order_by)
+        ]
+        fields = dict.fromkeys([*cls.fields, *ordering])
+        return queryset.prefetch_related(None).values(*fields)
+
+    @property
+    def data(self):
+        return [self.to_representation(row) for row in self.rows]
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+
+class IngredientListValuesSerializer(ValuesSerializer):
+    """
+    Same output as ``IngredientListSerializer``.
+    """
+
+    fields = ("name", "id")
+
+    def to_representation(self, row):
+        return {"name": row["name"], "id": row["id"]}
+
+
+class RecipeListValuesSerializer(ValuesSerializer):
+    """
+    Same output as ``RecipeListSerializer``, with one query for all ingredients.
+    """
+
+    fields = ("id", "name", "description", "author_id", "avg_rating")
+
+    @property
+    def data(self):
+        # Ordered like the prefetched ingredients, by ingredient id.
+        self.ingredients = {row["id"]: [] for row in self.rows}
+        links = (
+            Recipe.ingredients.through.objects.filter(recipe_id__in=self.ingredients)
+            .order_by("ingredient_id")
+            .values_list("recipe_id", "ingredient__name", "ingredient_id")
+        )
+        for recipe_id, name, ingredient_id in links:
+            self.ingredients[recipe_id].append({"name": name, "id": ingredient_id})
+        return super().data
+
+    def to_representation(self, row):
+        return {
+            "name": row["name"],
+            "description": row["description"],
+            "ingredients": self.ingredients[row["id"]],
+            "author": row["author_id"],
+            "avg_rating": int(row["avg_rating"]),
+        }
+
+
+class RatingValuesSerializer(ValuesSerializer):
+    """
+    Same output as ``RatingSerializer``.
+    """
+
+    fields = ("recipe_id", "rate")
+
+    def to_representation(self, row):
+        return {"recipe": row["recipe_id"], "rate": row["rate"]}
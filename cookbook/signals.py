@@ -0,0 +1,261 @@
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from cookbook import (
+    authentication,
+    autocomplete,
+    db,
+    ingredients,
+    metrics,
+    response_cache,
+    similarity,
+)
+from cookbook.models import Ingredient, Rating, Recipe
+
+RecipeIngredient = Recipe.ingredients.through
+
+
+def _apply_rating_delta(rating, count_delta, sum_delta, recipe_id=None):
+    recipe_id = recipe_id or rating.recipe_id
+    Recipe.objects.filter(pk=recipe_id).apply_rating_delta(count_delta, sum_delta)
+
+    # Keep an already loaded recipe in step with the stored columns.
+    if Rating.recipe.is_cached(rating) and rating.recipe.pk == recipe_id:
+        rating.recipe.apply_rating_delta(count_delta, sum_delta)
+
+
+#################################################
+# Rating aggregates
+#################################################
+
+
+@receiver(pre_save, sender=Rating)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = (
+            Rating.objects.filter(pk=instance.pk)
+            .values_list("recipe_id", "rate")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Rating)
+def add_rating_to_aggregates(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    previous = getattr(instance, "_previous_rating", None)
+    if previous is not None:
+        previous_recipe_id, previous_rate = previous
+        _apply_rating_delta(instance, -1, -previous_rate, previous_recipe_id)
+
+    _apply_rating_delta(instance, 1, instance.rate)
+
+
+@receiver(post_delete, sender=Rating)
+def remove_rating_from_aggregates(sender, instance, **kwargs):
+    _apply_rating_delta(instance, -1, -instance.rate)
+
+
+#################################################
+# Recipe ingredients
+#################################################
+
+
+def _ingredient_pairs(instance, reverse, pk_set):
+    """
+    Return the (recipe_id, ingredient_id) pairs an m2m change refers to.
+    """
+    if reverse:
+        return [(recipe_id, instance.pk) for recipe_id in pk_set]
+    return [(instance.pk, ingredient_id) for ingredient_id in pk_set]
+
+
+def _linked_pairs(instance, reverse, pk_set=None):
+    """
+    Return the (recipe_id, ingredient_id) pairs currently stored for an m2m change.
+    """
+    links = RecipeIngredient.objects.filter(
+        **{"ingredient_id" if reverse else "recipe_id": instance.pk}
+    )
+    if pk_set is not None:
+        links = links.filter(
+            **{"recipe_id__in" if reverse else "ingredient_id__in": pk_set}
+        )
+    return list(links.values_list("recipe_id", "ingredient_id"))
+
+
+def _shift_counts(queryset, field, deltas, **values):
+    """
+    Apply per-row deltas with one UPDATE per distinct delta value, setting the
+    other ``values`` too.
+    """
+    by_delta = {}
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(pk)
+    for delta, pks in by_delta.items():
+        queryset.filter(pk__in=pks).update(**{field: F(field) + delta}, **values)
+
+
+def ingredients_changed(pairs, sign):
+    """
+    Update the denormalized data depending on the given recipe-ingredient links.
+    """
+    recipe_deltas = Counter()
+    ingredient_deltas = Counter()
+    for recipe_id, ingredient_id in pairs:
+        recipe_deltas[recipe_id] += sign
+        ingredient_deltas[ingredient_id] += sign
+    _shift_counts(
+        Recipe.objects.all(),
+        "ingredient_count",
+        recipe_deltas,
+        updated_at=timezone.now(),
+    )
+    _shift_counts(Ingredient.objects.all(), "recipe_count", ingredient_deltas)
+    return recipe_deltas
+
+
+@receiver(m2m_changed, sender=RecipeIngredient)
+def recipe_ingredients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Removals are resolved before the rows go, so only existing links are counted.
+    if action == "pre_remove":
+        instance._removed_ingredient_pairs = _linked_pairs(instance, reverse, pk_set)
+        return
+    if action == "pre_clear":
+        instance._removed_ingredient_pairs = _linked_pairs(instance, reverse)
+        return
+
+    if action == "post_add":
+        pairs, sign = _ingredient_pairs(instance, reverse, pk_set), 1
+    elif action in ("post_remove", "post_clear"):
+        pairs, sign = instance.__dict__.pop("_removed_ingredient_pairs", []), -1
+    else:
+        return
+    recipe_deltas = ingredients_changed(pairs, sign)
+    similarity.index_recipes(recipe_deltas)
+    if action == "post_add":
+        Recipe.objects.filter(pk__in=recipe_deltas).copy_ratings_to_links()
+
+    # Keep a recipe changed from its own side in step with the stored column.
+    if not reverse:
+        instance.ingredient_count += recipe_deltas[instance.pk]
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_ingredients(sender, instance, **kwargs):
+    # The links are cascaded without m2m signals, so account for them up front.
+    ingredients_changed(_linked_pairs(instance, reverse=False), -1)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remove_ingredient_recipes(sender, instance, **kwargs):
+    # Cascaded without m2m signals too. The recipes are re-indexed once the links
+    # are gone.
+    recipe_deltas = ingredients_changed(_linked_pairs(instance, reverse=True), -1)
+    instance._unlinked_recipe_ids = list(recipe_deltas)
+
+
+@receiver(post_delete, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, **kwargs):
+    similarity.index_recipes(instance.__dict__.pop("_unlinked_recipe_ids", []))
+
+
+#################################################
+# Response cache
+#################################################
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Rating)
+def invalidate_responses(sender, raw=False, **kwargs):
+    if not raw:
+        response_cache.invalidate()
+
+
+@receiver(m2m_changed, sender=RecipeIngredient)
+def invalidate_responses_on_ingredients_change(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        response_cache.invalidate()
+
+
+#################################################
+# Ingredient autocomplete
+#################################################
+
+
+@receiver(post_save, sender=Ingredient)
+def index_ingredient(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.ingredient_index.ingredient_saved(instance)
+
+
+@receiver(post_delete, sender=Ingredient)
+def unindex_ingredient(sender, instance, **kwargs):
+    autocomplete.ingredient_index.ingredient_deleted(instance.pk)
+
+
+#################################################
+# Ingredient cache
+#################################################
+
+
+@receiver(post_save, sender=Ingredient)
+def invalidate_cached_ingredient(sender, instance, created, raw=False, **kwargs):
+    # A new ingredient has nothing cached yet.
+    if not created:
+        ingredients.ingredient_cache.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=Ingredient)
+def invalidate_deleted_ingredient(sender, instance, **kwargs):
+    ingredients.ingredient_cache.invalidate(instance.pk)
+
+
+#################################################
+# Authentication cache
+#################################################
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    authentication.invalidate_user(instance)
+
+
+#################################################
+# Request metrics
+#################################################
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    metrics.instrument_connection(connection)
+
+
+#################################################
+# Database tuning
+#################################################
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    db.configure_connection(connection)
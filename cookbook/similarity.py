@@ -0,0 +1,297 @@
+"""
+Similar recipes by ingredients, through MinHash signatures and an LSH index.
+
+The similarity of two recipes is the Jaccard index of their ingredient sets.
+Comparing a recipe with every other one costs a scan of the catalog, so each
+recipe gets a MinHash signature of ``NUM_HASHES`` values, one minimum per hash
+function over its ingredient ids: two signatures agree on a value with the
+probability of the Jaccard index. The signature is cut into ``NUM_BANDS`` bands
+of ``BAND_SIZE`` values, and every band is hashed into a bucket key stored in
+``RecipeBucket``. Recipes sharing a bucket are candidates; with 20 bands of 3,
+a pair at a similarity of 0.4 shares one with a probability of 0.73, at 0.6 of
+0.99.
+
+A query reads the posting lists of the recipe's keys from the index, at most
+``MAX_BUCKET_ROWS`` each, keeps the ``MAX_CANDIDATES`` recipes sharing the most
+buckets and ranks them by their exact Jaccard index, so its cost is bounded
+whatever the size of the catalog. Recipes sharing no bucket are never found.
+
+The m2m signals re-index recipes whose ingredients change. ``rebuild`` indexes
+the whole catalog, with NumPy when it is installed.
+"""
+
+import random
+from collections import defaultdict
+
+from django.apps import apps as global_apps
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+from cookbook.models import Recipe, RecipeBucket
+
+try:
+    import numpy as np
+except ImportError:  # Only bulk rebuilds use it.
+    np = None
+
+NUM_BANDS = 20
+BAND_SIZE = 3
+NUM_HASHES = NUM_BANDS * BAND_SIZE
+
+# Universal hashing of the ingredient ids, (a * id + b) % PRIME. The products stay
+# below 2 ** 63, so NumPy computes them in 64-bit integers.
+PRIME = 2**31 - 1
+_rng = random.Random(1979)
+COEFFICIENTS = [
+    (_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(NUM_HASHES)
+]
+
+# Candidates re-ranked by their exact similarity, per query.
+MAX_CANDIDATES = 200
+
+# Recipes read per bucket. The buckets of the most common ingredients hold a few
+# percent of the catalog, and reading them whole would dominate the queries.
+MAX_BUCKET_ROWS = 1000
+
+_MASK = 2**64 - 1
+
+RecipeIngredient = Recipe.ingredients.through
+
+
+def _mix(x):
+    # The splitmix64 finalizer, on unsigned 64-bit integers.
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def _signed(key):
+    # SQLite integers are signed.
+    return key - 2**64 if key >= 2**63 else key
+
+
+def signature(ingredient_ids):
+    """
+    Return the MinHash signature of a non-empty set of ingredient ids.
+    """
+    return [
+        min((a * ingredient_id + b) % PRIME for ingredient_id in ingredient_ids)
+        for a, b in COEFFICIENTS
+    ]
+
+
+def band_keys(signature):
+    """
+    Return the bucket key of every band of ``signature``.
+    """
+    keys = []
+    for band in range(NUM_BANDS):
+        key = _mix(band + 1)
+        for value in signature[band * BAND_SIZE : (band + 1) * BAND_SIZE]:
+            key = _mix(key ^ value)
+        keys.append(_signed(key))
+    return keys
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+#################################################
+# Index maintenance
+#################################################
+
+
+def _recipe_ingredients(recipe_ids):
+    ingredients = defaultdict(set)
+    links = RecipeIngredient.objects.filter(recipe_id__in=recipe_ids).values_list(
+        "recipe_id", "ingredient_id"
+    )
+    for recipe_id, ingredient_id in links:
+        ingredients[recipe_id].add(ingredient_id)
+    return ingredients
+
+
+def index_links(links):
+    """
+    Index new recipes from all their (recipe_id, ingredient_id) links.
+    """
+    RecipeBucket.objects.bulk_create(
+        [
+            RecipeBucket(recipe_id=recipe_id, key=key)
+            for recipe_id, key in compute_keys(list(links))
+        ]
+    )
+
+
+def index_recipes(recipe_ids):
+    """
+    Recompute the buckets of the given recipes from their current ingredients.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    links = list(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids).values_list(
+            "recipe_id", "ingredient_id"
+        )
+    )
+    RecipeBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+    index_links(links)
+
+
+def _keys_python(links):
+    ingredients = defaultdict(set)
+    for recipe_id, ingredient_id in links:
+        ingredients[recipe_id].add(ingredient_id)
+
+    # Hash each distinct ingredient once, then take the minimums per recipe.
+    hashes = {}
+    for ingredient_ids in ingredients.values():
+        for ingredient_id in ingredient_ids:
+            if ingredient_id not in hashes:
+                hashes[ingredient_id] = [
+                    (a * ingredient_id + b) % PRIME for a, b in COEFFICIENTS
+                ]
+    for recipe_id, ingredient_ids in ingredients.items():
+        minimums = [min(values) for values in zip(*(hashes[i] for i in ingredient_ids))]
+        for key in band_keys(minimums):
+            yield recipe_id, key
+
+
+def _keys_numpy(links):
+    if not links:
+        return []
+    links = np.array(links, dtype=np.uint64)
+    links = links[np.argsort(links[:, 0], kind="stable")]
+    recipe_ids, ingredient_ids = links[:, 0], links[:, 1]
+
+    a, b = np.array(COEFFICIENTS, dtype=np.uint64).T
+    hashes = (ingredient_ids[:, None] * a + b) % np.uint64(PRIME)
+    starts = np.flatnonzero(np.r_[True, recipe_ids[1:] != recipe_ids[:-1]])
+    signatures = np.minimum.reduceat(hashes, starts, axis=0)
+
+    keys = np.empty((len(starts), NUM_BANDS), dtype=np.uint64)
+    for band in range(NUM_BANDS):
+        key = np.full(len(starts), _mix(band + 1), dtype=np.uint64)
+        for column in range(band * BAND_SIZE, (band + 1) * BAND_SIZE):
+            key = _mix_array(key ^ signatures[:, column])
+        keys[:, band] = key
+
+    recipe_ids = np.repeat(recipe_ids[starts], NUM_BANDS)
+    return zip(recipe_ids.tolist(), keys.view(np.int64).ravel().tolist())
+
+
+def _mix_array(x):
+    # _mix on arrays, where the multiplications wrap around like the masking.
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def compute_keys(links):
+    """
+    Yield the (recipe_id, key) rows of the index for (recipe_id, ingredient_id)
+    links, vectorized when NumPy is installed.
+    """
+    return _keys_numpy(links) if np is not None else _keys_python(links)
+
+
+def rebuild(batch_size=5000, using=DEFAULT_DB_ALIAS, apps=global_apps):
+    """
+    Index every recipe from scratch and return the number of indexed recipes.
+
+    Migrations pass their historical ``apps`` and the alias they run on.
+    """
+    Recipe = apps.get_model("cookbook", "Recipe")
+    RecipeBucket = apps.get_model("cookbook", "RecipeBucket")
+    RecipeIngredient = Recipe.ingredients.through
+    connection = connections[using]
+
+    # bulk_create builds a model instance per row, and every recipe has
+    # NUM_BANDS rows: the rows go to executemany as plain tuples instead.
+    insert = "INSERT INTO {} (recipe_id, {}) VALUES (%s, %s)".format(
+        RecipeBucket._meta.db_table, connection.ops.quote_name("key")
+    )
+
+    RecipeBucket.objects.using(using).all().delete()
+    indexed, last_id = 0, 0
+    while True:
+        batch = list(
+            Recipe.objects.using(using)
+            .filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not batch:
+            return indexed
+        last_id = batch[-1]
+        links = list(
+            RecipeIngredient.objects.using(using)
+            .filter(recipe_id__gte=batch[0], recipe_id__lte=last_id)
+            .values_list("recipe_id", "ingredient_id")
+        )
+        rows = list(compute_keys(links))
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.executemany(insert, rows)
+        indexed += len(rows) // NUM_BANDS
+
+
+def install(apps, schema_editor):
+    """
+    Index the existing recipes once the index table is created.
+    """
+    rebuild(using=schema_editor.connection.alias, apps=apps)
+
+
+#################################################
+# Queries
+#################################################
+
+
+def similar_recipes(recipe_id, limit=10):
+    """
+    Return up to ``limit`` (recipe id, similarity) pairs for the recipes most
+    similar to the given one, most similar first.
+    """
+    ingredient_ids = set(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id).values_list(
+            "ingredient_id", flat=True
+        )
+    )
+    if not ingredient_ids:
+        return []
+
+    candidates = _candidates(recipe_id, band_keys(signature(ingredient_ids)))
+    scores = [
+        (candidate_id, jaccard(ingredient_ids, candidate_ingredients))
+        for candidate_id, candidate_ingredients in _recipe_ingredients(
+            candidates
+        ).items()
+    ]
+    scores.sort(key=lambda score: (-score[1], score[0]))
+    return scores[:limit]
+
+
+def _candidates(recipe_id, keys):
+    """
+    Return the ids of the recipes sharing the most buckets with the given one.
+
+    Each bucket is read up to ``MAX_BUCKET_ROWS`` recipes, the newest first,
+    through its own subquery: a ``LIMIT`` can't be set per key in an ``IN``.
+    """
+    using = router.db_for_read(RecipeBucket)
+    table = RecipeBucket._meta.db_table
+    key_column = connections[using].ops.quote_name("key")
+    buckets = " UNION ALL ".join(
+        f"SELECT * FROM (SELECT recipe_id FROM {table} WHERE {key_column} = %s "
+        f"ORDER BY recipe_id DESC LIMIT %s) AS bucket_{i}"
+        for i in range(len(keys))
+    )
+    sql = (
+        f"SELECT recipe_id FROM ({buckets}) AS buckets WHERE recipe_id <> %s "
+        "GROUP BY recipe_id ORDER BY COUNT(*) DESC, recipe_id LIMIT %s"
+    )
+    params = [param for key in keys for param in (key, MAX_BUCKET_ROWS)]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [*params, recipe_id, MAX_CANDIDATES])
+        return [candidate_id for candidate_id, in cursor.fetchall()]
@@ -1,9 +1,68 @@
-from django.test import TestCase
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.core.cache import caches
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.backends.sqlite3 import base as sqlite3_base
+from django.core.management import CommandError, call_command
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Ingredient, Recipe, Rating
+from .models import (
+    Change,
+    Ingredient,
+    Recipe,
+    RecipeBucket,
+    RecipeIngredient,
+    Rating,
+    content_hash,
+)
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from rest_framework.test import APITestCase, APIClient
+from django.db.models import Count, Sum
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from . import (
+    autocomplete,
+    benchmarks,
+    db,
+    exporters,
+    ingredients,
+    metrics,
+    response_cache,
+    similarity,
+    views,
+)
+from .backends.sqlite3 import base as cookbook_sqlite3_base
+from .email_verification import (
+    INVALID,
+    UNVERIFIED,
+    VALID,
+    CircuitBreaker,
+    get_verifier,
+    reset_verifier,
+)
+from .management.commands.email_verifier_stub import StubHunterServer
+from .importers import RecipeImporter, read_csv, read_ndjson
+from .authentication import CachedJWTAuthentication, UserCache, user_cache
+from .pagination import KeysetPagination
+from .seeding import DatasetSeeder
+from .serializers import (
+    IngredientSerializer,
+    RatingSerializer,
+    RatingValuesSerializer,
+)
 
 
 class CookbookTestCase(TestCase):
@@ -71,6 +130,91 @@ class IngredientQuerySetTestCase(CookbookTestCase):
             ],
         )
 
+    def test_top_ingredients_limit(self):
+        top_ingredients = Ingredient.objects.top_ingredients(limit=2)
+        self.assertEqual(
+            list(top_ingredients.values_list("name", flat=True)),
+            ["Ingredient 1", "Ingredient 2"],
+        )
+
+    def test_recipe_counts_follow_m2m_changes(self):
+        self.recipe_4.ingredients.add(self.ingred_4, self.ingred_1)
+        self.recipe_1.ingredients.remove(self.ingred_2, self.ingred_4)
+        self.ingred_5.recipe_set.remove(self.recipe_2)
+        self.recipe_3.ingredients.clear()
+        self.ingred_7.recipe_set.add(self.recipe_1, self.recipe_2)
+        self.recipe_6.delete()
+
+        stored = dict(Ingredient.objects.values_list("name", "recipe_count"))
+        expected = dict(
+            Ingredient.objects.annotate(count=Count("recipe")).values_list(
+                "name", "count"
+            )
+        )
+        self.assertEqual(stored, expected)
+        self.assertEqual(stored["Ingredient 1"], 5)
+
+        stored = dict(Recipe.objects.values_list("name", "ingredient_count"))
+        expected = dict(
+            Recipe.objects.annotate(count=Count("ingredients")).values_list(
+                "name", "count"
+            )
+        )
+        self.assertEqual(stored, expected)
+        self.assertEqual(stored[self.recipe_3.name], 0)
+
+    def test_deleting_an_ingredient_updates_its_recipes(self):
+        RecipeBucket.objects.all().delete()
+        updated_at = Recipe.objects.get(pk=self.recipe_2.pk).updated_at
+
+        self.ingred_5.delete()
+
+        recipe = Recipe.objects.get(pk=self.recipe_2.pk)
+        self.assertEqual(recipe.ingredient_count, 1)
+        self.assertGreater(recipe.updated_at, updated_at)
+        self.assertEqual(
+            set(
+                Recipe.objects.match_ingredients(
+                    [self.ingred_1.pk], "pantry"
+                ).values_list("name", flat=True)
+            ),
+            {"Recipe 2", "Recipe 7"},
+        )
+        # The recipes which lost the ingredient are re-indexed.
+        self.assertEqual(
+            set(RecipeBucket.objects.values_list("recipe_id", flat=True)),
+            {self.recipe_1.pk, self.recipe_2.pk, self.recipe_7.pk},
+        )
+
+    def test_ingredient_count_follows_loaded_recipe(self):
+        self.recipe_4.ingredients.add(self.ingred_4, self.ingred_7)
+        self.recipe_4.ingredients.remove(self.ingred_4)
+        stored = Recipe.objects.get(pk=self.recipe_4.pk).ingredient_count
+
+        self.assertEqual(self.recipe_4.ingredient_count, stored)
+        # Saving the loaded recipe keeps the stored count.
+        self.recipe_4.save()
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe_4.pk).ingredient_count, stored
+        )
+
+    def test_rebuild_ingredient_counts_command(self):
+        Ingredient.objects.update(recipe_count=0)
+        Recipe.objects.update(ingredient_count=0)
+        call_command("rebuild_ingredient_counts", stdout=StringIO())
+        self.assertEqual(
+            list(Ingredient.objects.values_list("recipe_count", flat=True)),
+            [6, 4, 2, 0, 3, 1, 0],
+        )
+        self.assertEqual(
+            dict(Recipe.objects.values_list("id", "ingredient_count")),
+            dict(
+                Recipe.objects.annotate(count=Count("ingredients")).values_list(
+                    "id", "count"
+                )
+            ),
+        )
+
 
 class RecipeTestCase(CookbookTestCase):
     def setUp(self):
@@ -104,12 +248,156 @@ class RecipeTestCase(CookbookTestCase):
     def test_avg_rating(self):
         self.assertEqual(self.recipe_1.avg_rating, 4)
 
+    def test_rating_aggregates_stored(self):
+        recipe = Recipe.objects.get(pk=self.recipe_1.pk)
+        self.assertEqual(recipe.rating_count, 2)
+        self.assertEqual(recipe.rating_sum, 8)
+        self.assertEqual(recipe.avg_rating, 4)
+
+    def test_rating_aggregates_follow_update_and_delete(self):
+        self.rating_2.rate = 1
+        self.rating_2.save()
+        recipe = Recipe.objects.get(pk=self.recipe_1.pk)
+        self.assertEqual((recipe.rating_count, recipe.rating_sum), (2, 4))
+        self.assertEqual(recipe.avg_rating, 2)
+
+        self.rating_3.delete()
+        Rating.objects.filter(pk=self.rating_2.pk).delete()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.rating_count, recipe.rating_sum), (0, 0))
+        self.assertEqual(recipe.avg_rating, 0)
+
+    def test_description_hash(self):
+        self.assertEqual(
+            bytes(Recipe.objects.get(pk=self.recipe_1.pk).description_hash),
+            content_hash("Description for Recipe 1"),
+        )
+
+        self.recipe_1.description = "Another description"
+        self.recipe_1.save()
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    name="Recipe 2",
+                    description="Description for Recipe 1",
+                    author=self.user_2,
+                )
+            ]
+        )
+        self.assertEqual(
+            sorted(
+                bytes(h)
+                for h in Recipe.objects.values_list("description_hash", flat=True)
+            ),
+            sorted(
+                [
+                    content_hash("Another description"),
+                    content_hash("Description for Recipe 1"),
+                ]
+            ),
+        )
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Recipe.objects.create(
+                name="Recipe 3", description="Another description", author=self.user_2
+            )
+
+    def test_saving_a_stale_recipe_keeps_the_aggregates(self):
+        stale = Recipe.objects.get(pk=self.recipe_1.pk)
+        user_4 = User.objects.create(
+            username="user 4", email="user_4@example.com", password="pass321"
+        )
+        Rating.objects.create(rate=1, user=user_4, recipe=self.recipe_1)
+        self.recipe_1.ingredients.add(Ingredient.objects.create(name="salt"))
+
+        stale.name = "Renamed recipe"
+        stale.save()
+
+        recipe = Recipe.objects.get(pk=self.recipe_1.pk)
+        self.assertEqual(recipe.name, "Renamed recipe")
+        self.assertEqual((recipe.rating_count, recipe.rating_sum), (3, 9))
+        self.assertEqual(recipe.avg_rating, 3)
+        self.assertEqual(recipe.ingredient_count, 1)
+
+    def test_full_clean_rejects_duplicate_descriptions(self):
+        recipe = Recipe(
+            name="Recipe 2", description="Description for Recipe 1", author=self.user_2
+        )
+        # Forms exclude the non-editable hash.
+        for exclude in [None, ["description_hash"]]:
+            with self.assertRaises(ValidationError) as e:
+                recipe.full_clean(exclude=exclude)
+            self.assertEqual(list(e.exception.message_dict), ["description"])
+
+        recipe.description = "Another description"
+        recipe.full_clean()
+        self.recipe_1.full_clean()
+
+    def test_rebuild_rating_aggregates_command(self):
+        Recipe.objects.update(rating_count=0, rating_sum=0, avg_rating=0)
+        call_command("rebuild_rating_aggregates", stdout=StringIO())
+        recipe = Recipe.objects.get(pk=self.recipe_1.pk)
+        self.assertEqual((recipe.rating_count, recipe.rating_sum), (2, 8))
+        self.assertEqual(recipe.avg_rating, 4)
+
+
+class RecipeAdminTestCase(CookbookTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.oil = Ingredient.objects.create(name="oil")
+        self.salt = Ingredient.objects.create(name="salt")
+        self.recipe_1.ingredients.add(self.oil)
+        self.change_url = reverse(
+            "admin:cookbook_recipe_change", args=[self.recipe_1.pk]
+        )
+
+        User.objects.create_superuser("admin", "admin@example.com", "password321")
+        self.client.login(username="admin", password="password321")
+
+    def test_change_form_lists_ingredients(self):
+        response = self.client.get(self.change_url)
+        self.assertContains(response, "recipeingredient_set-0-ingredient")
+
+    def test_ingredients_are_edited_through_the_m2m_signals(self):
+        link = RecipeIngredient.objects.get(recipe=self.recipe_1)
+        response = self.client.post(
+            self.change_url,
+            {
+                "name": self.recipe_1.name,
+                "description": self.recipe_1.description,
+                "author": self.user_1.pk,
+                "recipeingredient_set-TOTAL_FORMS": 2,
+                "recipeingredient_set-INITIAL_FORMS": 1,
+                "recipeingredient_set-0-id": link.pk,
+                "recipeingredient_set-0-recipe": self.recipe_1.pk,
+                "recipeingredient_set-0-ingredient": self.oil.pk,
+                "recipeingredient_set-0-DELETE": "on",
+                "recipeingredient_set-1-recipe": self.recipe_1.pk,
+                "recipeingredient_set-1-ingredient": self.salt.pk,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+
+        recipe = Recipe.objects.get(pk=self.recipe_1.pk)
+        self.assertEqual(list(recipe.ingredients.all()), [self.salt])
+        self.assertEqual(recipe.ingredient_count, 1)
+        self.assertEqual(
+            dict(Ingredient.objects.values_list("name", "recipe_count")),
+            {"oil": 0, "salt": 1},
+        )
+        self.assertTrue(RecipeBucket.objects.filter(recipe=recipe).exists())
+
 
 #########################################################################################
 # API tests
 #########################################################################################
 class APIViewTestCase(APITestCase):
     def setUp(self):
+        caches["responses"].clear()
+        user_cache.clear()
+        ingredients.ingredient_cache.clear()
+
         self.user_1 = User.objects.create_user(
             "Bo",
             "ex@gmail.com",
@@ -136,7 +424,324 @@ class APIViewTestCase(APITestCase):
         ).json()["access"]
 
 
-class CreateAPIViewTestCase(APIViewTestCase):
+class CachedAuthenticationTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.my_recipes_url = reverse("my-recipes")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def authenticate(self):
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION="Bearer " + self.access_token
+        )
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(), self.user_1)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+
+        self.assertEqual(user, self.user_1)
+        user.first_name = "Changed"
+        self.assertEqual(self.authenticate().first_name, "")
+
+    def test_saving_the_user_invalidates_it(self):
+        self.authenticate()
+        User.objects.filter(pk=self.user_1.pk).update(first_name="Stale")
+        self.assertEqual(self.authenticate().first_name, "")
+
+        self.user_1.first_name = "Bob"
+        self.user_1.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().first_name, "Bob")
+
+    def test_deactivated_and_deleted_users_are_refused(self):
+        self.assertEqual(self.client.get(self.my_recipes_url).status_code, 200)
+
+        self.user_1.is_active = False
+        self.user_1.save()
+        self.assertEqual(self.client.get(self.my_recipes_url).status_code, 401)
+
+        self.user_1.is_active = True
+        self.user_1.save()
+        self.assertEqual(self.client.get(self.my_recipes_url).status_code, 200)
+
+        self.user_1.delete()
+        self.assertEqual(self.client.get(self.my_recipes_url).status_code, 401)
+
+    def test_entries_expire_and_are_bounded(self):
+        now = [0]
+        cache = UserCache(ttl=60, max_size=2, clock=lambda: now[0])
+
+        cache.set(1, self.user_1)
+        now[0] = 59
+        self.assertEqual(cache.get(1), self.user_1)
+        now[0] = 60
+        self.assertIsNone(cache.get(1))
+
+        cache.set(1, self.user_1)
+        cache.set(2, self.user_2)
+        cache.get(1)
+        cache.set(3, self.user_2)
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), self.user_1)
+
+
+class DatabaseTuningTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "db.sqlite3")
+
+    def connect(self, alias, backend=sqlite3_base, **options):
+        wrapper = backend.DatabaseWrapper(
+            {**connection.settings_dict, "NAME": self.path, "OPTIONS": options}, alias
+        )
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        return wrapper.connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+    @override_settings(
+        SQLITE={"PRAGMAS": {"journal_mode": "wal"}, "READ_DATABASE": "read"}
+    )
+    def test_pragmas_are_applied_to_new_connections(self):
+        default = self.connect("default")
+        default.connection.execute("CREATE TABLE t (x INTEGER)")
+        read = self.connect("read")
+
+        self.assertEqual(self.pragma(default, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(default, "query_only"), 0)
+        self.assertEqual(self.pragma(read, "query_only"), 1)
+        self.assertEqual(
+            read.connection.execute("SELECT count(*) FROM t").fetchone(), (0,)
+        )
+        with self.assertRaisesMessage(sqlite3.OperationalError, "readonly"):
+            read.connection.execute("INSERT INTO t VALUES (1)")
+
+    def test_immediate_transactions_take_the_lock_up_front(self):
+        wrapper = self.connect(
+            "default", backend=cookbook_sqlite3_base, transaction_mode="IMMEDIATE"
+        )
+        self.assertNotIn("transaction_mode", wrapper.get_connection_params())
+
+        wrapper._start_transaction_under_autocommit()
+        self.addCleanup(wrapper.connection.rollback)
+        with self.assertRaisesMessage(sqlite3.OperationalError, "locked"):
+            sqlite3.connect(self.path, timeout=0).execute("BEGIN IMMEDIATE")
+
+    @override_settings(SQLITE={"READ_DATABASE": "read"})
+    def test_list_views_read_from_the_read_database(self):
+        router = db.ReadRouter()
+        self.assertIsNone(router.db_for_read(Recipe))
+        with db.read_database():
+            self.assertEqual(router.db_for_read(Recipe), "read")
+        self.assertFalse(router.allow_migrate("read", "cookbook"))
+        self.assertIsNone(router.allow_migrate("default", "cookbook"))
+
+        aliases = []
+        get_queryset = views.RecipesListView.get_queryset
+
+        def spy(view):
+            aliases.append(router.db_for_read(Recipe))
+            return get_queryset(view)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        with mock.patch.object(views.RecipesListView, "get_queryset", spy):
+            self.client.get(reverse("recipes-list"))
+        self.assertEqual(aliases, ["read"])
+
+
+@override_settings(SQLITE={"BUSY_RETRIES": 2, "BUSY_BACKOFF": 0})
+class BusyRetryTestCase(TransactionTestCase):
+    """
+    Retries only happen outside of a transaction, hence TransactionTestCase.
+    """
+
+    def setUp(self):
+        user_cache.clear()
+
+    def failing(self, *errors):
+        errors = list(errors)
+
+        def func():
+            Ingredient.objects.create(name=f"salt {len(errors)}")
+            if errors:
+                raise errors.pop(0)
+            return "done"
+
+        return mock.Mock(wraps=func)
+
+    def test_locked_transactions_are_run_again(self):
+        func = self.failing(OperationalError("database is locked"))
+
+        self.assertEqual(db.retry_on_busy(func)(), "done")
+        self.assertEqual(func.call_count, 2)
+        # The failed attempt was rolled back.
+        self.assertEqual(
+            list(Ingredient.objects.values_list("name", flat=True)), ["salt 0"]
+        )
+
+    def test_retries_are_bounded(self):
+        func = self.failing(*[OperationalError("database is locked")] * 3)
+
+        with self.assertRaises(OperationalError):
+            db.retry_on_busy(func)()
+        self.assertEqual(func.call_count, 3)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_other_errors_and_outer_transactions_are_not_retried(self):
+        func = self.failing(OperationalError("no such table: t"))
+        with self.assertRaises(OperationalError):
+            db.retry_on_busy(func)()
+        self.assertEqual(func.call_count, 1)
+
+        func = self.failing(OperationalError("database is locked"))
+        with self.assertRaises(OperationalError), transaction.atomic():
+            db.retry_on_busy(func)()
+        self.assertEqual(func.call_count, 1)
+
+    def test_create_views_retry(self):
+        user = User.objects.create_user("Bo", "ex@gmail.com", "password321")
+        client = APIClient()
+        client.force_authenticate(user)
+
+        create = IngredientSerializer.create
+        calls = []
+
+        def flaky_create(serializer, validated_data):
+            calls.append(validated_data["name"])
+            instance = create(serializer, validated_data)
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            return instance
+
+        with mock.patch.object(IngredientSerializer, "create", flaky_create):
+            response = client.post(reverse("add-ingredient"), {"name": "salt"})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(calls, ["salt", "salt"])
+        self.assertEqual(Ingredient.objects.filter(name="salt").count(), 1)
+
+
+class StubEmailVerifierMixin:
+    """
+    Point the email verifier at a local stub server instead of the Hunter API.
+    """
+
+    invalid_domains = ["yhoo.com"]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.verifier_server = StubHunterServer(invalid_domains=cls.invalid_domains)
+        cls.verifier_server.start()
+        cls.addClassCleanup(cls.verifier_server.stop)
+
+        cls.email_verification = {
+            "BACKEND": "cookbook.email_verification.HunterBackend",
+            "OPTIONS": {"base_url": cls.verifier_server.base_url, "read_timeout": 0.2},
+            "FAILURE_THRESHOLD": 2,
+            "RECOVERY_TIMEOUT": 60,
+            "FAIL_OPEN": True,
+        }
+        settings_override = override_settings(EMAIL_VERIFICATION=cls.email_verification)
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+
+        super().setUpClass()
+
+    def setUp(self):
+        self.verifier_server.delay = 0
+        self.verifier_server.failing = False
+        self.verifier_server.requests_count = 0
+        caches["default"].clear()
+        reset_verifier("EMAIL_VERIFICATION")
+        super().setUp()
+
+
+class EmailVerifierTestCase(StubEmailVerifierMixin, TestCase):
+    def test_results_are_cached_per_email(self):
+        verifier = get_verifier()
+
+        self.assertEqual(verifier.verify("bob@gmail.com"), VALID)
+        self.assertEqual(verifier.verify("bob@gmail.com"), VALID)
+        self.assertEqual(self.verifier_server.requests_count, 1)
+
+    def test_invalid_domains_are_cached(self):
+        verifier = get_verifier()
+
+        self.assertEqual(verifier.verify("bob@yhoo.com"), INVALID)
+        self.assertEqual(verifier.verify("joe@yhoo.com"), INVALID)
+        self.assertEqual(self.verifier_server.requests_count, 1)
+
+    def test_timeout_fails_open(self):
+        self.verifier_server.delay = 1
+
+        started = time.monotonic()
+        with self.assertLogs("cookbook.email_verification", "WARNING"):
+            self.assertEqual(get_verifier().verify("bob@gmail.com"), VALID)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_circuit_breaker_stops_calling_failing_backend(self):
+        self.verifier_server.failing = True
+        verifier = get_verifier()
+
+        with self.assertLogs("cookbook.email_verification", "WARNING") as logs:
+            for email in ["a@gmail.com", "b@gmail.com", "c@gmail.com", "d@gmail.com"]:
+                self.assertEqual(verifier.verify(email), VALID)
+
+        self.assertIn("HTTP 503", logs.output[0])
+        self.assertIn("circuit breaker is open", logs.output[-1])
+        self.assertIn("gmail.com", logs.output[0])
+        self.assertFalse(any("a@gmail.com" in line for line in logs.output))
+        self.assertEqual(self.verifier_server.requests_count, 2)
+        self.assertEqual(verifier.breaker.state, CircuitBreaker.OPEN)
+
+    def test_circuit_breaker_recovers(self):
+        now = [0]
+        breaker = CircuitBreaker(
+            failure_threshold=1, recovery_timeout=10, clock=lambda: now[0]
+        )
+
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # Only one trial call while half-open.
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+
+    def test_unexpected_errors_open_the_breaker(self):
+        verifier = get_verifier()
+        # Open, and letting a trial call through right away.
+        verifier.breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+        verifier.breaker.record_failure()
+
+        with mock.patch.object(
+            verifier.backend, "verify", side_effect=RuntimeError("bug")
+        ):
+            with self.assertRaises(RuntimeError):
+                verifier.verify("bob@gmail.com")
+
+        self.assertEqual(verifier.breaker.state, CircuitBreaker.OPEN)
+
+    def test_fail_closed(self):
+        self.verifier_server.failing = True
+
+        with self.settings(
+            EMAIL_VERIFICATION={**self.email_verification, "FAIL_OPEN": False}
+        ):
+            with self.assertLogs("cookbook.email_verification", "WARNING"):
+                self.assertEqual(get_verifier().verify("bob@gmail.com"), UNVERIFIED)
+
+
+class CreateAPIViewTestCase(StubEmailVerifierMixin, APIViewTestCase):
     def setUp(self):
         super().setUp()
 
@@ -205,6 +810,21 @@ class CreateAPIViewTestCase(APIViewTestCase):
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.json(), {"email": ["Provided email is invalid."]})
 
+    def test_registration_unverified_email_fail_closed(self):
+        self.verifier_server.failing = True
+
+        with self.settings(
+            EMAIL_VERIFICATION={**self.email_verification, "FAIL_OPEN": False}
+        ):
+            with self.assertLogs("cookbook.email_verification", "WARNING"):
+                response = self.client.post(self.register_url, self.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"email": ["Email could not be verified, please try again later."]},
+        )
+
     def test_ingredient_create_view_OK(self):
         """
         Check ingredient creation with a valid access token.
@@ -253,6 +873,139 @@ class CreateAPIViewTestCase(APIViewTestCase):
             list(Ingredient.objects.all().values_list("name", flat=True)),
         )
 
+    def test_recipe_create_view_with_ingredient_names(self):
+        """
+        Check recipe creation with ingredient names, creating the missing ones.
+        """
+        oil = Ingredient.objects.create(name="oil")
+        flour = Ingredient.objects.create(name="flour")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        response = self.client.post(
+            self.create_recipe_url,
+            {
+                "name": "bread",
+                "description": "Bla bla",
+                "author": self.user_1.id,
+                "ingredients": ["oil", flour.id, " salt ", "oil", "salt"],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        salt = Ingredient.objects.get(name="salt")
+        self.assertEqual(response.json()["ingredients"], [oil.id, flour.id, salt.id])
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.ingredient_count, 3)
+        self.assertEqual(
+            list(Ingredient.objects.values_list("name", "recipe_count")),
+            [("oil", 1), ("flour", 1), ("salt", 1)],
+        )
+
+    def test_recipe_create_view_with_unicode_digit_names(self):
+        """
+        Check that non-ASCII digits are ingredient names, not ids.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        response = self.client.post(
+            self.create_recipe_url,
+            {
+                "name": "bread",
+                "description": "Bla bla",
+                "author": self.user_1.id,
+                "ingredients": ["²", "٣"],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list("name", flat=True)), ["²", "٣"]
+        )
+
+    def test_recipe_create_view_unknown_ingredient_FAIL(self):
+        """
+        Check recipe creation FAILS with unknown ingredient ids, creating nothing.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        response = self.client.post(
+            self.create_recipe_url,
+            {
+                "name": "bread",
+                "description": "Bla bla",
+                "author": self.user_1.id,
+                "ingredients": ["salt", 999, str(2**70)],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {
+                "ingredients": [
+                    'Invalid pk "999" - object does not exist.',
+                    f'Invalid pk "{2**70}" - object does not exist.',
+                ]
+            },
+        )
+        self.assertEqual(Ingredient.objects.count(), 0)
+
+    def test_recipe_create_view_query_count_is_constant(self):
+        """
+        Check recipe creation runs as many queries for 3 ingredients as for 30.
+        """
+        existing = [Ingredient.objects.create(name=f"old {i}") for i in range(20)]
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        # Load the user into the authentication cache.
+        self.client.get(reverse("top-ingredients"))
+
+        counts = []
+        for n, refs in enumerate(
+            [
+                [existing[0].id, "old 1", "new 0"],
+                [i.id for i in existing[10:]]
+                + [i.name for i in existing[2:10]]
+                + [f"new {i}" for i in range(1, 13)],
+            ]
+        ):
+            data = {
+                "name": f"recipe {n}",
+                "description": f"description {n}",
+                "author": self.user_1.id,
+                "ingredients": refs,
+            }
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.create_recipe_url, data, format="json")
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(Recipe.objects.get(name="recipe 1").ingredient_count, 30)
+
+    def test_recipe_create_view_duplicate_description_FAIL(self):
+        """
+        Check recipe creation FAILS with the description of another recipe.
+        """
+        ingredient = Ingredient.objects.create(name="oil")
+        Recipe.objects.create(name="cake", description="Bla bla", author=self.user_2)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        response = self.client.post(
+            self.create_recipe_url,
+            {
+                "name": "bread",
+                "description": "Bla bla",
+                "author": self.user_1.id,
+                "ingredients": [ingredient.id],
+            },
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {"description": ["recipe with this description already exists."]},
+        )
+        self.assertEqual(Recipe.objects.count(), 1)
+
     def test_rating_view(self):
         """
         Rating with valid data.
@@ -336,6 +1089,69 @@ class CreateAPIViewTestCase(APIViewTestCase):
         self.assertEqual(Rating.objects.count(), 0)
 
 
+class IngredientCacheTestCase(TestCase):
+    def setUp(self):
+        self.oil = Ingredient.objects.create(name="oil")
+        self.flour = Ingredient.objects.create(name="flour")
+        ingredients.ingredient_cache.clear()
+
+    def test_lookup_is_cached_once_committed(self):
+        refs = ["oil", self.flour.id, "salt", 999]
+        expected = {"oil": self.oil.id, self.flour.id: self.flour.id}
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(ingredients.lookup(refs), expected)
+        self.assertIsNone(ingredients.ingredient_cache.get("oil"))
+
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                ingredients.lookup(["oil", self.oil.id, "flour"]),
+                {"oil": self.oil.id, self.oil.id: self.oil.id, "flour": self.flour.id},
+            )
+
+    def test_changes_drop_cached_ingredients(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredients.lookup(["oil", "flour"])
+
+        self.oil.name = "olive oil"
+        self.oil.save()
+        self.flour.delete()
+        self.assertIsNone(ingredients.ingredient_cache.get("oil"))
+        self.assertIsNone(ingredients.ingredient_cache.get("flour"))
+        self.assertEqual(
+            ingredients.lookup(["oil", "olive oil"]), {"olive oil": self.oil.id}
+        )
+
+    def test_resolve_names_creates_missing_ingredients(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = ingredients.resolve_names(["oil", "salt", "pepper"])
+
+        self.assertEqual(
+            ids,
+            dict(Ingredient.objects.exclude(name="flour").values_list("name", "id")),
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                ingredients.resolve_names(["salt", "pepper"]),
+                {"salt": ids["salt"], "pepper": ids["pepper"]},
+            )
+
+    def test_expiry_and_size_bound(self):
+        now = [0]
+        cache = ingredients.IngredientCache(ttl=10, max_size=4, clock=lambda: now[0])
+        cache.set_many([(1, "oil"), (2, "flour")])
+        self.assertEqual((cache.get(1), cache.get("flour")), (1, 2))
+
+        # Two entries per ingredient: the least recently used one goes.
+        cache.set_many([(3, "salt")])
+        self.assertEqual((cache.get("oil"), cache.get("salt")), (None, 3))
+
+        now[0] = 10
+        self.assertIsNone(cache.get("salt"))
+
+
 class ListAPIViewTestCase(APIViewTestCase):
     def setUp(self):
         super().setUp()
@@ -369,7 +1185,7 @@ class ListAPIViewTestCase(APIViewTestCase):
         response = self.client.get(self.recipes_list_url)
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()[0]["name"], "bread")
+        self.assertEqual(response.json()["results"][0]["name"], "bread")
 
     def test_my_recipes_list_view(self):
         """
@@ -379,7 +1195,7 @@ class ListAPIViewTestCase(APIViewTestCase):
         response = self.client.get(self.my_recipes_url)
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()[0]["name"], "bread")
+        self.assertEqual(response.json()["results"][0]["name"], "bread")
 
     def test_top_ingredients_list_view(self):
         top_ingredients = Ingredient.objects.top_ingredients()
@@ -388,3 +1204,1839 @@ class ListAPIViewTestCase(APIViewTestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(top_ingredients), 2)  # Expected since 2 have been created.
+
+    def test_top_ingredients_list_view_limit(self):
+        response = self.client.get(self.top_ingredients_url, {"limit": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+
+        response = self.client.get(self.top_ingredients_url, {"limit": 1000})
+        self.assertEqual(response.status_code, 400)
+
+
+class RatingBatchTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.add_ratings_url = reverse("add-ratings")
+        self.own_recipe = Recipe.objects.create(
+            name="bread", description="Bla bla", author=self.user_1
+        )
+        self.recipes = Recipe.objects.bulk_create(
+            Recipe(name=f"cake {i}", description=f"cake {i}", author=self.user_2)
+            for i in range(100)
+        )
+        self.recipes = list(Recipe.objects.filter(author=self.user_2))
+        Rating.objects.create(rate=1, user=self.user_1, recipe=self.recipes[0])
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def test_batch_rating_upserts(self):
+        batch = [{"recipe": recipe.id, "rate": 4} for recipe in self.recipes[:3]]
+
+        response = self.client.post(self.add_ratings_url, batch, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), batch)
+        self.assertEqual(
+            list(
+                Rating.objects.filter(user=self.user_1).values_list("rate", flat=True)
+            ),
+            [4, 4, 4],
+        )
+        first = Recipe.objects.get(pk=self.recipes[0].pk)
+        self.assertEqual((first.rating_count, first.avg_rating), (1, 4))
+
+    def test_batch_rating_query_count_is_constant(self):
+        # User lookup, recipe lookup, two savepoints (the view's and the upsert's),
+        # existing ratings, insert, update, aggregates refresh, its copy to the
+        # ingredient links and two releases.
+        batch = [{"recipe": recipe.id, "rate": 3} for recipe in self.recipes]
+        with self.assertNumQueries(11):
+            response = self.client.post(self.add_ratings_url, batch, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Rating.objects.count(), 100)
+        self.assertEqual(
+            set(Recipe.objects.filter(author=self.user_2).values_list("avg_rating")),
+            {(3,)},
+        )
+
+    def test_batch_rating_validation(self):
+        unknown = Recipe.objects.order_by("-id")[0].pk + 1
+        batch = [
+            {"recipe": self.recipes[1].id, "rate": 5},
+            {"recipe": self.own_recipe.id, "rate": 5},
+            {"recipe": self.recipes[1].id, "rate": 2},
+            {"recipe": unknown, "rate": 5},
+        ]
+
+        response = self.client.post(self.add_ratings_url, batch, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            [
+                {},
+                {"recipe": ["User cannot rate its own recipe!"]},
+                {"recipe": ["Recipe is rated more than once."]},
+                {"recipe": [f'Invalid pk "{unknown}" - object does not exist.']},
+            ],
+        )
+        self.assertEqual(Rating.objects.count(), 1)
+
+    def test_batch_rating_out_of_range(self):
+        batch = [
+            {"recipe": self.recipes[1].id, "rate": 6},
+            {"recipe": 0, "rate": 3},
+            {"recipe": 2**70, "rate": 3},
+        ]
+
+        response = self.client.post(self.add_ratings_url, batch, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("rate", response.json()[0])
+        self.assertIn("recipe", response.json()[1])
+        self.assertIn("recipe", response.json()[2])
+
+
+class RecipeSearchTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.recipes_list_url = reverse("recipes-list")
+        for name, description in [
+            ("Banana bread", "Moist bread with ripe bananas."),
+            ("Sourdough", "Crusty bread from a starter."),
+            ("Pancakes", "Fluffy breakfast, serve with banana."),
+            ("Crème brûlée", "Custard with a burnt sugar crust."),
+            ("Tomato soup", "Creamy soup."),
+        ]:
+            Recipe.objects.create(
+                name=name, description=description, author=self.user_1
+            )
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def search(self, query):
+        return list(Recipe.objects.search(query).values_list("name", flat=True))
+
+    def test_search_ranks_name_matches_first(self):
+        self.assertEqual(self.search("banana"), ["Banana bread", "Pancakes"])
+        self.assertEqual(self.search("bread"), ["Banana bread", "Sourdough"])
+
+    def test_search_matches_every_term_as_prefix(self):
+        self.assertEqual(self.search("ban moi"), ["Banana bread"])
+        self.assertEqual(self.search("ban brea"), ["Banana bread", "Pancakes"])
+        self.assertEqual(self.search("cru"), ["Sourdough", "Crème brûlée"])
+        self.assertEqual(self.search("creme"), ["Crème brûlée"])
+
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.search('soup" OR "bread'), [])
+        self.assertEqual(self.search("*"), [])
+
+    def test_search_index_follows_writes(self):
+        recipe = Recipe.objects.get(name="Tomato soup")
+        recipe.description = "Creamy soup with basil."
+        recipe.save()
+        Recipe.objects.filter(name="Sourdough").delete()
+
+        self.assertEqual(self.search("basil"), ["Tomato soup"])
+        self.assertEqual(self.search("bread"), ["Banana bread"])
+
+    def test_search_list_view_pages(self):
+        response = self.client.get(self.recipes_list_url, {"q": "b", "page_size": 1})
+        names = [response.json()["results"][0]["name"]]
+        while response.json()["next"]:
+            response = self.client.get(response.json()["next"])
+            names.extend(recipe["name"] for recipe in response.json()["results"])
+
+        self.assertEqual(names, self.search("b"))
+        self.assertEqual(len(names), 4)
+
+
+class IngredientMatchTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.recipes_list_url = reverse("recipes-list")
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name) for name in "abcde"
+        }
+        for name, ingredients in [
+            ("r1", "ab"),
+            ("r2", "abc"),
+            ("r3", "a"),
+            ("r4", "cd"),
+            ("r5", "abcde"),
+        ]:
+            recipe = Recipe.objects.create(
+                name=name, description=name, author=self.user_1
+            )
+            recipe.ingredients.add(*[self.ingredients[i] for i in ingredients])
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def ids(self, names):
+        return [self.ingredients[name].id for name in names]
+
+    def match(self, names, *args):
+        recipes = Recipe.objects.match_ingredients(self.ids(names), *args)
+        return [recipe.name for recipe in recipes]
+
+    def test_contains_all(self):
+        self.assertEqual(self.match("ab", "all"), ["r1", "r2", "r5"])
+
+    def test_contains_any_ranked_by_matches(self):
+        self.assertEqual(self.match("abc", "any"), ["r2", "r5", "r1", "r3", "r4"])
+
+    def test_subset_of_pantry(self):
+        self.assertEqual(self.match("abc", "pantry"), ["r2", "r1", "r3"])
+
+    def test_missing_at_most_k(self):
+        self.assertEqual(self.match("abc", "pantry", 1), ["r2", "r1", "r3", "r4"])
+        self.assertEqual(
+            [
+                (recipe.name, recipe.matched, recipe.missing)
+                for recipe in Recipe.objects.match_ingredients(
+                    self.ids("cd"), "pantry", 3
+                )
+            ],
+            # r3 and r1 have none of the ingredients, but need at most 3 more.
+            [("r4", 2, 0), ("r3", 0, 1), ("r2", 1, 2), ("r1", 0, 2), ("r5", 2, 3)],
+        )
+
+    def test_match_list_view(self):
+        ids = ",".join(str(i) for i in self.ids("abc"))
+        response = self.client.get(
+            self.recipes_list_url, {"ingredients": ids, "missing": 1, "page_size": 3}
+        )
+        names = [recipe["name"] for recipe in response.json()["results"]]
+        response = self.client.get(response.json()["next"])
+        names += [recipe["name"] for recipe in response.json()["results"]]
+
+        self.assertEqual(names, ["r2", "r1", "r3", "r4"])
+
+    def test_match_list_view_single_id(self):
+        response = self.client.get(
+            self.recipes_list_url, {"ingredients": self.ingredients["d"].id}
+        )
+        names = [recipe["name"] for recipe in response.json()["results"]]
+        self.assertEqual(names, ["r4", "r5"])
+
+    def test_match_list_view_validation(self):
+        for params in [
+            {"ingredients": "a,b"},
+            {"ingredients": ""},
+            {"ingredients": "1", "match": "most"},
+            {"ingredients": "1", "missing": "-1"},
+        ]:
+            response = self.client.get(self.recipes_list_url, params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class RecipeListFilterTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.recipes_list_url = reverse("recipes-list")
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name) for name in "abcd"
+        }
+        rater = User.objects.create_user("Rater", "rater@gmail.com", "password")
+        for name, author, ingredients, rate in [
+            ("r1", self.user_1, "ab", 5),
+            ("r2", self.user_2, "abc", 4),
+            ("r3", self.user_1, "a", 3),
+            ("r4", self.user_1, "abcd", 1),
+            ("r5", self.user_2, "cd", 2),
+        ]:
+            recipe = Recipe.objects.create(
+                name=name, description=f"{name} soup", author=author
+            )
+            recipe.ingredients.add(*[self.ingredients[i] for i in ingredients])
+            Rating.objects.create(rate=rate, user=rater, recipe=recipe)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def names(self, **params):
+        response = self.client.get(self.recipes_list_url, params)
+        self.assertEqual(response.status_code, 200, params)
+        return [recipe["name"] for recipe in response.json()["results"]]
+
+    def ids(self, names):
+        return ",".join(str(self.ingredients[name].id) for name in names)
+
+    def test_orderings(self):
+        self.assertEqual(self.names(), ["r5", "r4", "r3", "r2", "r1"])
+        self.assertEqual(self.names(order="oldest"), ["r1", "r2", "r3", "r4", "r5"])
+        self.assertEqual(self.names(order="best_rated"), ["r1", "r2", "r3", "r5", "r4"])
+        self.assertEqual(
+            self.names(order="most_ingredients"), ["r4", "r2", "r5", "r1", "r3"]
+        )
+        # The former flags still order, unless an explicit order is given.
+        self.assertEqual(self.names(min_ingredients=1), ["r3", "r1", "r5", "r2", "r4"])
+        self.assertEqual(
+            self.names(max_ingredients="", order="oldest"),
+            ["r1", "r2", "r3", "r4", "r5"],
+        )
+
+    def test_filters_combine(self):
+        self.assertEqual(self.names(author=self.user_1.pk), ["r4", "r3", "r1"])
+        self.assertEqual(
+            self.names(author=self.user_1.pk, ingredients=self.ids("ab")),
+            ["r1", "r4", "r3"],
+        )
+        self.assertEqual(
+            self.names(
+                author=self.user_1.pk, ingredients=self.ids("ab"), order="best_rated"
+            ),
+            ["r1", "r3", "r4"],
+        )
+        self.assertEqual(
+            self.names(ingredients=self.ids("abc"), missing=0, order="oldest"),
+            ["r1", "r2", "r3"],
+        )
+        self.assertEqual(
+            self.names(q="soup", author=self.user_2.pk, order="newest"), ["r5", "r2"]
+        )
+        self.assertEqual(self.names(q="soup", ingredients=self.ids("d")), ["r5", "r4"])
+        self.assertEqual(
+            self.names(name="r2", description="r2 soup", author=self.user_2.pk),
+            ["r2"],
+        )
+        self.assertEqual(self.names(name="r2", author=self.user_1.pk), [])
+
+    def test_pages_of_combined_filters(self):
+        params = {
+            "author": self.user_1.pk,
+            "ingredients": self.ids("a"),
+            "order": "fewest_ingredients",
+            "page_size": 2,
+        }
+        response = self.client.get(self.recipes_list_url, params)
+        names = [recipe["name"] for recipe in response.json()["results"]]
+        response = self.client.get(response.json()["next"])
+        names += [recipe["name"] for recipe in response.json()["results"]]
+
+        self.assertEqual(names, ["r3", "r1", "r4"])
+
+    def test_validation(self):
+        for params, field in [
+            ({"author": "x"}, "author"),
+            ({"author": 0}, "author"),
+            ({"author": 2**63}, "author"),
+            ({"ingredients": f"1,{2**63}"}, "ingredients"),
+            ({"order": "random"}, "order"),
+            ({"ingredients": "a,b"}, "ingredients"),
+            ({"ingredients": "1", "missing": "-1", "author": "x"}, "missing"),
+            ({"ingredients": "1,2", "match": "pantry", "missing": 2**70}, "missing"),
+        ]:
+            response = self.client.get(self.recipes_list_url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(field, response.json())
+
+
+class IngredientAutocompleteTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+        autocomplete.ingredient_index.clear()
+
+        self.url = reverse("ingredient-autocomplete")
+        self.ingredients = {}
+        for name, recipes in [
+            ("salt", 5),
+            ("sage", 2),
+            ("black pepper", 3),
+            ("Paprika", 1),
+            ("Piment d'Espelette", 0),
+            ("jalapeño pepper", 4),
+        ]:
+            self.ingredients[name] = Ingredient.objects.create(name=name)
+            Ingredient.objects.filter(name=name).update(recipe_count=recipes)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def complete(self, prefix, **params):
+        response = self.client.get(self.url, {"prefix": prefix, **params})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient["name"] for ingredient in response.json()]
+
+    def test_matches_word_starts_by_popularity(self):
+        self.assertEqual(self.complete("sa"), ["salt", "sage"])
+        self.assertEqual(self.complete("pep"), ["jalapeño pepper", "black pepper"])
+        self.assertEqual(
+            self.complete("P"),
+            ["jalapeño pepper", "black pepper", "Paprika", "Piment d'Espelette"],
+        )
+        self.assertEqual(self.complete("JALAPENO"), ["jalapeño pepper"])
+        self.assertEqual(self.complete("black pe"), ["black pepper"])
+        self.assertEqual(self.complete("esp"), ["Piment d'Espelette"])
+        self.assertEqual(self.complete("lt"), [])
+
+    def test_response(self):
+        response = self.client.get(self.url, {"prefix": "sal"})
+        self.assertEqual(
+            response.json(), [{"name": "salt", "id": self.ingredients["salt"].id}]
+        )
+        self.assertEqual(self.complete("p", limit=1), ["jalapeño pepper"])
+
+        for params in [{}, {"prefix": " "}, {"prefix": "s", "limit": 51}]:
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_served_from_memory(self):
+        self.complete("s")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.complete("sal"), ["salt"])
+
+    def test_follows_ingredient_saves(self):
+        self.complete("s")
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name="sumac")
+            self.ingredients["sage"].name = "thyme"
+            self.ingredients["sage"].save()
+            self.ingredients["salt"].delete()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.complete("s"), ["sumac"])
+            self.assertEqual(self.complete("th"), ["thyme"])
+
+    def test_follows_ingredients_created_with_recipes(self):
+        self.complete("s")
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredients.create_names(["sumac", "salt"])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.complete("s"), ["salt", "sage", "sumac"])
+
+    def test_ignores_ingredients_created_in_rolled_back_transactions(self):
+        self.complete("s")
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    ingredients.create_names(["sumac"])
+                    raise IntegrityError
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.complete("s"), ["salt", "sage"])
+
+    def test_rebuilt_when_stale(self):
+        now = [0]
+        index = autocomplete.IngredientAutocomplete(max_age=60, clock=lambda: now[0])
+        self.assertEqual(
+            index.search("sa"),
+            [
+                (self.ingredients["salt"].id, "salt"),
+                (self.ingredients["sage"].id, "sage"),
+            ],
+        )
+
+        Ingredient.objects.filter(name="sage").update(recipe_count=9)
+        now[0] = 59
+        self.assertEqual(index.search("sa")[0][1], "salt")
+        now[0] = 60
+        self.assertEqual(index.search("sa")[0][1], "sage")
+
+
+class SimilarRecipesTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name) for name in "abcdefgh"
+        }
+        self.recipes = {}
+        for name, ingredients in [
+            ("r1", "abcd"),
+            ("r2", "abcde"),
+            ("r3", "abcdef"),
+            ("r4", "abc"),
+            ("r5", "efgh"),
+            ("r6", ""),
+        ]:
+            recipe = Recipe.objects.create(
+                name=name, description=name, author=self.user_1
+            )
+            recipe.ingredients.add(*[self.ingredients[i] for i in ingredients])
+            self.recipes[name] = recipe
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def similar(self, name, **params):
+        url = reverse("similar-recipes", args=[self.recipes[name].pk])
+        return self.client.get(url, params)
+
+    def buckets(self):
+        return sorted(RecipeBucket.objects.values_list("recipe_id", "key"))
+
+    def test_most_similar_first(self):
+        response = self.similar("r1")
+        results = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([recipe["name"] for recipe in results], ["r2", "r4", "r3"])
+        self.assertEqual(
+            [recipe["similarity"] for recipe in results], [0.8, 0.75, 0.667]
+        )
+        self.assertEqual(results[0]["id"], self.recipes["r2"].pk)
+        self.assertEqual(
+            [ingredient["name"] for ingredient in results[0]["ingredients"]],
+            list("abcde"),
+        )
+
+    def test_limit(self):
+        names = [recipe["name"] for recipe in self.similar("r1", limit=2).json()]
+        self.assertEqual(names, ["r2", "r4"])
+
+        for limit in ["0", "51", "x"]:
+            self.assertEqual(self.similar("r1", limit=limit).status_code, 400)
+
+    def test_recipe_without_ingredients(self):
+        self.assertEqual(self.similar("r6").json(), [])
+
+    def test_unknown_recipe(self):
+        url = reverse(
+            "similar-recipes", args=[Recipe.objects.order_by("-id")[0].pk + 1]
+        )
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        url = reverse("similar-recipes", args=[2**63])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_index_follows_ingredient_changes(self):
+        self.recipes["r5"].ingredients.set([self.ingredients[i] for i in "abcd"])
+        self.ingredients["e"].recipe_set.remove(self.recipes["r2"])
+        self.recipes["r3"].ingredients.clear()
+        self.recipes["r4"].delete()
+
+        names = [recipe["name"] for recipe in self.similar("r1").json()]
+        self.assertEqual(names, ["r2", "r5"])
+
+        buckets = self.buckets()
+        similarity.rebuild(batch_size=2)
+        self.assertEqual(self.buckets(), buckets)
+
+    def test_install_uses_the_migration_state(self):
+        buckets = self.buckets()
+        RecipeBucket.objects.all().delete()
+
+        state = MigrationLoader(connection).project_state(
+            ("cookbook", "0008_recipebucket")
+        )
+        similarity.install(state.apps, mock.Mock(connection=connection))
+
+        self.assertEqual(self.buckets(), buckets)
+
+    def test_rebuild_similarity_index_command(self):
+        buckets = self.buckets()
+        RecipeBucket.objects.all().delete()
+
+        stdout = StringIO()
+        call_command("rebuild_similarity_index", stdout=stdout)
+
+        self.assertEqual(self.buckets(), buckets)
+        self.assertIn("of 5 recipes", stdout.getvalue())
+
+    def test_vectorized_keys_match(self):
+        if similarity.np is None:
+            self.skipTest("NumPy is not installed.")
+        links = list(
+            Recipe.ingredients.through.objects.values_list("recipe_id", "ingredient_id")
+        )
+        self.assertEqual(
+            sorted(similarity._keys_numpy(links)),
+            sorted(similarity._keys_python(links)),
+        )
+
+
+@override_settings(TOP_RECIPES={"MIN_RATINGS": 2, "PRIOR_MEAN": 3.0})
+class TopRecipesTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.a = Ingredient.objects.create(name="a")
+        self.b = Ingredient.objects.create(name="b")
+        self.raters = [
+            User.objects.create_user(f"Rater {i}", f"rater_{i}@gmail.com", "password")
+            for i in range(6)
+        ]
+        self.recipes = {}
+        for name, author, ingredients, rates in [
+            # Scores (sum + 2 * 3) / (count + 2): 4.2, 4.0 and 3.667.
+            ("r1", self.user_1, [self.a], [5, 5, 5]),
+            ("r2", self.user_2, [self.a, self.b], [5, 5]),
+            ("r3", self.user_1, [self.b], [4, 4, 4, 4]),
+            # Too few ratings to be ranked.
+            ("r4", self.user_2, [self.a], [5]),
+        ]:
+            recipe = Recipe.objects.create(name=name, description=name, author=author)
+            recipe.ingredients.add(*ingredients)
+            for rater, rate in zip(self.raters, rates):
+                Rating.objects.create(rate=rate, user=rater, recipe=recipe)
+            self.recipes[name] = recipe
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def top(self, **params):
+        response = self.client.get(reverse("top-recipes"), params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe["name"] for recipe in response.json()["results"]]
+
+    def test_best_rated_first(self):
+        self.assertEqual(self.top(), ["r1", "r2", "r3"])
+        self.assertEqual(
+            list(Recipe.objects.top_rated().values_list("name", "bayesian_rating")),
+            [("r1", 4.2), ("r2", 4.0), ("r3", 22 / 6)],
+        )
+
+    def test_top_k(self):
+        response = self.client.get(reverse("top-recipes"), {"page_size": 2})
+        self.assertEqual(
+            [recipe["name"] for recipe in response.json()["results"]], ["r1", "r2"]
+        )
+        self.assertEqual(
+            [
+                recipe["name"]
+                for recipe in self.client.get(response.json()["next"]).json()["results"]
+            ],
+            ["r3"],
+        )
+
+    def test_ranking_follows_ratings(self):
+        recipe = self.recipes["r1"]
+        for rater in self.raters[3:5]:
+            Rating.objects.create(rate=1, user=rater, recipe=recipe)
+        self.assertAlmostEqual(recipe.bayesian_rating, 23 / 7)
+        self.assertEqual(self.top(), ["r2", "r3", "r1"])
+
+        # Tied with r2, the newer recipe first.
+        rating = Rating.objects.create(
+            rate=5, user=self.raters[1], recipe=self.recipes["r4"]
+        )
+        self.assertEqual(self.top(), ["r4", "r2", "r3", "r1"])
+        self.assertEqual(self.top(ingredient=self.a.pk), ["r4", "r2", "r1"])
+
+        rating.delete()
+        self.assertEqual(self.top(), ["r2", "r3", "r1"])
+        self.assertEqual(self.top(ingredient=self.a.pk), ["r2", "r1"])
+
+    def test_per_author(self):
+        self.assertEqual(self.top(author=self.user_1.pk), ["r1", "r3"])
+        self.assertEqual(self.top(author=self.user_2.pk), ["r2"])
+
+    def test_per_ingredient(self):
+        self.assertEqual(self.top(ingredient=self.b.pk), ["r2", "r3"])
+
+        self.recipes["r1"].ingredients.add(self.b)
+        self.assertEqual(self.top(ingredient=self.b.pk), ["r1", "r2", "r3"])
+        self.assertEqual(
+            self.top(ingredient=self.b.pk, author=self.user_1.pk), ["r1", "r3"]
+        )
+
+        self.b.recipe_set.remove(self.recipes["r2"])
+        self.assertEqual(self.top(ingredient=self.b.pk), ["r1", "r3"])
+
+    def test_invalid_parameters(self):
+        for params in [
+            {"author": "x"},
+            {"ingredient": ""},
+            {"author": str(2**63)},
+            {"ingredient": str(-(2**63) - 1)},
+        ]:
+            response = self.client.get(reverse("top-recipes"), params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_rating_aggregates_command(self):
+        scores = sorted(RecipeIngredient.objects.values_list("id", "bayesian_rating"))
+        Recipe.objects.update(bayesian_rating=None)
+        RecipeIngredient.objects.update(bayesian_rating=None)
+
+        call_command("rebuild_rating_aggregates", stdout=StringIO())
+
+        self.assertEqual(self.top(), ["r1", "r2", "r3"])
+        self.assertEqual(
+            sorted(RecipeIngredient.objects.values_list("id", "bayesian_rating")),
+            scores,
+        )
+
+        with self.settings(TOP_RECIPES={"MIN_RATINGS": 1, "PRIOR_MEAN": 3.0}):
+            call_command("rebuild_rating_aggregates", stdout=StringIO())
+        self.assertEqual(self.top(), ["r1", "r2", "r4", "r3"])
+
+
+class ChangesTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.changes_url = reverse("changes")
+        self.oil = Ingredient.objects.create(name="oil")
+        self.flour = Ingredient.objects.create(name="flour")
+        self.bread = Recipe.objects.create(
+            name="bread", description="bread", author=self.user_2
+        )
+        self.bread.ingredients.add(self.flour, self.oil)
+        self.rating = Rating.objects.create(rate=4, user=self.user_1, recipe=self.bread)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def sync(self, since=None, **params):
+        """
+        Follow the feed from ``since`` to its end, return the changes and cursor.
+        """
+        if since is not None:
+            params["since"] = since
+        response = self.client.get(self.changes_url, params)
+        results = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            results += body["results"]
+            if body["next"] is None:
+                return results, body["cursor"]
+            response = self.client.get(body["next"])
+
+    def summary(self, results):
+        return [(entry["type"], entry["id"], entry["deleted"]) for entry in results]
+
+    def test_first_sync(self):
+        results, cursor = self.sync()
+
+        self.assertEqual(
+            self.summary(results),
+            [
+                ("ingredient", self.oil.id, False),
+                ("ingredient", self.flour.id, False),
+                # The rating changed the recipe's aggregates afterwards.
+                ("rating", self.rating.id, False),
+                ("recipe", self.bread.id, False),
+            ],
+        )
+        self.assertEqual(results[0]["data"], {"name": "oil", "id": self.oil.id})
+        self.assertEqual(results[2]["data"], {"recipe": self.bread.id, "rate": 4})
+        self.assertIsNotNone(results[2]["updated_at"])
+        self.assertEqual(results[3]["data"]["avg_rating"], 4)
+        self.assertEqual(
+            [ingredient["name"] for ingredient in results[3]["data"]["ingredients"]],
+            ["oil", "flour"],
+        )
+        self.assertEqual(cursor, Change.objects.latest("seq").seq)
+
+    def test_only_changes_after_the_cursor(self):
+        _, cursor = self.sync()
+        self.assertEqual(self.sync(cursor), ([], cursor))
+
+        self.oil.name = "olive oil"
+        self.oil.save()
+        self.bread.ingredients.remove(self.flour)
+        flour_id = self.flour.id
+        self.flour.delete()
+        results, next_cursor = self.sync(cursor)
+
+        self.assertEqual(
+            self.summary(results),
+            [
+                ("ingredient", self.oil.id, False),
+                ("recipe", self.bread.id, False),
+                ("ingredient", flour_id, True),
+            ],
+        )
+        self.assertEqual(results[0]["data"]["name"], "olive oil")
+        self.assertEqual(len(results[1]["data"]["ingredients"]), 1)
+        self.assertEqual(results[2]["data"], None)
+        self.assertGreater(next_cursor, cursor)
+
+    def test_a_row_changed_twice_is_listed_once(self):
+        _, cursor = self.sync()
+
+        self.rating.rate = 2
+        self.rating.save()
+        self.rating.rate = 3
+        self.rating.save()
+
+        results, _ = self.sync(cursor)
+        self.assertEqual(
+            self.summary(results),
+            [("rating", self.rating.id, False), ("recipe", self.bread.id, False)],
+        )
+        self.assertEqual(results[0]["data"]["rate"], 3)
+
+    def test_bulk_writes_and_cascades_are_tracked(self):
+        _, cursor = self.sync()
+
+        Recipe.objects.filter(pk=self.bread.pk).update(name="sourdough")
+        results, cursor = self.sync(cursor)
+        self.assertEqual(self.summary(results), [("recipe", self.bread.id, False)])
+        self.assertEqual(results[0]["data"]["name"], "sourdough")
+
+        self.user_2.delete()
+        results, _ = self.sync(cursor)
+        self.assertEqual(
+            sorted(self.summary(results)),
+            [("rating", self.rating.id, True), ("recipe", self.bread.id, True)],
+        )
+
+    def test_recipe_counts_are_not_ingredient_changes(self):
+        _, cursor = self.sync()
+
+        Ingredient.objects.refresh_recipe_counts()
+
+        self.assertEqual(self.sync(cursor), ([], cursor))
+
+    def test_ratings_are_private(self):
+        rater = User.objects.create_user("Rater", "rater@gmail.com", "password")
+        other_rating = Rating.objects.create(rate=1, user=rater, recipe=self.bread)
+
+        results, _ = self.sync()
+
+        ids = [entry["id"] for entry in results if entry["type"] == "rating"]
+        self.assertEqual(ids, [self.rating.id])
+        self.assertNotIn(other_rating.id, ids)
+
+    def test_first_sync_skips_tombstones(self):
+        rating_id = self.rating.id
+        self.rating.delete()
+
+        results, _ = self.sync()
+        self.assertNotIn("rating", [entry["type"] for entry in results])
+
+        results, _ = self.sync(0)
+        self.assertIn(("rating", rating_id, True), self.summary(results))
+
+    def test_pages(self):
+        results, cursor = self.sync(limit=1)
+
+        self.assertEqual(len(results), 4)
+        response = self.client.get(self.changes_url, {"limit": 3})
+        self.assertEqual(len(response.json()["results"]), 3)
+        self.assertIn("since=", response.json()["next"])
+        self.assertEqual(self.sync(cursor, limit=1), ([], cursor))
+
+    def test_updated_at(self):
+        bread_updated_at = Recipe.objects.get(pk=self.bread.pk).updated_at
+
+        Rating.objects.create(
+            rate=5,
+            user=User.objects.create_user("Rater", "rater@gmail.com", "password"),
+            recipe=self.bread,
+        )
+
+        self.assertGreater(
+            Recipe.objects.get(pk=self.bread.pk).updated_at, bread_updated_at
+        )
+
+    def test_invalid_cursor(self):
+        for since in ["", "-1", "abc", "²", str(2**63)]:
+            response = self.client.get(self.changes_url, {"since": since})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("since", response.json())
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get(self.changes_url).status_code, 401)
+
+
+class RecipeImportTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.import_url = reverse("import-recipes")
+        self.oil = Ingredient.objects.create(name="oil")
+        Recipe.objects.create(name="bread", description="Bla bla", author=self.user_1)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def test_import_ndjson(self):
+        rows = [
+            {"name": "cake", "description": "Sweet", "ingredients": ["flour", "oil"]},
+            "not json",
+            {"name": "bread", "description": "Other bread", "ingredients": []},
+            {"name": "pie", "description": "Sweet", "ingredients": ["flour"]},
+            {"name": "soup", "ingredients": ["water"]},
+            {"name": "salad", "description": "Green", "ingredients": ["oil", "oil"]},
+        ]
+        body = "\n".join(
+            row if isinstance(row, str) else json.dumps(row) for row in rows
+        )
+
+        response = self.client.post(
+            self.import_url, data=body, content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 2)
+        self.assertEqual(response.json()["failed"], 4)
+        self.assertEqual(
+            [error["line"] for error in response.json()["errors"]], [2, 5, 3, 4]
+        )
+        self.assertEqual(
+            list(Recipe.objects.get(name="cake").ingredients.values_list("name")),
+            [("oil",), ("flour",)],
+        )
+        self.assertEqual(Recipe.objects.get(name="salad").author, self.user_1)
+        self.assertEqual(
+            dict(Ingredient.objects.values_list("name", "recipe_count")),
+            {"oil": 2, "flour": 1},
+        )
+
+    def test_import_csv_in_batches(self):
+        lines = ["name,description,ingredients"] + [
+            f"recipe {i},description {i},oil;salt {i % 3}" for i in range(25)
+        ]
+
+        # Per chunk: 2 uniqueness checks, savepoint and release, ingredient lookup,
+        # 3 bulk inserts and 4 count updates, plus creating the ingredients once.
+        with self.assertNumQueries(3 * 12 + 2):
+            report = RecipeImporter(self.user_1, batch_size=10).run(read_csv(lines))
+
+        self.assertEqual((report.created, report.failed), (25, 0))
+        self.assertEqual(Ingredient.objects.get(name="oil").recipe_count, 25)
+        self.assertEqual(Ingredient.objects.get(name="salt 0").recipe_count, 9)
+
+    def test_import_invalid_utf8(self):
+        for content_type, lines in [
+            (
+                "application/x-ndjson",
+                [
+                    b'{"name": "cake", "description": "Sweet", "ingredients": []}',
+                    b'{"name": "pie\xff", "description": "Sweet", "ingredients": []}',
+                    b'{"name": "soup", "description": "Hot", "ingredients": []}',
+                ],
+            ),
+            (
+                "text/csv",
+                [
+                    b"name,description,ingredients",
+                    b"tart,Tangy,",
+                    b"stew,\xc3(,oil",
+                    b"salad,Green,oil",
+                ],
+            ),
+        ]:
+            response = self.client.post(
+                self.import_url, data=b"\n".join(lines), content_type=content_type
+            )
+
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(
+                (response.json()["created"], response.json()["failed"]), (2, 1)
+            )
+            self.assertEqual(response.json()["errors"][0]["line"], len(lines) - 1)
+
+        self.assertEqual(
+            set(Recipe.objects.values_list("name", flat=True)),
+            {"bread", "cake", "soup", "tart", "salad"},
+        )
+
+    def test_import_unsupported_media_type(self):
+        response = self.client.post(self.import_url, data="x", content_type="text/xml")
+        self.assertEqual(response.status_code, 415)
+
+    def test_import_recipes_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write("name,description,ingredients\ncake,Sweet,flour;oil\n")
+        self.addCleanup(os.remove, f.name)
+
+        stdout = StringIO()
+        call_command("import_recipes", f.name, author="Bo", stdout=stdout)
+
+        self.assertIn("Imported 1 recipes, 0 rows failed.", stdout.getvalue())
+        self.assertTrue(Recipe.objects.filter(name="cake").exists())
+
+
+class RecipeExportTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.export_url = reverse("recipes-export")
+        self.oil = Ingredient.objects.create(name="oil")
+        self.flour = Ingredient.objects.create(name="flour")
+        for i in range(25):
+            recipe = Recipe.objects.create(
+                name=f"recipe {i}", description=f"description {i}", author=self.user_1
+            )
+            recipe.ingredients.add(*[self.oil, self.flour][: i % 3])
+        Rating.objects.create(rate=4, user=self.user_2, recipe=recipe)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def get_export(self, params=None):
+        response = self.client.get(self.export_url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        response, content = self.get_export()
+        records = [json.loads(line) for line in content.splitlines()]
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(len(records), 25)
+        self.assertEqual(records[0]["name"], "recipe 0")
+        self.assertEqual(records[0]["ingredients"], [])
+        self.assertEqual(records[2]["ingredients"], ["oil", "flour"])
+        self.assertEqual(records[-1]["author"], self.user_1.pk)
+        self.assertEqual(
+            (records[-1]["rating_count"], records[-1]["avg_rating"]), (1, 4.0)
+        )
+
+    def test_export_json_array(self):
+        response, content = self.get_export({"output": "json"})
+
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(
+            [record["name"] for record in json.loads(content)],
+            [f"recipe {i}" for i in range(25)],
+        )
+
+        Recipe.objects.all().delete()
+        self.assertEqual(json.loads(self.get_export({"output": "json"})[1]), [])
+
+    def test_export_unknown_output(self):
+        response = self.client.get(self.export_url, {"output": "xml"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_queries_per_chunk(self):
+        # The recipes and the ingredients of each of the 3 chunks.
+        with self.assertNumQueries(3 * 2):
+            chunks = list(exporters.export_chunks(chunk_size=10))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+
+    def test_export_recipes_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "recipes.ndjson")
+            call_command("export_recipes", path, stdout=StringIO())
+
+            with open(path, encoding="utf-8") as stream:
+                Recipe.objects.all().delete()
+                report = RecipeImporter(self.user_2).run(read_ndjson(stream))
+
+        self.assertEqual((report.created, report.failed), (25, 0))
+        self.assertEqual(Recipe.objects.get(name="recipe 2").ingredients.count(), 2)
+
+
+class PaginationTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.recipes_list_url = reverse("recipes-list")
+        self.ingredients = [
+            Ingredient.objects.create(name=f"ingredient {i}") for i in range(4)
+        ]
+        for i in range(23):
+            recipe = Recipe.objects.create(
+                name=f"recipe {i}", description=f"description {i}", author=self.user_1
+            )
+            recipe.ingredients.add(*self.ingredients[: i % 4])
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def walk(self, params):
+        pages = []
+        response = self.client.get(self.recipes_list_url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            if not pages[-1]["next"]:
+                return pages
+            response = self.client.get(pages[-1]["next"])
+
+    def test_pages_cover_all_recipes_once(self):
+        pages = self.walk({"page_size": 5})
+        names = [recipe["name"] for page in pages for recipe in page["results"]]
+
+        self.assertEqual(len(pages), 5)
+        self.assertEqual(names, [f"recipe {i}" for i in reversed(range(23))])
+        self.assertIsNone(pages[0]["previous"])
+
+    def test_ordered_pages_break_ties_by_id(self):
+        pages = self.walk({"max_ingredients": 1, "page_size": 4})
+        names = [recipe["name"] for page in pages for recipe in page["results"]]
+        expected = Recipe.objects.annotate(count=Count("ingredients")).order_by(
+            "-count", "-id"
+        )
+
+        self.assertEqual(names, [recipe.name for recipe in expected])
+
+    def test_previous_link_returns_previous_page(self):
+        pages = self.walk({"min_ingredients": 1, "page_size": 6})
+        response = self.client.get(pages[2]["previous"])
+
+        self.assertEqual(response.json()["results"], pages[1]["results"])
+        self.assertEqual(response.json()["next"], pages[1]["next"])
+
+    def test_page_size_is_bounded(self):
+        paginator = KeysetPagination()
+        factory = APIRequestFactory()
+
+        for page_size, expected in [
+            ("7", 7),
+            ("100000", KeysetPagination.max_page_size),
+            ("0", KeysetPagination.page_size),
+            ("many", KeysetPagination.page_size),
+        ]:
+            request = Request(factory.get("/", {"page_size": page_size}))
+            self.assertEqual(paginator.get_page_size(request), expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.recipes_list_url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_forged_cursor(self):
+        for params, position in [
+            ({}, ["abc"]),
+            ({}, [{"x": 1}]),
+            ({}, [None]),
+            ({}, [[1]]),
+            ({"order": "best_rated"}, ["high", 1]),
+            ({"ingredients": self.ingredients[0].pk}, [1, "x", 1]),
+            ({}, [2**70]),
+            ({}, [-(2**70)]),
+            ({}, [float("inf")]),
+            ({"order": "best_rated"}, [float("nan"), 1]),
+        ]:
+            cursor = json.dumps({"r": 0, "p": position}).encode()
+            response = self.client.get(
+                self.recipes_list_url,
+                {**params, "cursor": urlsafe_b64encode(cursor).decode()},
+            )
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_page_emptied_since_its_cursor(self):
+        response = self.client.get(self.recipes_list_url, {"page_size": 22})
+        Recipe.objects.get(name="recipe 0").delete()
+
+        response = self.client.get(response.json()["next"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
+        self.assertIsNone(response.json()["next"])
+
+        response = self.client.get(response.json()["previous"])
+        names = [recipe["name"] for recipe in response.json()["results"]]
+        self.assertEqual(names, [f"recipe {i}" for i in reversed(range(2, 23))])
+
+
+class ResponseCacheTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.recipes_list_url = reverse("recipes-list")
+        self.my_recipes_url = reverse("my-recipes")
+        self.top_ingredients_url = reverse("top-ingredients")
+
+        self.oil = Ingredient.objects.create(name="oil")
+        self.bread = Recipe.objects.create(
+            name="bread", description="Bla bla", author=self.user_1
+        )
+        self.bread.ingredients.add(self.oil)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def names(self, url, data=None):
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return [recipe["name"] for recipe in response.json()["results"]]
+
+    def test_cached_response_skips_the_queries(self):
+        first = self.client.get(self.recipes_list_url)
+
+        # The user comes from the authentication cache, the rest from the response.
+        with self.assertNumQueries(0):
+            second = self.client.get(self.recipes_list_url)
+
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(first["Vary"], "Accept")
+        self.assertEqual(second["Vary"], "Accept")
+
+    def test_query_params_are_part_of_the_key(self):
+        Recipe.objects.create(name="cake", description="Sweet", author=self.user_1)
+
+        self.assertEqual(self.names(self.recipes_list_url), ["cake", "bread"])
+        self.assertEqual(
+            self.names(self.recipes_list_url, {"name": "bread"}), ["bread"]
+        )
+
+    @override_settings(ALLOWED_HOSTS=["a.example", "b.example"])
+    def test_hosts_are_part_of_the_key(self):
+        Recipe.objects.create(name="cake", description="Sweet", author=self.user_1)
+
+        for host in ["a.example", "b.example"]:
+            response = self.client.get(
+                self.recipes_list_url, {"page_size": 1}, HTTP_HOST=host
+            )
+            self.assertTrue(response.json()["next"].startswith(f"http://{host}/"))
+
+    def test_browsable_api_is_not_cached(self):
+        self.client.get(self.recipes_list_url)
+
+        response = self.client.get(self.recipes_list_url, HTTP_ACCEPT="text/html")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/html"))
+        self.assertNotIn("ETag", response)
+
+    def test_my_recipes_are_cached_per_user(self):
+        self.assertEqual(self.names(self.my_recipes_url), ["bread"])
+
+        access_token = self.client.post(
+            self.login_url, {"username": "Joe", "password": "password321"}
+        ).json()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + access_token)
+
+        self.assertEqual(self.names(self.my_recipes_url), [])
+
+    def test_writes_invalidate_cached_responses(self):
+        self.assertEqual(self.names(self.recipes_list_url), ["bread"])
+
+        cake = Recipe.objects.create(
+            name="cake", description="Sweet", author=self.user_1
+        )
+        self.assertEqual(self.names(self.recipes_list_url), ["cake", "bread"])
+
+        cake.ingredients.add(self.oil)
+        self.assertEqual(
+            self.client.get(self.top_ingredients_url).json()[0]["name"], "oil"
+        )
+        self.assertEqual(
+            len(
+                self.client.get(self.recipes_list_url).json()["results"][0][
+                    "ingredients"
+                ]
+            ),
+            1,
+        )
+
+        Rating.objects.create(rate=4, user=self.user_2, recipe=cake)
+        response = self.client.get(self.recipes_list_url)
+        self.assertEqual(response.json()["results"][0]["avg_rating"], 4)
+
+        cake.delete()
+        self.assertEqual(self.names(self.recipes_list_url), ["bread"])
+
+    def test_bulk_writes_invalidate_cached_responses(self):
+        self.assertEqual(self.names(self.my_recipes_url), ["bread"])
+
+        RecipeImporter(self.user_1).run(
+            read_csv(["name,description,ingredients", "cake,Sweet,oil"])
+        )
+
+        self.assertEqual(self.names(self.my_recipes_url), ["cake", "bread"])
+
+    def test_conditional_get(self):
+        response = self.client.get(self.recipes_list_url)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        response = self.client.get(self.recipes_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        response = self.client.get(
+            self.recipes_list_url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 304)
+
+        Recipe.objects.create(name="cake", description="Sweet", author=self.user_1)
+        response = self.client.get(self.recipes_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_concurrent_misses_wait_for_the_first_render(self):
+        cache = caches["responses"]
+        cache.add("key:lock", 1)
+        threading.Timer(0.05, cache.set, ["key", "rendered"]).start()
+
+        def render():
+            raise AssertionError("The response was rendered twice.")
+
+        self.assertEqual(response_cache.get_or_render("key", render), "rendered")
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = "django.core.cache.backends.filebased.FileBasedCache"
+            with override_settings(
+                CACHES={
+                    "default": {"BACKEND": backend, "LOCATION": location},
+                    "responses": {"BACKEND": backend, "LOCATION": location},
+                }
+            ):
+                first = self.client.get(self.recipes_list_url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(self.recipes_list_url)
+
+                self.assertEqual(second.content, first.content)
+                self.assertTrue(os.listdir(location))
+
+
+class AsyncListViewTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.oil = Ingredient.objects.create(name="oil")
+        self.bread = Recipe.objects.create(
+            name="bread", description="Bla bla", author=self.user_1
+        )
+        self.bread.ingredients.add(self.oil)
+        Recipe.objects.create(name="cake", description="Sweet", author=self.user_2)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        metrics.registry.reset()
+
+    def get(self, url_name, data=None, **headers):
+        # The async client of Django 4.0 takes header names as they are sent.
+        headers = {"authorization": "Bearer " + self.access_token, **headers}
+        return async_to_sync(self.async_client.get)(
+            reverse(url_name),
+            data,
+            **{
+                name.replace("_", "-"): value
+                for name, value in headers.items()
+                if value is not None
+            },
+        )
+
+    def test_async_views_answer_like_the_sync_ones(self):
+        for url_name, data in [
+            ("recipes-list", None),
+            ("recipes-list", {"name": "cake"}),
+            ("my-recipes", None),
+            ("top-ingredients", {"limit": 2}),
+        ]:
+            with self.subTest(url_name=url_name, data=data):
+                expected = self.client.get(reverse(url_name), data)
+                # Once rendered by the sync view, once from the cache.
+                for _ in range(2):
+                    response = self.get(f"{url_name}-async", data)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json(), expected.json())
+
+    def test_cache_hits_skip_the_sync_view(self):
+        first = self.get("recipes-list-async")
+
+        with mock.patch.object(
+            views.RecipesListView, "get", side_effect=AssertionError
+        ), self.assertNumQueries(0):
+            second = self.get("recipes-list-async")
+        self.assertEqual(second.content, first.content)
+        for header in ("Content-Type", "Vary", "Allow"):
+            self.assertEqual(second[header], first[header])
+
+        user_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get("recipes-list-async").content, first.content)
+
+        not_modified = self.get("recipes-list-async", if_none_match=first["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_errors_are_reported_by_the_sync_view(self):
+        self.get("top-ingredients-async")
+
+        self.assertEqual(
+            self.get("top-ingredients-async", authorization=None).status_code, 401
+        )
+        self.assertEqual(
+            self.get(
+                "top-ingredients-async", authorization="Bearer nonsense"
+            ).status_code,
+            401,
+        )
+        self.assertEqual(
+            self.get("top-ingredients-async", {"limit": 0}).status_code, 400
+        )
+
+        self.user_1.is_active = False
+        self.user_1.save()
+        self.assertEqual(self.get("top-ingredients-async").status_code, 401)
+
+    def test_async_requests_are_measured(self):
+        response = self.get("recipes-list-async")
+        # The user, the recipes and their ingredients.
+        self.assertIn('desc="3 queries"', response["Server-Timing"])
+        self.assertEqual(
+            metrics.registry.requests["recipes-list-async", "GET", "200"], 1
+        )
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False})
+class ValuesSerializerTestCase(APIViewTestCase):
+    """
+    The values() list path must render exactly what the ModelSerializers render.
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        ingredients = [
+            Ingredient.objects.create(name=name)
+            for name in ["oil", "flour", "crème fraîche", 'salt "fine"', "egg"]
+        ]
+        raters = [
+            User.objects.create_user(f"Rater {i}", f"rater_{i}@gmail.com", "password")
+            for i in range(2)
+        ]
+        for i in range(12):
+            recipe = Recipe.objects.create(
+                name=f"recipe {i} ünïcode",
+                description=f"description {i}\nwith a newline",
+                author=self.user_1 if i % 2 else self.user_2,
+            )
+            recipe.ingredients.add(*ingredients[i % 5 :: 2])
+            # Fractional averages, which the API truncates.
+            if i % 3:
+                Rating.objects.create(rate=1 + i % 5, user=raters[0], recipe=recipe)
+                Rating.objects.create(rate=4, user=raters[1], recipe=recipe)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+    def assertSameContent(self, view, url, params=None):
+        response = self.client.get(url, params)
+        with mock.patch.object(view, "values_serializer_class", None):
+            expected = self.client.get(url, params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content, params)
+        return response
+
+    def test_recipes_list(self):
+        ingredient_ids = ",".join(
+            str(pk) for pk in Ingredient.objects.values_list("id", flat=True)[:3]
+        )
+        for params in [
+            None,
+            {"page_size": 5},
+            {"name": "recipe 3 ünïcode"},
+            {"q": "recipe"},
+            {"max_ingredients": 1, "page_size": 4},
+            {"min_ingredients": 1},
+            {"ingredients": ingredient_ids},
+            {"ingredients": ingredient_ids, "match": "all"},
+            {"ingredients": ingredient_ids, "missing": 1},
+            {"author": self.user_1.pk, "order": "best_rated"},
+            {
+                "author": self.user_2.pk,
+                "ingredients": ingredient_ids,
+                "order": "fewest_ingredients",
+            },
+        ]:
+            self.assertSameContent(
+                views.RecipesListView, reverse("recipes-list"), params
+            )
+
+        response = self.client.get(reverse("recipes-list"), {"page_size": 5})
+        self.assertSameContent(views.RecipesListView, response.json()["next"])
+
+    def test_my_recipes(self):
+        self.assertSameContent(
+            views.MyRecipesListView, reverse("my-recipes"), {"page_size": 3}
+        )
+
+    @override_settings(TOP_RECIPES={"MIN_RATINGS": 1, "PRIOR_MEAN": 3.0})
+    def test_top_recipes(self):
+        Recipe.objects.refresh_rating_aggregates()
+        ingredient = Ingredient.objects.get(name="crème fraîche")
+        for params in [
+            None,
+            {"author": self.user_1.pk},
+            {"ingredient": ingredient.pk, "page_size": 2},
+        ]:
+            self.assertSameContent(views.TopRecipesView, reverse("top-recipes"), params)
+
+        response = self.client.get(
+            reverse("top-recipes"), {"ingredient": ingredient.pk, "page_size": 2}
+        )
+        self.assertSameContent(views.TopRecipesView, response.json()["next"])
+
+    def test_top_ingredients(self):
+        for params in [None, {"limit": 3}]:
+            self.assertSameContent(
+                views.TopIngredientsListView, reverse("top-ingredients"), params
+            )
+
+    def test_ratings(self):
+        ratings = Rating.objects.order_by("id")
+        self.assertEqual(
+            RatingValuesSerializer(ratings.values(*RatingValuesSerializer.fields)).data,
+            [RatingSerializer(rating).data for rating in ratings],
+        )
+
+
+@override_settings(RESPONSE_CACHE={"ENABLED": False}, METRICS={"TOKEN": "secret"})
+class MetricsTestCase(APIViewTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.recipes_list_url = reverse("recipes-list")
+        self.metrics_url = reverse("metrics")
+        recipe = Recipe.objects.create(
+            name="bread", description="Bla bla", author=self.user_1
+        )
+        recipe.ingredients.add(Ingredient.objects.create(name="oil"))
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        metrics.registry.reset()
+
+    def get_metrics(self):
+        # A client of its own, as the credentials of self.client take precedence.
+        client = self.client_class()
+        return client.get(self.metrics_url, HTTP_AUTHORIZATION="Bearer secret")
+
+    def test_server_timing_header(self):
+        response = self.client.get(self.recipes_list_url)
+        timings = {
+            entry.split(";")[0]: entry
+            for entry in response["Server-Timing"].split(", ")
+        }
+
+        self.assertEqual(set(timings), {"app", "db", "serialize"})
+        self.assertIn('desc="3 queries"', timings["db"])
+
+    def test_metrics_endpoint(self):
+        self.client.get(self.recipes_list_url)
+        self.client.get(self.recipes_list_url)
+        self.client.get(self.recipes_list_url, {"cursor": "garbage"})
+        self.client.get("/no/such/page/")
+
+        lines = self.get_metrics().content.decode().splitlines()
+
+        labels = 'view="recipes-list",method="GET"'
+        self.assertIn(f'cookbook_http_requests_total{{{labels},status="200"}} 2', lines)
+        self.assertIn(f'cookbook_http_requests_total{{{labels},status="404"}} 1', lines)
+        self.assertIn(
+            f'cookbook_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3',
+            lines,
+        )
+        self.assertIn(
+            f'cookbook_db_queries_per_request_bucket{{{labels},le="3"}} 3', lines
+        )
+        # The user is only loaded by the first request.
+        self.assertIn(f"cookbook_db_queries_per_request_sum{{{labels}}} 5", lines)
+        self.assertTrue(
+            any(
+                line.startswith(
+                    f'cookbook_section_seconds_total{{{labels},section="serialize"}}'
+                )
+                for line in lines
+            )
+        )
+        self.assertIn(
+            'cookbook_http_requests_total{view="unresolved",method="GET",status="404"} 1',
+            lines,
+        )
+
+    def test_metrics_token(self):
+        self.assertEqual(self.get_metrics().status_code, 200)
+
+        self.client.credentials()
+        self.assertEqual(self.client.get(self.metrics_url).status_code, 403)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(self.client.get(self.metrics_url).status_code, 403)
+
+        # Closed to everyone without a token.
+        with override_settings(METRICS={"TOKEN": ""}):
+            self.client.credentials(HTTP_AUTHORIZATION="Bearer ")
+            self.assertEqual(self.client.get(self.metrics_url).status_code, 403)
+            self.assertEqual(self.get_metrics().status_code, 403)
+
+    def test_slow_request_log(self):
+        with override_settings(METRICS={"SLOW_REQUEST_THRESHOLD": 0}):
+            with self.assertLogs("cookbook.metrics", "WARNING") as logs:
+                self.client.get(self.recipes_list_url)
+
+        self.assertIn("Slow request GET /recipes_list/ (200)", logs.output[0])
+        self.assertIn('FROM "cookbook_recipe"', logs.output[0])
+
+    def test_disabled(self):
+        with override_settings(METRICS={"ENABLED": False}):
+            response = self.client.get(self.recipes_list_url)
+
+        self.assertNotIn("Server-Timing", response)
+        self.assertNotIn("recipes-list", self.get_metrics().content.decode())
+
+
+class SeedingTestCase(TestCase):
+    sizes = {"users": 10, "ingredients": 80, "recipes": 200, "ratings": 600}
+
+    def test_datasets_are_reproducible(self):
+        DatasetSeeder(**self.sizes, seed=7).run()
+        first = list(Recipe.objects.order_by("id").values_list("name", "description"))
+        ratings = Rating.objects.count()
+
+        stdout = StringIO()
+        call_command(
+            "seed_cookbook",
+            "--clear",
+            "--seed",
+            "7",
+            stdout=stdout,
+            **{name: size for name, size in self.sizes.items()},
+        )
+
+        self.assertEqual(
+            list(Recipe.objects.order_by("id").values_list("name", "description")),
+            first,
+        )
+        self.assertEqual(ratings, self.sizes["ratings"])
+        self.assertEqual(Rating.objects.count(), ratings)
+        self.assertEqual(
+            User.objects.filter(username__startswith="seed_user_").count(), 10
+        )
+
+    def test_popularity_is_zipf_distributed(self):
+        DatasetSeeder(**self.sizes).run()
+        counts = list(
+            Ingredient.objects.top_ingredients(80).values_list(
+                "recipe_count", flat=True
+            )
+        )
+
+        self.assertEqual(Ingredient.objects.top_ingredients(1).get().name, "salt")
+        self.assertGreater(counts[0], 4 * counts[len(counts) // 2])
+        self.assertEqual(
+            Recipe.objects.aggregate(total=Sum("rating_count"))["total"],
+            self.sizes["ratings"],
+        )
+
+    def test_seeding_needs_an_empty_catalog(self):
+        Recipe.objects.create(
+            name="bread",
+            description="Bla bla",
+            author=User.objects.create_user("Bo", "bo@gmail.com", "password321"),
+        )
+        with self.assertRaises(CommandError):
+            call_command("seed_cookbook", stdout=StringIO())
+
+
+class SeedClearTestCase(TransactionTestCase):
+    def test_clear_replaces_a_seeded_catalog(self):
+        # Committed, unlike in a TestCase, so that the foreign keys are checked.
+        for _ in range(2):
+            call_command(
+                "seed_cookbook",
+                "--clear",
+                users=3,
+                ingredients=20,
+                recipes=30,
+                ratings=40,
+                stdout=StringIO(),
+            )
+
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertEqual(
+            RecipeBucket.objects.values("recipe_id").distinct().count(),
+            Recipe.objects.filter(ingredient_count__gt=0).count(),
+        )
+
+
+class BenchmarkTestCase(TestCase):
+    def setUp(self):
+        user_cache.clear()
+
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(
+            benchmarks.uncovered_routes(benchmarks.default_scenarios()), []
+        )
+
+    @override_settings(METRICS={"TOKEN": "secret"})
+    def test_benchmark_api_command(self):
+        DatasetSeeder(users=5, ingredients=30, recipes=40, ratings=60).run()
+        counts = (Recipe.objects.count(), Rating.objects.count(), User.objects.count())
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark_api",
+                requests=2,
+                warmup=1,
+                output=output,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+            with open(output, encoding="utf-8") as f:
+                report = json.load(f)
+
+        results = report["results"]
+        self.assertEqual(
+            set(results), {scenario.name for scenario in benchmarks.default_scenarios()}
+        )
+        for name, result in results.items():
+            self.assertEqual(result["errors"], 0, (name, result["status_codes"]))
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        self.assertEqual(results["recipes_list"]["queries_mean"], 2)
+        self.assertEqual(report["dataset"]["recipes"], 40)
+
+        # The rows written by the benchmark are deleted afterwards.
+        self.assertEqual(
+            (Recipe.objects.count(), Rating.objects.count(), User.objects.count()),
+            counts,
+        )
+
+    def test_compare_flags_regressions(self):
+        baseline = {"a": {"p95_ms": 10.0}, "b": {"p95_ms": 10.0}}
+        results = {"a": {"p95_ms": 11.0}, "b": {"p95_ms": 13.0}, "c": {"p95_ms": 1}}
+
+        self.assertEqual(
+            [
+                (name, regressed)
+                for name, *_, regressed in benchmarks.compare(results, baseline)
+            ],
+            [("a", False), ("b", True)],
+        )
+
+
+class ConcurrencyBenchmarkTestCase(TransactionTestCase):
+    """
+    The benchmark serves requests from other threads, which only see committed rows.
+    """
+
+    def setUp(self):
+        caches["responses"].clear()
+        user_cache.clear()
+        ingredients.ingredient_cache.clear()
+
+    def test_benchmark_concurrency_command(self):
+        DatasetSeeder(users=5, ingredients=30, recipes=40, ratings=60).run()
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark_concurrency",
+                clients=[1, 3],
+                requests=2,
+                client_delay=0,
+                output=output,
+                stdout=StringIO(),
+            )
+            with open(output, encoding="utf-8") as f:
+                results = json.load(f)["results"]
+
+        self.assertEqual(set(results), {name for name, *_ in benchmarks.ASYNC_ROUTES})
+        for name, servers in results.items():
+            for server in ("wsgi", "asgi"):
+                self.assertEqual(set(servers[server]), {"1", "3"})
+                for clients, result in servers[server].items():
+                    self.assertEqual(result["requests"], 2 * int(clients))
+                    self.assertEqual(result["errors"], 0, (name, server, result))
+                    self.assertGreaterEqual(result["peak_threads"], 1)
+
+        # The benchmark's user is deleted afterwards.
+        self.assertEqual(User.objects.count(), 5)
+
+
+#########################################################################################
+# Query budget tests
+#########################################################################################
+class QueryBudgetTestCase(APITestCase):
+    """
+    List endpoints must run a fixed number of queries however many rows they return.
+    """
+
+    recipes_count = 2000
+    ingredients_count = 60
+    ingredients_per_recipe = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chef = User.objects.create_user("Chef", "chef@gmail.com", "password321")
+
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ingredient {i}") for i in range(cls.ingredients_count)
+        )
+        ingredient_ids = list(Ingredient.objects.values_list("id", flat=True))
+
+        Recipe.objects.bulk_create(
+            Recipe(name=f"Recipe {i}", description=f"Description {i}", author=cls.chef)
+            for i in range(cls.recipes_count)
+        )
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True))
+
+        Through = Recipe.ingredients.through
+        Through.objects.bulk_create(
+            Through(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_ids[(n + offset) % len(ingredient_ids)],
+            )
+            for n, recipe_id in enumerate(recipe_ids)
+            for offset in range(cls.ingredients_per_recipe)
+        )
+        similarity.rebuild()
+
+    def setUp(self):
+        # Bulk seeding skips invalidation; measure uncached responses.
+        caches["responses"].clear()
+        user_cache.clear()
+        ingredients.ingredient_cache.clear()
+        self.client = APIClient()
+        access_token = self.client.post(
+            reverse("login"), {"username": "Chef", "password": "password321"}
+        ).json()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + access_token)
+
+        # Load the user into the authentication cache, as any earlier request would.
+        self.client.get(reverse("top-ingredients"), {"limit": 1})
+
+    def assertQueryBudget(self, url, budget, data=None):
+        with self.assertNumQueries(budget):
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_recipes_list_query_budget(self):
+        # Recipes and one batched ingredients query.
+        response = self.assertQueryBudget(reverse("recipes-list"), 2)
+        results = response.json()["results"]
+        self.assertEqual(len(results), KeysetPagination.page_size)
+        self.assertEqual(len(results[0]["ingredients"]), self.ingredients_per_recipe)
+
+    def test_recipes_list_ordered_query_budget(self):
+        self.assertQueryBudget(reverse("recipes-list"), 2, {"max_ingredients": 1})
+        self.assertQueryBudget(reverse("recipes-list"), 2, {"min_ingredients": 1})
+
+    def test_recipes_list_filtered_query_budget(self):
+        self.assertQueryBudget(reverse("recipes-list"), 2, {"name": "Recipe 1"})
+
+    def test_recipes_list_combined_query_budget(self):
+        ingredient = Ingredient.objects.order_by("id")[0]
+        self.assertQueryBudget(
+            reverse("recipes-list"),
+            2,
+            {"author": self.chef.pk, "ingredients": ingredient.pk, "order": "oldest"},
+        )
+
+    def test_my_recipes_query_budget(self):
+        response = self.assertQueryBudget(reverse("my-recipes"), 2)
+        self.assertEqual(len(response.json()["results"]), KeysetPagination.page_size)
+
+    def test_last_page_query_budget(self):
+        response = self.client.get(
+            reverse("recipes-list"), {"page_size": KeysetPagination.max_page_size}
+        )
+        while response.json()["next"]:
+            next_url = response.json()["next"]
+            response = self.assertQueryBudget(next_url, 2)
+
+    def test_top_ingredients_query_budget(self):
+        self.assertQueryBudget(reverse("top-ingredients"), 1)
+
+    def test_top_recipes_query_budget(self):
+        Recipe.objects.update(bayesian_rating=4.0)
+        RecipeIngredient.objects.update(bayesian_rating=4.0)
+        ingredient = Ingredient.objects.order_by("id")[0]
+
+        response = self.assertQueryBudget(reverse("top-recipes"), 2)
+        self.assertEqual(len(response.json()["results"]), KeysetPagination.page_size)
+        self.assertQueryBudget(reverse("top-recipes"), 2, {"author": self.chef.pk})
+        self.assertQueryBudget(reverse("top-recipes"), 2, {"ingredient": ingredient.pk})
+
+    def test_changes_query_budget(self):
+        # The changes, then the ingredients, the recipes and their ingredients.
+        response = self.assertQueryBudget(reverse("changes"), 4, {"limit": 1000})
+        self.assertEqual(len(response.json()["results"]), 1000)
+
+    def test_similar_recipes_query_budget(self):
+        # The recipe, its ingredients, the candidates and their ingredients, then
+        # the similar recipes and their ingredients.
+        recipe = Recipe.objects.order_by("id")[0]
+        response = self.assertQueryBudget(
+            reverse("similar-recipes", args=[recipe.pk]), 6, {"limit": 50}
+        )
+        self.assertEqual(len(response.json()), 50)
@@ -1,6 +1,7 @@
 from django.urls import path
 from rest_framework_simplejwt import views as jwt_views
 from . import views
+from .metrics import metrics_view
 
 urlpatterns = [
     path("register/", views.RegisterView.as_view(), name="register"),
@@ -10,6 +11,9 @@ urlpatterns = [
     ),
     path("add_recipe/", views.RecipeCreateView.as_view(), name="add-recipe"),
     path("add_rating/", views.RatingView.as_view(), name="add-rating"),
+    path("add_ratings/", views.RatingBatchView.as_view(), name="add-ratings"),
+    path("import_recipes/", views.RecipeImportView.as_view(), name="import-recipes"),
+    path("recipes_export/", views.RecipeExportView.as_view(), name="recipes-export"),
     path("recipes_list/", views.RecipesListView.as_view(), name="recipes-list"),
     path(
         "top_ingredients/",
@@ -17,4 +21,34 @@ urlpatterns = [
         name="top-ingredients",
     ),
     path("my_recipes/", views.MyRecipesListView.as_view(), name="my-recipes"),
+    path("top_recipes/", views.TopRecipesView.as_view(), name="top-recipes"),
+    path(
+        "ingredients/autocomplete/",
+        views.IngredientAutocompleteView.as_view(),
+        name="ingredient-autocomplete",
+    ),
+    path(
+        "recipes/<int:pk>/similar/",
+        views.SimilarRecipesView.as_view(),
+        name="similar-recipes",
+    ),
+    path("changes/", views.ChangesView.as_view(), name="changes"),
+    # Async versions of the list views, for ASGI deployments.
+    path(
+        "async/recipes_list/",
+        views.as_async_view(views.RecipesListView),
+        name="recipes-list-async",
+    ),
+    path(
+        "async/top_ingredients/",
+        views.as_async_view(views.TopIngredientsListView),
+        name="top-ingredients-async",
+    ),
+    path(
+        "async/my_recipes/",
+        views.as_async_view(views.MyRecipesListView),
+        name="my-recipes-async",
+    ),
+    # No trailing slash: the path Prometheus scrapes by default.
+    path("metrics", metrics_view, name="metrics"),
 ]
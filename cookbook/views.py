@@ -1,37 +1,138 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
+from rest_framework.exceptions import (
+    APIException,
+    NotFound,
+    UnsupportedMediaType,
+    ValidationError,
+)
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth.models import User
 
+from cookbook import (
+    autocomplete,
+    changes,
+    db,
+    exporters,
+    response_cache,
+    similarity,
+)
+from cookbook.metrics import timed
+from cookbook.importers import CSV, NDJSON, READERS, RecipeImporter
+from cookbook.filters import filter_recipes
 from cookbook.models import Ingredient, Recipe
+from .pagination import KeysetPagination
+from .response_cache import CachedResponseMixin
 from .serializers import (
     IngredientListSerializer,
+    IngredientListValuesSerializer,
     IngredientSerializer,
+    RatingBatchSerializer,
     RatingSerializer,
     RecipeListSerializer,
+    RecipeListValuesSerializer,
     RecipeSerializer,
     RegisterSerializer,
 )
 from rest_framework import generics
-from django.db.models import Count
 
 
-class IngredientCreateView(generics.CreateAPIView):
+class RetryOnBusyMixin:
+    """
+    Save in a transaction, run again while the database is locked.
+    """
+
+    def perform_create(self, serializer):
+        db.retry_on_busy(super().perform_create)(serializer)
+
+
+class IngredientCreateView(RetryOnBusyMixin, generics.CreateAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = IngredientSerializer
 
 
-class RecipeCreateView(generics.CreateAPIView):
+class RecipeCreateView(RetryOnBusyMixin, generics.CreateAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = RecipeSerializer
 
 
-class RatingView(generics.CreateAPIView):
+class RatingView(RetryOnBusyMixin, generics.CreateAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = RatingSerializer
 
 
-class RegisterView(generics.CreateAPIView):
+class RatingBatchView(RetryOnBusyMixin, generics.CreateAPIView):
+    """
+    Rate many recipes at once, overwriting the user's previous rates.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = RatingBatchSerializer
+    max_batch_size = 500
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs["many"] = True
+        kwargs["max_length"] = self.max_batch_size
+        return super().get_serializer(*args, **kwargs)
+
+
+class RecipeImportView(APIView):
+    """
+    Import recipes authored by the user from an NDJSON or CSV request body.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    formats = {
+        "application/x-ndjson": NDJSON,
+        "application/ndjson": NDJSON,
+        "text/csv": CSV,
+    }
+
+    def post(self, request, *args, **kwargs):
+        media_type = request.content_type.split(";")[0].strip().lower()
+        if media_type not in self.formats:
+            raise UnsupportedMediaType(media_type)
+
+        # Read the body line by line instead of loading it into memory.
+        rows = READERS[self.formats[media_type]](request.stream or [])
+        report = RecipeImporter(author=request.user).run(rows)
+
+        return Response(report.as_dict(), status=201 if report.created else 200)
+
+
+class RecipeExportView(APIView):
+    """
+    Stream every recipe as NDJSON or, with ``?output=json``, a JSON array.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    chunk_size = 1000
+
+    def get(self, request, *args, **kwargs):
+        # ``format`` is taken by DRF's format override, hence ``output``.
+        export_format = request.query_params.get("output", exporters.NDJSON)
+        if export_format not in exporters.FORMATS:
+            raise ValidationError(
+                {"output": f"Expected one of: {', '.join(exporters.FORMATS)}."}
+            )
+
+        response = StreamingHttpResponse(
+            exporters.export(export_format, chunk_size=self.chunk_size),
+            content_type=exporters.CONTENT_TYPES[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="recipes.{export_format}"'
+        )
+        return response
+
+
+class RegisterView(RetryOnBusyMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = RegisterSerializer
@@ -51,62 +152,304 @@ class RegisterView(generics.CreateAPIView):
 #################################################
 
 
-class RecipesListView(generics.ListAPIView):
+class ReadDatabaseMixin:
+    """
+    Read from the read-only database connection, when one is configured.
+    """
+
+    def get(self, request, *args, **kwargs):
+        with db.read_database():
+            return super().get(request, *args, **kwargs)
+
+
+class ValuesListMixin:
+    """
+    List through ``values_serializer_class``, a fast read-only equivalent of the
+    view's serializer working on ``values()`` rows.
+    """
+
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        serializer_class = self.values_serializer_class
+        if serializer_class is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = serializer_class.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        with timed("serialize"):
+            data = serializer_class(queryset if page is None else page).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+class RecipesListView(
+    ReadDatabaseMixin, CachedResponseMixin, ValuesListMixin, generics.ListAPIView
+):
     permission_classes = (IsAuthenticated,)
     serializer_class = RecipeListSerializer
+    values_serializer_class = RecipeListValuesSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
+        # Every supported parameter combines, see cookbook/filters.py.
+        queryset = filter_recipes(Recipe.objects.all(), self.request.query_params)
 
-        # Check and apply filters.
-        if self.request.query_params:
-            # Filter by name.
-            if "name" in self.request.query_params.keys():
-                return Recipe.objects.filter(name=self.request.query_params["name"])
+        # Fetch every page's ingredients in one query instead of one per recipe.
+        return queryset.prefetch_related("ingredients")
 
-            # Filter by description (exact).
-            elif "description" in self.request.query_params.keys():
-                return Recipe.objects.filter(
-                    description=self.request.query_params["description"]
-                )
-
-            # Filter by ingredients (ids).
-            elif "ingredients" in self.request.query_params.keys():
-                return Recipe.objects.filter(
-                    ingredients__in=self.request.query_params["ingredients"]
-                )
 
-            # Order by max number of ingredients.
-            elif "max_ingredients" in self.request.query_params.keys():
-                return Recipe.objects.annotate(
-                    ingredients_count=Count("ingredients")
-                ).order_by("-ingredients_count")
-
-            # Order by min number of ingredients.
-            elif "min_ingredients" in self.request.query_params.keys():
-                return Recipe.objects.annotate(
-                    ingredients_count=Count("ingredients")
-                ).order_by("ingredients_count")
+class MyRecipesListView(
+    ReadDatabaseMixin, CachedResponseMixin, ValuesListMixin, generics.ListAPIView
+):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = RecipeListSerializer
+    values_serializer_class = RecipeListValuesSerializer
+    pagination_class = KeysetPagination
+    cache_vary_on_user = True
 
-            # If filter parameter is unrecognized, return all recipes.
-            else:
-                return Recipe.objects.all()
+    def get_queryset(self):
+        queryset = Recipe.objects.filter(author=self.request.user).order_by("-id")
+        return queryset.prefetch_related("ingredients")
 
-        return Recipe.objects.all()
 
+class TopRecipesView(
+    ReadDatabaseMixin, CachedResponseMixin, ValuesListMixin, generics.ListAPIView
+):
+    """
+    The recipes with the best Bayesian rating, among those with at least
+    ``TOP_RECIPES["MIN_RATINGS"]`` ratings, of an ``author`` or with an
+    ``ingredient`` if given. Every page is a range of an index on the stored
+    scores, see ``bayesian_rating`` in cookbook/models.py.
+    """
 
-class MyRecipesListView(generics.ListAPIView):
     permission_classes = (IsAuthenticated,)
     serializer_class = RecipeListSerializer
+    values_serializer_class = RecipeListValuesSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        queryset = Recipe.objects.filter(author=self.request.user)
-        return queryset
+        params = self.request.query_params
+        queryset = Recipe.objects.all()
+
+        if "author" in params:
+            queryset = queryset.filter(author_id=self.get_id_param("author"))
+
+        # Ranked on the links' copy of the scores, in the ingredient's index.
+        if "ingredient" in params:
+            return (
+                queryset.filter(
+                    recipeingredient__ingredient_id=self.get_id_param("ingredient")
+                )
+                .annotate(ingredient_rating=F("recipeingredient__bayesian_rating"))
+                .filter(ingredient_rating__isnull=False)
+                .order_by("-ingredient_rating", "-id")
+            )
+        return queryset.top_rated()
 
+    def get_id_param(self, name):
+        try:
+            value = int(self.request.query_params[name])
+        except ValueError:
+            value = 0
+        if not 0 < value <= db.MAX_INTEGER:
+            raise ValidationError({name: "Expected an integer id."})
+        return value
 
-class TopIngredientsListView(generics.ListAPIView):
+
+class LimitMixin:
+    """
+    Read the number of results from the ``limit`` query parameter.
+    """
+
+    default_limit = 10
+    max_limit = 100
+
+    def get_limit(self):
+        limit = self.request.query_params.get("limit", self.default_limit)
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = 0
+        if not 0 < limit <= self.max_limit:
+            raise ValidationError(
+                {"limit": f"Must be an integer between 1 and {self.max_limit}."}
+            )
+        return limit
+
+
+class TopIngredientsListView(
+    ReadDatabaseMixin,
+    CachedResponseMixin,
+    LimitMixin,
+    ValuesListMixin,
+    generics.ListAPIView,
+):
     permission_classes = (IsAuthenticated,)
     serializer_class = IngredientListSerializer
+    values_serializer_class = IngredientListValuesSerializer
+    default_limit = 5
 
     def get_queryset(self):
-        queryset = Ingredient.objects.top_ingredients()
+        queryset = Ingredient.objects.top_ingredients(self.get_limit())
         return queryset
+
+
+class IngredientAutocompleteView(LimitMixin, generics.GenericAPIView):
+    """
+    The ingredients whose name, or a word of it, starts with ``prefix``, the most
+    used first. Served from memory, see cookbook/autocomplete.py.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    max_limit = 50
+
+    def get(self, request, *args, **kwargs):
+        prefix = request.query_params.get("prefix", "")
+        if not autocomplete.fold(prefix).strip():
+            raise ValidationError({"prefix": "This query parameter is required."})
+
+        matches = autocomplete.ingredient_index.search(prefix, self.get_limit())
+        return Response(
+            [{"name": name, "id": ingredient_id} for ingredient_id, name in matches]
+        )
+
+
+class SimilarRecipesView(
+    ReadDatabaseMixin, CachedResponseMixin, LimitMixin, generics.ListAPIView
+):
+    """
+    The recipes whose ingredients are closest to a recipe's, most similar first,
+    with their id and Jaccard ``similarity``.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    queryset = Recipe.objects.only("id")
+    max_limit = 50
+
+    def get_object(self):
+        # The url converter takes any digits, beyond the range of a row id.
+        if self.kwargs["pk"] > db.MAX_INTEGER:
+            raise NotFound()
+        return super().get_object()
+
+    def list(self, request, *args, **kwargs):
+        matches = similarity.similar_recipes(self.get_object().pk, self.get_limit())
+
+        queryset = Recipe.objects.filter(pk__in=[pk for pk, _ in matches]).order_by()
+        rows = {row["id"]: row for row in RecipeListValuesSerializer.values(queryset)}
+        with timed("serialize"):
+            data = RecipeListValuesSerializer([rows[pk] for pk, _ in matches]).data
+        return Response(
+            [
+                {"id": pk, **recipe, "similarity": round(score, 3)}
+                for (pk, score), recipe in zip(matches, data)
+            ]
+        )
+
+
+class ChangesView(ReadDatabaseMixin, LimitMixin, generics.ListAPIView):
+    """
+    What was created, updated or deleted after the ``since`` cursor, oldest
+    first: every change to recipes and ingredients, and to the user's ratings.
+    Without ``since``, the whole current catalog.
+
+    Clients follow ``next`` until it is null, then keep ``cursor`` for their
+    next sync. See cookbook/changes.py.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    default_limit = 100
+    max_limit = 1000
+
+    def list(self, request, *args, **kwargs):
+        since = self.get_since()
+        entries, cursor, has_more = changes.changes_since(
+            since or 0,
+            self.get_limit(),
+            request.user.pk,
+            include_deleted=since is not None,
+        )
+        next_url = None
+        if has_more:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), "since", cursor
+            )
+        return Response({"cursor": cursor, "next": next_url, "results": entries})
+
+    def get_since(self):
+        since = self.request.query_params.get("since")
+        if since is None:
+            return None
+        if not (since.isascii() and since.isdigit()) or int(since) > db.MAX_INTEGER:
+            raise ValidationError({"since": "Expected a cursor returned by this view."})
+        return int(since)
+
+
+#################################################
+# Async list views
+#################################################
+
+
+def as_async_view(view_class):
+    """
+    Return an async view serving the cached list view ``view_class``.
+
+    Authentication and response cache hits are handled on the event loop, with
+    no worker thread. Anything else, cache misses included, goes to the sync view
+    in a worker thread: Django 4.0's ORM has no async interface yet.
+    """
+    sync_view = sync_to_async(view_class.as_view())
+
+    async def view(request, *args, **kwargs):
+        response = None
+        if request.method == "GET":
+            response = await cached_response(view_class, request, *args, **kwargs)
+        if response is None:
+            response = await sync_view(request, *args, **kwargs)
+        return response
+
+    # Like DRF views, authentication is by token only.
+    view.csrf_exempt = True
+    return view
+
+
+async def cached_response(view_class, request, *args, **kwargs):
+    """
+    Return the cached response to ``request``, or None if the sync view has to
+    answer: on a cache miss, and on any error so that it is reported as usual.
+    """
+    if not settings.RESPONSE_CACHE.get("ENABLED", True):
+        return None
+
+    view = view_class()
+    view.setup(request, *args, **kwargs)
+    request = view.initialize_request(request, *args, **kwargs)
+    view.request = request
+    view.headers = view.default_response_headers
+
+    try:
+        for authenticator in request.authenticators:
+            if not hasattr(authenticator, "aauthenticate"):
+                return None
+            user_auth_tuple = await authenticator.aauthenticate(request)
+            if user_auth_tuple is not None:
+                request.user, request.auth = user_auth_tuple
+                break
+        else:
+            return None
+        # Content negotiation and permissions, the user being set already.
+        view.initial(request, *args, **kwargs)
+    except APIException:
+        return None
+
+    # The cache is read on the event loop, which suits in-memory and file caches.
+    key = response_cache.cache_key(
+        response_cache.get_version(), request, view.cache_vary_on_user
+    )
+    entry = response_cache.get_cache().get(key)
+    if entry is None:
+        return None
+    response = response_cache.entry_response(request, entry)
+    return view.finalize_response(request, response, *args, **kwargs)
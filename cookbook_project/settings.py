@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that it times the whole request (see cookbook/metrics.py).
+    "cookbook.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -77,13 +79,51 @@ WSGI_APPLICATION = "cookbook_project.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# "production" turns on WAL, tuned pragmas, persistent connections and a separate
+# read-only connection for the list views (see cookbook/db.py).
+DATABASE_PROFILE = config("DATABASE_PROFILE", default="development")
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Seconds a write waits for the lock before "database is locked".
+        "OPTIONS": {"timeout": config("DATABASE_BUSY_TIMEOUT", default=5, cast=float)},
     }
 }
 
+SQLITE = {
+    "PRAGMAS": {},
+    "READ_DATABASE": None,
+    # Transactions failing on a locked database are run again this many times.
+    "BUSY_RETRIES": 3,
+    "BUSY_BACKOFF": 0.05,
+}
+
+if DATABASE_PROFILE == "production":
+    DATABASES["default"]["CONN_MAX_AGE"] = config(
+        "DATABASE_CONN_MAX_AGE", default=600, cast=int
+    )
+    DATABASES["read"] = {
+        **DATABASES["default"],
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+    # Write transactions take the lock when they start (see cookbook/backends).
+    DATABASES["default"]["ENGINE"] = "cookbook.backends.sqlite3"
+    DATABASES["default"]["OPTIONS"]["transaction_mode"] = "IMMEDIATE"
+    DATABASE_ROUTERS = ["cookbook.db.ReadRouter"]
+    SQLITE["PRAGMAS"] = {
+        "journal_mode": "wal",
+        # Durable across application crashes, fsyncs at checkpoints only.
+        "synchronous": "normal",
+        # 64 MiB page cache per connection and 256 MiB memory map.
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "memory",
+    }
+    SQLITE["READ_DATABASE"] = "read"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -123,10 +163,112 @@ STATIC_URL = "static/"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "cookbook.authentication.CachedJWTAuthentication",
+    ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "cookbook.metrics.TimedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
     ],
 }
 
+# Users of authenticated requests are cached in process (see cookbook/authentication.py)
+
+JWT_USER_CACHE = {
+    "TTL": config("JWT_USER_CACHE_TTL", default=60, cast=int),
+    "MAX_SIZE": 10000,
+}
+
+# Ingredient autocomplete (see cookbook/autocomplete.py)
+
+INGREDIENT_AUTOCOMPLETE = {
+    # Seconds before the in-process index is rebuilt from the database.
+    "MAX_AGE": config("INGREDIENT_AUTOCOMPLETE_MAX_AGE", default=300, cast=int),
+}
+
+# Ingredient id and name cache (see cookbook/ingredients.py)
+
+INGREDIENT_CACHE = {
+    # Seconds an ingredient is served from memory before being looked up again.
+    "TTL": config("INGREDIENT_CACHE_TTL", default=300, cast=int),
+    # Entries kept, two per ingredient (its id and its name).
+    "MAX_SIZE": 20000,
+}
+
+# Top rated recipes (see bayesian_rating in cookbook/models.py). The scores are
+# stored: run manage.py rebuild_rating_aggregates after changing these.
+
+TOP_RECIPES = {
+    # Ratings a recipe needs to be ranked, and the weight of the prior.
+    "MIN_RATINGS": config("TOP_RECIPES_MIN_RATINGS", default=5, cast=int),
+    # Rate the scores are pulled toward, about the catalog's mean.
+    "PRIOR_MEAN": config("TOP_RECIPES_PRIOR_MEAN", default=3.0, cast=float),
+}
+
+# Request metrics, Server-Timing headers and the /metrics endpoint
+
+METRICS = {
+    "ENABLED": config("METRICS_ENABLED", default=True, cast=bool),
+    "SERVER_TIMING": config("METRICS_SERVER_TIMING", default=True, cast=bool),
+    # Bearer token required by /metrics, closed to everyone when empty.
+    "TOKEN": config("METRICS_TOKEN", default=""),
+    # Log requests slower than this many seconds with their SQL, off when empty.
+    "SLOW_REQUEST_THRESHOLD": config(
+        "METRICS_SLOW_REQUEST_THRESHOLD",
+        default="",
+        cast=lambda value: float(value) if value else None,
+    ),
+}
+
+# Caches
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Use django.core.cache.backends.filebased.FileBasedCache, with a directory as
+    # location, to share cached responses between worker processes.
+    "responses": {
+        "BACKEND": config(
+            "RESPONSE_CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": config("RESPONSE_CACHE_LOCATION", default="responses"),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Cached list responses (see cookbook/response_cache.py)
+
+RESPONSE_CACHE = {
+    "ENABLED": config("RESPONSE_CACHE_ENABLED", default=True, cast=bool),
+    "CACHE": "responses",
+    "TIMEOUT": 5 * 60,
+    # How long concurrent misses wait for the request rendering the response.
+    "LOCK_TIMEOUT": 5,
+}
+
+# Email verification on registration (see cookbook/email_verification.py)
+
+EMAIL_VERIFICATION = {
+    "BACKEND": config(
+        "EMAIL_VERIFICATION_BACKEND",
+        default="cookbook.email_verification.HunterBackend",
+    ),
+    "OPTIONS": {
+        "api_key": config("HUNTER_API_KEY", default=""),
+        "base_url": config("HUNTER_API_URL", default="https://api.hunter.io/v2"),
+        "connect_timeout": config("HUNTER_CONNECT_TIMEOUT", default=1.0, cast=float),
+        "read_timeout": config("HUNTER_READ_TIMEOUT", default=3.0, cast=float),
+    },
+    "CACHE": "default",
+    "CACHE_TTL": 24 * 60 * 60,
+    "FAILURE_THRESHOLD": 5,
+    "RECOVERY_TIMEOUT": 30,
+    # Accept registrations when the verifier is unavailable instead of rejecting them.
+    "FAIL_OPEN": config("EMAIL_VERIFICATION_FAIL_OPEN", default=True, cast=bool),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 